@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""
+Client-side access to the services of the display_manager_server node.
+
+Keeps a small pool of persistent connections per service (so that a query
+does not pay for a master lookup and a TCP handshake every time), re-opens
+them transparently if the server restarts, and optionally caches the results
+of read-only queries until the display is changed (through this client, or by
+any node: the server publishes every change on display_state_changes). The
+results of the queries of a location only depend on the cell of the grid it
+falls in, so they are cached per cell rather than per location.
+
+The methods mirror those of ShapeDisplayManager so that a client can be used
+wherever a local display manager would be.
+"""
+
+import threading
+
+import rospy
+from geometry_msgs.msg import Point
+from letter_learning_interaction.msg import DisplayStateChange
+from letter_learning_interaction.shape_display_manager import gridCoordinates
+from letter_learning_interaction.srv import *
+
+class ServiceClientPool:
+    """Pool of persistent ServiceProxy connections to a single service.
+
+    A connection which fails is closed, so that the next call opens a new one.
+    Only the calls of idempotent services (the queries, and clearing the
+    display) are retried at once: a failed call to add a shape may still have
+    been carried out by the server.
+    """
+    def __init__(self, serviceName, serviceClass, maxConnections=2, idempotent=False):
+        self.serviceName = serviceName
+        self.serviceClass = serviceClass
+        self.maxConnections = maxConnections
+        self.idempotent = idempotent
+
+        self._idle = []
+        self._numConnections = 0
+        self._available = threading.Condition(threading.Lock())
+
+    def _acquire(self):
+        with self._available:
+            while not self._idle and self._numConnections >= self.maxConnections:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._numConnections += 1
+        try:
+            return rospy.ServiceProxy(self.serviceName, self.serviceClass, persistent=True)
+        except:
+            with self._available:
+                self._numConnections -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, proxy, broken=False):
+        with self._available:
+            if broken:
+                proxy.close()
+                self._numConnections -= 1
+            else:
+                self._idle.append(proxy)
+            self._available.notify()
+
+    def call(self, *args, **kwargs):
+        """Call the service. If the service is idempotent, the call is retried
+        once on a new connection if it fails (e.g. because the server was
+        restarted).
+        """
+        attempts = 2 if self.idempotent else 1
+        for attempt in range(attempts):
+            proxy = self._acquire()
+            try:
+                response = proxy(*args, **kwargs)
+            except rospy.ServiceException:
+                self._release(proxy, broken=True)
+                if attempt == attempts - 1:
+                    raise
+                rospy.logwarn('Lost connection to \'' + self.serviceName + '\' service, reconnecting')
+            else:
+                self._release(proxy)
+                return response
+
+    def close(self):
+        with self._available:
+            for proxy in self._idle:
+                proxy.close()
+            self._numConnections -= len(self._idle)
+            self._idle = []
+
+class DisplayManagerClient:
+    """Gives access to a remote ShapeDisplayManager through the services of
+    the display_manager_server node.
+    """
+    def __init__(self, useCache=False, maxCacheEntries=256, maxConnections=2):
+        self.useCache = useCache
+        self.maxCacheEntries = maxCacheEntries
+
+        self._services = {}
+        for serviceName, serviceClass, idempotent in [('clear_all_shapes', clearAllShapes, True),
+                                                      ('display_new_shape', displayNewShape, False),
+                                                      ('possible_to_display_shape', isPossibleToDisplayNewShape, True),
+                                                      ('index_of_location', indexOfLocation, True),
+                                                      ('shape_at_location', shapeAtLocation, True),
+                                                      ('closest_shapes_to_location', closestShapesToLocation, True),
+                                                      ('display_shape_at_location', displayShapeAtLocation, False),
+                                                      ('indexes_of_locations', indexesOfLocations, True),
+                                                      ('shapes_at_locations', shapesAtLocations, True),
+                                                      ('closest_shapes_to_locations', closestShapesToLocations, True),
+                                                      ('display_shapes_at_locations', displayShapesAtLocations, False)]:
+            self._services[serviceName] = ServiceClientPool(serviceName, serviceClass, maxConnections, idempotent)
+
+        self._cache = {}
+        self._cacheVersion = 0 #incremented whenever the cache is invalidated
+        self._cacheLock = threading.Lock()
+        if self.useCache:
+            #the display may be changed by other nodes
+            self._changesSubscriber = rospy.Subscriber('display_state_changes', DisplayStateChange, self.onDisplayStateChange)
+
+    def waitForServices(self, timeout=None):
+        for serviceName in self._services:
+            rospy.wait_for_service(serviceName, timeout)
+
+    def close(self):
+        if self.useCache:
+            self._changesSubscriber.unregister()
+        for pool in self._services.values():
+            pool.close()
+
+    # ------------------------------------------------------------------ CACHE
+    def invalidateCache(self):
+        """Forget all cached query results (e.g. when another node is known to
+        have changed the display).
+        """
+        with self._cacheLock:
+            self._cache = {}
+            self._cacheVersion += 1
+
+    def onDisplayStateChange(self, change):
+        self.invalidateCache()
+
+    def _cachedQuery(self, key, query):
+        if not self.useCache:
+            return query()
+
+        with self._cacheLock:
+            if key in self._cache:
+                return self._cache[key]
+            version = self._cacheVersion
+        result = query()
+        with self._cacheLock:
+            if self._cacheVersion != version: #the display changed during the query: the result may be stale
+                return result
+            if len(self._cache) >= self.maxCacheEntries:
+                self._cache = {}
+            self._cache[key] = result
+        return result
+
+    # ---------------------------------------------------------------- WRITES
+    def clearAllShapes(self):
+        self.invalidateCache()
+        response = self._services['clear_all_shapes'].call()
+        return response.success.data
+
+    def displayNewShape(self, shapeType_code):
+        self.invalidateCache()
+        response = self._services['display_new_shape'].call(shape_type_code=shapeType_code)
+        return [response.location.x, response.location.y]
+
+    def displayShapeAtLocation(self, shapeType_code, location):
+        self.invalidateCache()
+        request = displayShapeAtLocationRequest()
+        request.shape_type_code = shapeType_code
+        request.location.x = location[0]
+        request.location.y = location[1]
+        response = self._services['display_shape_at_location'].call(request)
+        return response.success.data
+
+    # ----------------------------------------------------------------- READS
+    def isPossibleToDisplayNewShape(self, shapeType_code):
+        def query():
+            response = self._services['possible_to_display_shape'].call(shape_type_code=shapeType_code)
+            return response.is_possible.data
+        return self._cachedQuery(('possible_to_display_shape', shapeType_code), query)
+
+    def indexOfLocation(self, location):
+        def query():
+            request = indexOfLocationRequest()
+            request.location.x = location[0]
+            request.location.y = location[1]
+            response = self._services['index_of_location'].call(request)
+            return response.row, response.column
+        return self._cachedQuery(('index_of_location',) + gridCoordinates(location), query)
+
+    def shapeAtLocation(self, location):
+        def query():
+            request = shapeAtLocationRequest()
+            request.location.x = location[0]
+            request.location.y = location[1]
+            response = self._services['shape_at_location'].call(request)
+            return response.shape_type_code, response.shape_id
+        return self._cachedQuery(('shape_at_location',) + gridCoordinates(location), query)
+
+    def closestShapesToLocation(self, location):
+        def query():
+            request = closestShapesToLocationRequest()
+            request.location.x = location[0]
+            request.location.y = location[1]
+            response = self._services['closest_shapes_to_location'].call(request)
+            return list(response.shape_type_code), list(response.shape_id)
+        return self._cachedQuery(('closest_shapes_to_location',) + gridCoordinates(location), query)
+
+    # --------------------------------------------------------- BATCH QUERIES
+    # One service call for many locations (lists of [x, y]). Batch results
+    # are never cached.
+    def _pointsOfLocations(self, locations):
+        return [Point(x=location[0], y=location[1]) for location in locations]
+
+    def indexesOfLocations(self, locations):
+        response = self._services['indexes_of_locations'].call(locations=self._pointsOfLocations(locations))
+        return list(response.row), list(response.column)
+
+    def shapesAtLocations(self, locations):
+        response = self._services['shapes_at_locations'].call(locations=self._pointsOfLocations(locations))
+        return list(response.shape_type_code), list(response.shape_id)
+
+    def closestShapesToLocations(self, locations):
+        response = self._services['closest_shapes_to_locations'].call(locations=self._pointsOfLocations(locations))
+        shapeType_codes = []
+        shapeIDs = []
+        start = 0
+        for numShapes in response.num_shapes:
+            shapeType_codes.append(list(response.shape_type_code[start:start+numShapes]))
+            shapeIDs.append(list(response.shape_id[start:start+numShapes]))
+            start += numShapes
+        return shapeType_codes, shapeIDs
+
+    def displayShapesAtLocations(self, shapeType_codes, locations):
+        self.invalidateCache()
+        response = self._services['display_shapes_at_locations'].call(shape_type_code=shapeType_codes,
+                                                                      locations=self._pointsOfLocations(locations))
+        return list(response.success)
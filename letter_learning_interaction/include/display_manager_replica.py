@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Local, read-only replica of the ShapeDisplayManager of the
+display_manager_server node.
+
+The server publishes its state as a latched snapshot ('display_state') and as
+versioned changes ('display_state_changes'). The replica applies the changes
+in order to a local ShapeDisplayManager, so that read-only queries are
+answered in-process without a service call. Writes are forwarded to the
+server through a DisplayManagerClient.
+
+The version of the state restarts with the server, so it is compared within
+an epoch (the server's start time) only: a snapshot of another epoch is always
+applied, and a change of another epoch is handled as a missed change.
+
+If a change has been missed, the replica subscribes again to the latched
+snapshot to catch up; until it has, and until the first snapshot is received,
+queries are forwarded to the server too (or raise a RuntimeError without a
+client).
+"""
+
+import threading
+
+import rospy
+from letter_learning_interaction.msg import DisplayState, DisplayStateChange
+from letter_learning_interaction.shape_display_manager import ShapeDisplayManager
+
+class DisplayManagerReplica:
+    """Answers shapeAtLocation, closestShapesToLocation and
+    isPossibleToDisplayNewShape from a local copy of the display state.
+    """
+    def __init__(self, client=None, stateTopic='display_state', changesTopic='display_state_changes'):
+        """
+        :param client: a DisplayManagerClient to forward writes to (writes
+        raise a RuntimeError if it is None)
+        """
+        self.client = client
+        self.stateTopic = stateTopic
+
+        self.displayManager = None
+        self.epoch = None
+        self.version = None
+        self._lock = threading.Lock()
+        self._synchronised = threading.Event()
+
+        self.stateSubscriber = rospy.Subscriber(self.stateTopic, DisplayState, self.onState)
+        self.changesSubscriber = rospy.Subscriber(changesTopic, DisplayStateChange, self.onStateChange)
+
+    # ------------------------------------------------------ SYNCHRONISATION
+    def onState(self, state):
+        with self._lock:
+            if (self.version is not None and state.epoch == self.epoch and state.version <= self.version
+                    and self.displayManager is not None):
+                return #already up to date
+
+            if (self.displayManager is None
+                    or [self.displayManager.numRows, self.displayManager.numCols, len(self.displayManager.positionLists)]
+                       != [state.num_rows, state.num_cols, state.num_shape_types]):
+                self.displayManager = ShapeDisplayManager(state.num_rows, state.num_cols, numShapeTypes=state.num_shape_types)
+            else:
+                self.displayManager.clearAllShapes()
+
+            self._setCells(range(len(state.shape_id)), state.shape_type_code, state.shape_id)
+            self.epoch = state.epoch
+            self.version = state.version
+        self._synchronised.set()
+
+    def onStateChange(self, change):
+        with self._lock:
+            if self.version is None:
+                return #not synchronised yet
+            if change.epoch == self.epoch and change.version <= self.version:
+                return #already applied
+            missed = change.epoch != self.epoch or change.version != self.version + 1 #or the server restarted
+            if missed:
+                self.version = None
+                self._synchronised.clear()
+            else:
+                if change.cleared:
+                    self.displayManager.clearAllShapes()
+                self._setCells(change.cells, change.shape_type_code, change.shape_id)
+                self.version = change.version
+        if missed:
+            rospy.logwarn('Missed display state changes (or the server restarted), requesting a snapshot')
+            self.requestState()
+
+    def requestState(self):
+        """Subscribes again to the (latched) snapshot of the state, so that
+        the last one is received again.
+        """
+        self.stateSubscriber.unregister()
+        self.stateSubscriber = rospy.Subscriber(self.stateTopic, DisplayState, self.onState)
+
+    def _setCells(self, cells, shapeType_codes, shapeIDs):
+        for cell, shapeType_code, shapeID in zip(cells, shapeType_codes, shapeIDs):
+            if shapeID >= 0:
+                row, col = divmod(cell, self.displayManager.numCols)
+                self.displayManager.setShapeAtCell(row, col, shapeType_code, shapeID)
+        self.displayManager.takeChanges()
+
+    def isSynchronised(self):
+        return self._synchronised.is_set()
+
+    def waitForState(self, timeout=None):
+        """Blocks until the state of the server has been received. Returns
+        False if it hasn't been within timeout seconds.
+        """
+        return self._synchronised.wait(timeout)
+
+    # ----------------------------------------------------------------- READS
+    def _query(self, method, *args):
+        with self._lock:
+            if self._synchronised.is_set():
+                return getattr(self.displayManager, method)(*args)
+        if self.client is None:
+            raise RuntimeError("the state of the display has not been received yet")
+        return getattr(self.client, method)(*args) #out of date: ask the server
+
+    def indexOfLocation(self, location):
+        return self._query('indexOfLocation', location)
+
+    def shapeAtLocation(self, location):
+        return self._query('shapeAtLocation', location)
+
+    def closestShapesToLocation(self, location):
+        return self._query('closestShapesToLocation', location)
+
+    def isPossibleToDisplayNewShape(self, shapeType_code):
+        return self._query('isPossibleToDisplayNewShape', shapeType_code)
+
+    def shapesAtLocations(self, locations):
+        return self._query('shapesAtLocations', locations)
+
+    def closestShapesToLocations(self, locations):
+        return self._query('closestShapesToLocations', locations)
+
+    # ---------------------------------------------------------------- WRITES
+    def _write(self, method, *args):
+        if self.client is None:
+            raise RuntimeError("this display manager replica is read-only")
+        return getattr(self.client, method)(*args)
+
+    def clearAllShapes(self):
+        return self._write('clearAllShapes')
+
+    def displayNewShape(self, shapeType_code):
+        return self._write('displayNewShape', shapeType_code)
+
+    def displayShapeAtLocation(self, shapeType_code, location):
+        return self._write('displayShapeAtLocation', shapeType_code, location)
+
+    def displayShapesAtLocations(self, shapeType_codes, locations):
+        return self._write('displayShapesAtLocations', shapeType_codes, locations)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""
+Append-only journal of the inputs of the interaction, to reproduce a session
+without its bags (see scripts/replayJournal.py).
+
+learning_words_nao.py records each message it receives on its input topics
+(words, demonstrations, gestures, test and stop cards, new child, clear
+requests, and the robot or tablet having finished writing), with the time it
+was received, before handling it.
+
+A journal is a binary file: a header (magic, version, and the metadata of the
+first session as JSON, e.g. the node's parameters) followed by records of:
+
+- kind (uint8), time (float64 seconds), length of the payload (uint32)
+- the payload, the message encoded as per its kind: the data of Strings,
+  nothing for Empty messages, and the fields of Shape and PointStamped
+  messages (little-endian, paths and parameters as float32)
+
+A journal reopened by a later session (e.g. the node relaunched with the same
+file) is appended a SESSION record, whose payload is the metadata of the new
+session as JSON: readJournal splits the sessions on these records.
+
+Each record is flushed once written, and a record truncated by a crash is
+ignored when reading.
+"""
+
+import json
+import os
+import struct
+import threading
+
+from std_msgs.msg import String, Empty
+from geometry_msgs.msg import PointStamped
+from letter_learning_interaction.msg import Shape as ShapeMsg
+
+MAGIC = b'LLIJ'
+VERSION = 2 #1: without SESSION records
+
+#kinds of input (4 is not used)
+WORD, DEMONSTRATION, GESTURE, TEST, STOP, SHAPE_FINISHED, NEW_CHILD, CLEAR = 1, 2, 3, 5, 6, 7, 8, 9
+KIND_NAMES = {WORD: 'word', DEMONSTRATION: 'demonstration', GESTURE: 'gesture',
+              TEST: 'test', STOP: 'stop', SHAPE_FINISHED: 'shape_finished', NEW_CHILD: 'new_child', CLEAR: 'clear'}
+#start of a later session (not an input)
+SESSION = 0
+
+_HEADER = struct.Struct('<4sHI') #magic, version, length of the metadata
+_RECORD = struct.Struct('<BdI') #kind, time, length of the payload
+_SHAPE = struct.Struct('<IIIII') #shapeID, shapeType_code, number of path values, of paramValues, of paramsToVary
+_POINT = struct.Struct('<ddddI') #stamp, x, y, z, length of frame_id
+
+def _text(data):
+    """:returns: the utf-8 data as a str (bytes in python 2, as rospy gives)"""
+    return data if str is bytes else data.decode('utf-8')
+
+def _encodeString(value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return struct.pack('<H', len(value)) + value
+
+def _decodeString(payload, offset):
+    length, = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    return _text(payload[offset:offset + length]), offset + length
+
+def _encodeShape(shape):
+    path, paramValues, paramsToVary = list(shape.path), list(shape.paramValues), list(bytearray(shape.paramsToVary))
+    return b''.join([_SHAPE.pack(shape.shapeID, shape.shapeType_code, len(path), len(paramValues), len(paramsToVary)),
+                     struct.pack('<%df' % len(path), *path),
+                     struct.pack('<%df' % len(paramValues), *paramValues),
+                     struct.pack('<%dB' % len(paramsToVary), *paramsToVary),
+                     _encodeString(shape.shapeType), _encodeString(shape.device), _encodeString(shape.trace_id)])
+
+def _decodeShape(payload):
+    shapeID, shapeType_code, numPath, numParamValues, numParamsToVary = _SHAPE.unpack_from(payload, 0)
+    offset = _SHAPE.size
+    path = list(struct.unpack_from('<%df' % numPath, payload, offset))
+    offset += 4*numPath
+    paramValues = list(struct.unpack_from('<%df' % numParamValues, payload, offset))
+    offset += 4*numParamValues
+    paramsToVary = list(struct.unpack_from('<%dB' % numParamsToVary, payload, offset))
+    offset += numParamsToVary
+    shapeType, offset = _decodeString(payload, offset)
+    device, offset = _decodeString(payload, offset)
+    traceId, offset = _decodeString(payload, offset)
+    return ShapeMsg(path=path, shapeID=shapeID, shapeType=shapeType, shapeType_code=shapeType_code,
+                    paramsToVary=paramsToVary, paramValues=paramValues, device=device, trace_id=traceId)
+
+def _encodePoint(message):
+    frameId = message.header.frame_id
+    if not isinstance(frameId, bytes):
+        frameId = frameId.encode('utf-8')
+    return _POINT.pack(message.header.stamp.to_sec(), message.point.x, message.point.y, message.point.z, len(frameId)) + frameId
+
+def _decodePoint(payload):
+    import rospy
+    stamp, x, y, z, length = _POINT.unpack_from(payload, 0)
+    message = PointStamped()
+    message.header.stamp = rospy.Time.from_sec(stamp)
+    message.header.frame_id = _text(payload[_POINT.size:_POINT.size + length])
+    message.point.x, message.point.y, message.point.z = x, y, z
+    return message
+
+def _encodeData(message):
+    data = message.data
+    return data if isinstance(data, bytes) else data.encode('utf-8')
+
+def _decodeData(payload):
+    return String(data=_text(payload))
+
+def _encodeNothing(message):
+    return b''
+
+def _decodeNothing(payload):
+    return Empty()
+
+#kind -> (encoder, decoder)
+_CODECS = {WORD: (_encodeData, _decodeData),
+           DEMONSTRATION: (_encodeShape, _decodeShape),
+           GESTURE: (_encodePoint, _decodePoint),
+           TEST: (_encodeNothing, _decodeNothing),
+           STOP: (_encodeNothing, _decodeNothing),
+           SHAPE_FINISHED: (_encodeData, _decodeData),
+           NEW_CHILD: (_encodeData, _decodeData),
+           CLEAR: (_encodeNothing, _decodeNothing)}
+
+class InputJournal:
+    """Appends the inputs received to a journal file (thread-safe)."""
+    def __init__(self, path, metadata=None, time=0.0):
+        """
+        :param metadata: what to record of the session (a dict, serializable
+        to JSON): in the header of the journal if it is a new one, in a
+        SESSION record at the given time otherwise
+        """
+        self.path = path
+        self.numRecords = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._file = open(path, 'ab')
+        metadata = json.dumps(metadata or {}, sort_keys=True).encode('utf-8')
+        if self._file.tell() == 0:
+            self._file.write(_HEADER.pack(MAGIC, VERSION, len(metadata)) + metadata)
+        else:
+            with open(path, 'rb') as f:
+                header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != MAGIC:
+                self._file.close()
+                raise ValueError('%s is not an input journal' % path)
+            self._file.write(_RECORD.pack(SESSION, time, len(metadata)) + metadata)
+        self._file.flush()
+
+    def record(self, kind, time, message):
+        payload = _CODECS[kind][0](message)
+        with self._lock:
+            if self._file is None: #closed
+                return
+            self._file.write(_RECORD.pack(kind, time, len(payload)) + payload)
+            self._file.flush()
+            self.numRecords += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def readJournal(path):
+    """Reads a journal written by InputJournal.
+
+    :returns: its sessions, in the order they were recorded, each as its
+    metadata (a dict) and a list of its inputs as (kind, time, message), in
+    the order they were received
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    if len(content) < _HEADER.size:
+        raise ValueError('%s is not an input journal' % path)
+    magic, version, length = _HEADER.unpack_from(content, 0)
+    if magic != MAGIC:
+        raise ValueError('%s is not an input journal' % path)
+    if version > VERSION:
+        raise ValueError('%s is an input journal of a later version (%d)' % (path, version))
+    offset = _HEADER.size
+    sessions = [(json.loads(content[offset:offset + length].decode('utf-8')), [])]
+    offset += length
+
+    while offset + _RECORD.size <= len(content):
+        kind, time, length = _RECORD.unpack_from(content, offset)
+        offset += _RECORD.size
+        if offset + length > len(content): #truncated
+            break
+        payload = content[offset:offset + length]
+        if kind == SESSION:
+            sessions.append((json.loads(payload.decode('utf-8')), []))
+        else:
+            sessions[-1][1].append((kind, time, _CODECS[kind][1](payload)))
+        offset += length
+    return sessions
@@ -9,8 +9,6 @@ import os.path
 
 import numpy
 
-from shape_learning.shape_learner import SettingsStruct
-
 class LearningModes(Enum):
         startsGood = 0
         startsBad = 1
@@ -92,6 +90,8 @@ class InteractionSettings():
     ###---------------------------------------------- WORD LEARNING SETTINGS
     @staticmethod
     def generateSettings(shapeType):
+        from shape_learning.shape_learner import SettingsStruct #slow to import: only needed by the learners
+
         if(datasetDirectory is None):
             raise RuntimeError("Dataset directory has not been set yet with setDatasetDirectory()")
 
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""
+Letter datasets, as loaded by InteractionSettings.generateSettings (one
+'<letter>.dat' file per letter, plus a 'params.dat' file, in the dataset
+directory), built from recorded demonstrations.
+
+Shapes are in the format of the shape modelers: the x coordinates of their
+NUMPOINTS_SHAPEMODELER points, then their y coordinates. The functions here
+work on many shapes at once, given as the flat points array and offsets of a
+stroke archive.
+"""
+
+import numpy
+
+NUMPOINTS_SHAPEMODELER = 70 #as in learning_words_nao.py
+
+def resampleShapes(points, starts, ends, numPoints=NUMPOINTS_SHAPEMODELER):
+    """Resamples shapes to numPoints points evenly spread along their points
+    (linear interpolation, as for a shape's index of points).
+
+    :param points: Nx2 array of the points of all the shapes
+    :param starts, ends: index in points of the first point, and after the
+    last point, of each shape (shapes need at least one point)
+    :returns: (numShapes x 2*numPoints) array of the shapes (x0, x1, ..., y0, y1, ...)
+    """
+    starts = numpy.asarray(starts, dtype=numpy.int64)
+    lengths = numpy.asarray(ends, dtype=numpy.int64) - starts
+
+    #position of each desired point along the points of its shape
+    position = numpy.linspace(0, 1, numPoints)[numpy.newaxis, :] * (lengths[:, numpy.newaxis] - 1)
+    before = numpy.floor(position).astype(numpy.int64)
+    after = numpy.minimum(before + 1, lengths[:, numpy.newaxis] - 1)
+    weight = (position - before)[:, :, numpy.newaxis]
+
+    points = numpy.asarray(points, dtype=numpy.float64)
+    resampled = (1 - weight)*points[starts[:, numpy.newaxis] + before] + weight*points[starts[:, numpy.newaxis] + after]
+    return numpy.concatenate([resampled[:, :, 0], resampled[:, :, 1]], axis=1)
+
+def normaliseShapeHeights(shapes):
+    """Centres the bounding box of each shape on the origin and scales it to a
+    height of 1, as ShapeModeler.normaliseShapeHeight does for one shape.
+    Shapes with no height are only centred.
+    """
+    numPoints = shapes.shape[1]//2
+    x = shapes[:, :numPoints]
+    y = shapes[:, numPoints:]
+    xMin, xMax = x.min(axis=1)[:, numpy.newaxis], x.max(axis=1)[:, numpy.newaxis]
+    yMin, yMax = y.min(axis=1)[:, numpy.newaxis], y.max(axis=1)[:, numpy.newaxis]
+    height = yMax - yMin
+    height[height == 0] = 1
+    x = (x - (xMin + xMax)/2)/height
+    y = (y - (yMin + yMax)/2)/height
+    return numpy.concatenate([x, y], axis=1)
+
+def writeDataset(path, shapes):
+    """Writes shapes (one per row) to a '<letter>.dat' dataset file."""
+    numPoints = shapes.shape[1]//2
+    with open(path, 'w') as f:
+        f.write('nbSamples\n%d\n' % len(shapes))
+        f.write('nbPoints\n%d\n' % numPoints)
+        f.write('data\n')
+        for shape in shapes:
+            f.write(' '.join(repr(float(value)) for value in shape) + '\n')
+
+def writeParams(path, initialParamValues):
+    """Writes the 'params.dat' file of a dataset directory.
+
+    :param initialParamValues: dict of letter -> initial value of the
+    parameter to vary
+    """
+    with open(path, 'w') as f:
+        for letter in sorted(initialParamValues.keys()):
+            f.write('[%s]\n%s\n' % (letter, repr(float(initialParamValues[letter]))))
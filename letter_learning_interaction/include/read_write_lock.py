@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""
+Readers-writer lock, for state which is read much more often than it is
+written and is accessed from several threads (e.g. by the handlers of ROS
+services, which rospy runs in a thread per request).
+"""
+
+import threading
+from contextlib import contextmanager
+
+class ReadWriteLock:
+    """Lock which can be held by any number of readers at once, or by a single
+    writer.
+
+    Waiting writers are given priority over new readers so that they cannot be
+    starved. The lock is re-entrant: a thread holding it (for reading or for
+    writing) may acquire it again for reading, and the writer may acquire it
+    again for writing.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._numReaders = 0
+        self._numWaitingWriters = 0
+        self._writer = None
+        self._writerDepth = 0
+        self._local = threading.local()
+
+    def _readDepth(self):
+        return getattr(self._local, 'readDepth', 0)
+
+    def acquireRead(self):
+        if self._writer is threading.current_thread() or self._readDepth() > 0:
+            self._local.readDepth = self._readDepth() + 1
+            return
+
+        with self._condition:
+            while self._writer is not None or self._numWaitingWriters > 0:
+                self._condition.wait()
+            self._numReaders += 1
+        self._local.readDepth = 1
+
+    def releaseRead(self):
+        self._local.readDepth = self._readDepth() - 1
+        if self._local.readDepth > 0 or self._writer is threading.current_thread():
+            return
+
+        with self._condition:
+            self._numReaders -= 1
+            if self._numReaders == 0:
+                self._condition.notify_all()
+
+    def acquireWrite(self):
+        me = threading.current_thread()
+        if self._writer is me:
+            self._writerDepth += 1
+            return
+        if self._readDepth() > 0:
+            raise RuntimeError("cannot upgrade a read lock to a write lock")
+
+        with self._condition:
+            self._numWaitingWriters += 1
+            while self._writer is not None or self._numReaders > 0:
+                self._condition.wait()
+            self._numWaitingWriters -= 1
+            self._writer = me
+            self._writerDepth = 1
+
+    def releaseWrite(self):
+        with self._condition:
+            self._writerDepth -= 1
+            if self._writerDepth == 0:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquireRead()
+        try:
+            yield
+        finally:
+            self.releaseRead()
+
+    @contextmanager
+    def writing(self):
+        self.acquireWrite()
+        try:
+            yield
+        finally:
+            self.releaseWrite()
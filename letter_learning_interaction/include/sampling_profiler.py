@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""
+Sampling profiler which can be started and stopped in a running node.
+
+While running, a thread samples the stacks of all the other threads of the
+process (e.g. the state machine's and rospy's callback threads) at a given
+rate, and counts each distinct stack. The counts are written as collapsed
+stacks ('thread;outermost frame;...;innermost frame count' lines), as read by
+flamegraph.pl or speedscope. When stopped, the profiler has no thread and
+costs nothing.
+
+profileNode() gives a node a ~set_profiling service (see setProfiling.srv)
+to start and stop it, e.g.:
+
+    rosservice call /learning_words_nao/set_profiling true 200 ''
+    rosservice call /learning_words_nao/set_profiling false 0 ''
+"""
+
+import os
+import sys
+import threading
+import time
+
+DEFAULT_RATE = 100.0 #samples per second
+
+def frameLabel(frame):
+    code = frame.f_code
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+class SamplingProfiler:
+    """Samples the stacks of all the threads of the process."""
+    def __init__(self):
+        self.counts = {} #collapsed stack -> number of samples
+        self.numSamples = 0
+        self.rate = None
+        self.startTime = None
+        self.stopTime = None
+
+        self._thread = None
+        self._stopRequested = threading.Event()
+        self._lock = threading.Lock()
+
+    def isRunning(self):
+        return self._thread is not None
+
+    def start(self, rate=DEFAULT_RATE):
+        """Starts sampling (forgetting the previous samples)."""
+        with self._lock:
+            if self._thread is not None:
+                raise RuntimeError('profiler already running')
+            self.counts = {}
+            self.numSamples = 0
+            self.rate = rate
+            self.startTime = time.time()
+            self.stopTime = None
+            self._stopRequested.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling_profiler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stops sampling (the samples are kept until the next start)."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stopRequested.set()
+            thread, self._thread = self._thread, None
+        thread.join()
+        self.stopTime = time.time()
+
+    def _run(self):
+        period = 1.0/self.rate
+        ownId = threading.current_thread().ident
+        nextSample = time.time()
+        while not self._stopRequested.is_set():
+            self.sample(ownId)
+            nextSample += period
+            delay = nextSample - time.time()
+            if delay > 0:
+                self._stopRequested.wait(delay)
+            else:
+                nextSample = time.time() #fell behind: don't try to catch up
+
+    def sample(self, ignoredThread=None):
+        """Records the current stack of each thread."""
+        names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+        for threadId, frame in sys._current_frames().items():
+            if threadId == ignoredThread:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frameLabel(frame))
+                frame = frame.f_back
+            stack.append(names.get(threadId, 'thread %d' % threadId))
+            stack.reverse()
+            key = ';'.join(stack)
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.numSamples += 1
+
+    def write(self, path):
+        """Writes the samples as collapsed stacks.
+
+        :returns: the number of distinct stacks written
+        """
+        counts = dict(self.counts)
+        with open(path, 'w') as f:
+            for stack in sorted(counts):
+                f.write('%s %d\n' % (stack, counts[stack]))
+        return len(counts)
+
+def profileNode(nodeName):
+    """Gives the node a ~set_profiling service starting and stopping a
+    SamplingProfiler. The stacks are written, when stopping, to the file of
+    the request or else to '<~profiling_directory>/<node>_<start time>.folded'
+    (~profiling_directory defaults to ~/.ros).
+
+    :returns: the profiler
+    """
+    import rospy
+    from letter_learning_interaction.srv import setProfiling, setProfilingResponse
+    profiler = SamplingProfiler()
+    directory = os.path.expanduser(rospy.get_param('~profiling_directory', '~/.ros'))
+
+    def handle(request):
+        try:
+            if request.enable:
+                profiler.start(request.rate if request.rate > 0 else DEFAULT_RATE)
+                rospy.loginfo('Started profiling at %.0f samples per second', profiler.rate)
+                return setProfilingResponse(True, 'profiling at %.0f samples per second' % profiler.rate)
+
+            if not profiler.isRunning():
+                return setProfilingResponse(False, 'profiler not running')
+            profiler.stop()
+            output = request.output or os.path.join(directory, '%s_%s.folded' % (nodeName, time.strftime('%Y%m%d-%H%M%S', time.localtime(profiler.startTime))))
+            profiler.write(output)
+            rospy.loginfo('Wrote %d samples (%.1f s) of profile to %s', profiler.numSamples, profiler.stopTime - profiler.startTime, output)
+            return setProfilingResponse(True, output)
+        except (RuntimeError, IOError, OSError) as e:
+            return setProfilingResponse(False, str(e))
+
+    profiler.service = rospy.Service('~set_profiling', setProfiling, handle)
+    return profiler
@@ -5,8 +5,13 @@ Manages the positioning of shapes. Assigns new shapes to their
 appropriate location, and can convert the location of an event into the
 shape which it was done around. 
 """
+import bisect
+import functools
+
 import numpy
 
+from letter_learning_interaction.read_write_lock import ReadWriteLock
+
 shapeWidth = 0.04;
 shapeHeight = 0.0465;
 shapeSize = numpy.array([shapeWidth,shapeHeight]);
@@ -17,74 +22,177 @@ positionList_shape1 = [[1,2],[0,2],[2,2],[1,1],[1,3],[0,1],[0,3],[2,1],[2,3],[1,
 positionList_shape2 = [[1,3],[0,4],[2,4],[1,4],[1,2],[0,3],[2,3],[0,2],[2,2],[0,1],[2,1],[1,1],[1,0],[0,0],[2,0]];
 positionList = [positionList_shape0, positionList_shape1, positionList_shape2];
 
+def gridCoordinates(location):
+    """Column, and row counted from the bottom, of the cell of the grid which
+    a location falls in (whatever the dimensions of the grid).
+    """
+    location_cell = (numpy.array(location) - shapeSize/2)/shapeSize;
+    return int(round(location_cell[0])), int(round(location_cell[1]));
+
+def defaultPositionList(numRows, numCols, numShapeTypes, shapeType_code):
+    """Preferred cells for a shape type on a generic grid: the types share the
+    columns of the grid, and each type prefers the cells closest to the middle
+    of its share (middle row first).
+    """
+    homeCol = (shapeType_code+0.5)*numCols/float(numShapeTypes) - 0.5;
+    homeRow = (numRows-1)/2.0;
+    cells = [[row,col] for col in range(numCols) for row in range(numRows)];
+    return sorted(cells, key=lambda cell: (abs(cell[1]-homeCol), abs(cell[0]-homeRow), cell[1], cell[0]));
+
+def reading(method):
+    @functools.wraps(method)
+    def readLocked(self, *args, **kwargs):
+        with self.lock.reading():
+            return method(self, *args, **kwargs)
+    return readLocked
+
+def writing(method):
+    @functools.wraps(method)
+    def writeLocked(self, *args, **kwargs):
+        with self.lock.writing():
+            return method(self, *args, **kwargs)
+    return writeLocked
+
 class ShapeDisplayManager: #TODO make implementation of abstract class/interface
+    """Can be shared between threads: queries hold the manager's lock for
+    reading (so run in parallel) and changes hold it for writing. Use 
+    lock.writing() to make several calls atomic.
+    """
 
-    def __init__(self): #TODO allow for generic shape and dimensions of display grid
-        self.shapesDrawn = numpy.ones((3,5,2))*numpy.NaN; #3rd dim: shapeType_code, ID
+    def __init__(self, numRows=3, numCols=5, positionLists=None, numShapeTypes=None):
+        """
+        :param numRows, numCols: dimensions of the display grid (in cells)
+        :param positionLists: list of preferred cells ([row, col]) for each 
+        shape type. Defaults to positionList on the default 3x5 grid, and to 
+        defaultPositionList() otherwise.
+        :param numShapeTypes: number of shape types to generate default 
+        preferences for (ignored if positionLists is given)
+        """
+        self.numRows = numRows;
+        self.numCols = numCols;
+        if(positionLists is None):
+            if(numShapeTypes is None):
+                numShapeTypes = len(positionList);
+            if([numRows, numCols] == [3, 5] and numShapeTypes == len(positionList)):
+                positionLists = positionList;
+            else:
+                positionLists = [defaultPositionList(numRows, numCols, numShapeTypes, code) for code in range(numShapeTypes)];
+        #preference lists as cell numbers (row*numCols + col)
+        self.positionLists = [[row*numCols + col for [row, col] in cells] for cells in positionLists];
+        #squared distances between all pairs of cells
+        cellRows, cellCols = numpy.divmod(numpy.arange(numRows*numCols), numCols);
+        self.cellDistances = (cellRows[:,None]-cellRows[None,:])**2 + (cellCols[:,None]-cellCols[None,:])**2;
+        self.lock = ReadWriteLock();
+        self.clearAllShapes();
 
+    @writing
     def clearAllShapes(self):
-        self.shapesDrawn = numpy.ones((3,5,2))*numpy.NaN; #3rd dim: shapeType_code, ID
+        self.shapesDrawn = numpy.ones((self.numRows,self.numCols,2))*numpy.NaN; #3rd dim: shapeType_code, ID
+        self.occupiedCells = 0; #bitset of occupied cells (bit row*numCols + col)
+        self.nextPositionIndex = [0]*len(self.positionLists); #no cell before this index of the position list is free
+        self.numShapesOfType = {}; #number of shapes of each type currently drawn
+        #distance transform of the grid: for each cell, the (squared) distance
+        #to the closest occupied cell(s), and those cells in row-major order
+        self.nearestOccupiedDistance = numpy.ones(self.numRows*self.numCols)*numpy.inf;
+        self.nearestOccupiedCells = [[] for i in range(self.numRows*self.numCols)];
+        #changes since the last call to takeChanges()
+        self.clearedSinceLastChanges = True;
+        self.changedCells = set();
+
+    @writing
+    def takeChanges(self):
+        """Returns whether the display has been cleared and which cells have 
+        been changed since the last call (so that they can be sent to the 
+        replicas of the display).
+        """
+        changes = (self.clearedSinceLastChanges, sorted(self.changedCells));
+        self.clearedSinceLastChanges = False;
+        self.changedCells = set();
+        return changes
+
+    def _isFree(self, cell):
+        return not (self.occupiedCells >> cell) & 1;
+
+    def _nextFreeCell(self, shapeType_code):
+        #cells are only ever taken (until the display is cleared), so the
+        #pointer into the position list only moves forward. (Concurrent 
+        #readers all move it to the same cell, so it may be moved while the
+        #lock is only held for reading.)
+        cells = self.positionLists[shapeType_code];
+        index = self.nextPositionIndex[shapeType_code];
+        while(index < len(cells) and not self._isFree(cells[index])):
+            index += 1;
+        self.nextPositionIndex[shapeType_code] = index;
+        if(index < len(cells)):
+            return cells[index];
+        else:
+            return None;
+
+    def _occupyCell(self, row, col, shapeType_code):
+        shapeID = self.numShapesOfType.get(shapeType_code, 0);
+        self.setShapeAtCell(row, col, shapeType_code, shapeID);
+
+    @writing
+    def setShapeAtCell(self, row, col, shapeType_code, shapeID):
+        """Puts a given shape in a cell (e.g. to mirror another display manager).
+        """
+        prevShapeType_code = self.shapesDrawn[row,col,0];
+        if(not numpy.isnan(prevShapeType_code)): #shape drawn over another one
+            self.numShapesOfType[int(prevShapeType_code)] -= 1;
+        self.numShapesOfType[shapeType_code] = self.numShapesOfType.get(shapeType_code, 0) + 1;
+        cell = row*self.numCols + col;
+        if(self._isFree(cell)):
+            self.occupiedCells |= 1 << cell;
+            self._updateNearestOccupied(cell);
+        self.shapesDrawn[row,col,0] = shapeType_code;
+        self.shapesDrawn[row,col,1] = shapeID;
+        self.changedCells.add(cell);
         
+    def _updateNearestOccupied(self, newCell):
+        distances = self.cellDistances[:,newCell];
+        for cell in numpy.flatnonzero(distances < self.nearestOccupiedDistance):
+            self.nearestOccupiedCells[cell] = [newCell];
+        for cell in numpy.flatnonzero(distances == self.nearestOccupiedDistance):
+            bisect.insort(self.nearestOccupiedCells[cell], newCell);
+        numpy.minimum(self.nearestOccupiedDistance, distances, out=self.nearestOccupiedDistance);
+
+    @writing
     def displayNewShape(self, shapeType_code):
-        if(shapeType_code > (len(positionList)-1)):
+        if(shapeType_code > (len(self.positionLists)-1)):
             print('I don\'t know how to position that shape');
             return [-1, -1];
         else:
             row = -1; col = -1;
-            foundSpace = False;
-            positionList_index = 0;
-            while((not foundSpace) and (positionList_index < len(positionList[shapeType_code]))):
-                #check next position in position list for this shape
-                [row_test, col_test] = positionList[shapeType_code][positionList_index];
-                if(numpy.isnan(self.shapesDrawn[row_test,col_test,0])):
-                    #space is available
-                    row = row_test;
-                    col = col_test;
-                    foundSpace = True;
-                else:
-                    #space is not available - keep looking
-                    positionList_index += 1;
-            
-            if(foundSpace):
-                shapeID = numpy.equal(self.shapesDrawn[:,:,0],shapeType_code).sum();
-                self.shapesDrawn[row,col,0] = shapeType_code;
-                self.shapesDrawn[row,col,1] = shapeID;   
+            cell = self._nextFreeCell(shapeType_code);
+            if(cell is not None):
+                row, col = divmod(cell, self.numCols);
+                self._occupyCell(row, col, shapeType_code);
             else:
                 print('I cannot draw here.');
-            numRows = self.shapesDrawn.shape[0];
+            numRows = self.numRows;
             position = [(col+0.5)*shapeWidth,((numRows-1)-row+0.5)*shapeHeight];
             return position;
             
+    @reading
     def isPossibleToDisplayNewShape(self, shapeType_code):
-        if(shapeType_code > (len(positionList)-1)):
+        if(shapeType_code > (len(self.positionLists)-1)):
             print('I don\'t know how to position that shape');
             foundSpace = False;
         else:
-            row = -1; col = -1;
-            foundSpace = False;
-            positionList_index = 0;
-            while((not foundSpace) and (positionList_index < len(positionList[shapeType_code]))):
-                #check next position in position list for this shape
-                [row_test, col_test] = positionList[shapeType_code][positionList_index];
-                if(numpy.isnan(self.shapesDrawn[row_test,col_test,0])):
-                    #space is available
-                    foundSpace = True;
-                else:
-                    #space is not available - keep looking
-                    positionList_index += 1;
+            foundSpace = self._nextFreeCell(shapeType_code) is not None;
 
         return foundSpace;
 
+    @reading
     def indexOfLocation(self, location):
-        location = numpy.array(location);
-        location_cell = (location - shapeSize/2)/shapeSize;
+        [col, rowFromBottom] = gridCoordinates(location);
     
         numRows = self.shapesDrawn.shape[0];
 
-        row = (numRows -1)- int(round(location_cell[1]));
-        col = int(round(location_cell[0]));
+        row = (numRows -1)- rowFromBottom;
         return row, col
         
+    @reading
     def shapeAtLocation(self, location):          
         #map a location to the shape drawn at that location. 
         #shapeType_code will be -1 if invalid location.
@@ -115,6 +223,7 @@ class ShapeDisplayManager: #TODO make implementation of abstract class/interface
 
         return shapeType_code, shapeID
         
+    @reading
     def closestShapesToLocation(self, location):
         '''map a location to the closest shape(s) drawn at that location. 
         If multiple shapes are adjacent to the location, all will be returned.
@@ -134,34 +243,20 @@ class ShapeDisplayManager: #TODO make implementation of abstract class/interface
             print('Invalid column');
             shapeType_code = [-1];
             shapeID = [0];
-        elif(numpy.all(numpy.isnan(self.shapesDrawn[:,:,0]))):
+        elif(self.occupiedCells == 0):
             print('No shapes drawn yet');
             shapeID = [-1];
             shapeType_code = [0];
         else:
-            #calculate distance of all drawn shapes
-            shapeIndexes = numpy.argwhere(numpy.isfinite(self.shapesDrawn[:,:,0]));
-            numShapesDrawn = shapeIndexes.shape[0];
-            distsToLocation = numpy.zeros(numShapesDrawn);
-            for i in range(numShapesDrawn):
-                distsToLocation[i] = numpy.sqrt((row-shapeIndexes[i,0])**2 + (col-shapeIndexes[i,1])**2);
-                
-            closest_indexes = numpy.argsort(distsToLocation);
-            
-            i = 0;
-            shapeType_code = [];
-            shapeID = [];
-            #return all of the shapes which are closest if there are multiple at the same distance
-            while(i < len(closest_indexes) and
-                  distsToLocation[closest_indexes[i]] == distsToLocation[closest_indexes[0]]):
-                nextClosest_row = shapeIndexes[closest_indexes[i],0];
-                nextClosest_col = shapeIndexes[closest_indexes[i],1];
-                shapeType_code.append(self.shapesDrawn[nextClosest_row,nextClosest_col,0]);
-                shapeID.append(self.shapesDrawn[nextClosest_row,nextClosest_col,1]);
-                i+=1;
+            #all of the shapes which are closest if there are multiple at the same distance
+            closestCells = self.nearestOccupiedCells[row*numCols + col];
+            closestShapes = self.shapesDrawn.reshape(-1, 2)[closestCells];
+            shapeType_code = list(closestShapes[:,0]);
+            shapeID = list(closestShapes[:,1]);
         
         return shapeType_code, shapeID
         
+    @writing
     def displayShapeAtLocation(self, shapeType_code, location):
         '''blocks the space at location from being used
         '''
@@ -176,9 +271,74 @@ class ShapeDisplayManager: #TODO make implementation of abstract class/interface
             print('Invalid column');
             success = False;
         else:
-            shapeID = numpy.equal(self.shapesDrawn[:,:,0],shapeType_code).sum();
-            self.shapesDrawn[row,col,0] = shapeType_code;
-            self.shapesDrawn[row,col,1] = shapeID;  
+            self._occupyCell(row, col, shapeType_code);
             success = True;
             
         return success
+
+    # ---------------------------------------------------------- BATCH QUERIES
+    # Vectorised versions of the methods above, for many locations at once.
+    # Locations are given as an (N, 2) array-like of [x, y].
+
+    @reading
+    def indexesOfLocations(self, locations):
+        locations = numpy.reshape(numpy.asarray(locations, dtype=float), (-1, 2));
+        location_cells = (locations - shapeSize/2)/shapeSize;
+        #round half away from zero, like round()
+        location_cells = numpy.sign(location_cells)*numpy.floor(numpy.abs(location_cells) + 0.5);
+
+        rows = (self.numRows - 1) - location_cells[:,1].astype(int);
+        cols = location_cells[:,0].astype(int);
+        return rows, cols
+
+    def _cellsOfLocations(self, locations):
+        #cell numbers of the locations, and which of them are on the grid
+        rows, cols = self.indexesOfLocations(locations);
+        valid = (rows >= 0) & (rows < self.numRows) & (cols >= 0) & (cols < self.numCols);
+        cells = numpy.where(valid, rows*self.numCols + cols, 0);
+        return cells, valid
+
+    @reading
+    def shapesAtLocations(self, locations):
+        cells, valid = self._cellsOfLocations(locations);
+        shapes = self.shapesDrawn.reshape(-1, 2)[cells];
+        empty = numpy.isnan(shapes[:,1]);
+
+        shapeType_codes = numpy.where(valid, numpy.where(empty, 0, numpy.nan_to_num(shapes[:,0])), -1).astype(int);
+        shapeIDs = numpy.where(valid, numpy.where(empty, -1, numpy.nan_to_num(shapes[:,1])), 0).astype(int);
+        return shapeType_codes, shapeIDs
+
+    @reading
+    def closestShapesToLocations(self, locations):
+        """Returns one list of shape type codes and one list of shape IDs per
+        location, as closestShapesToLocation() does.
+        """
+        cells, valid = self._cellsOfLocations(locations);
+        shapesDrawn = self.shapesDrawn.reshape(-1, 2);
+
+        shapeType_codes = [];
+        shapeIDs = [];
+        for cell, isValid in zip(cells, valid):
+            if(not isValid):
+                shapeType_codes.append([-1]);
+                shapeIDs.append([0]);
+            elif(self.occupiedCells == 0):
+                shapeType_codes.append([0]);
+                shapeIDs.append([-1]);
+            else:
+                closestShapes = shapesDrawn[self.nearestOccupiedCells[cell]];
+                shapeType_codes.append(list(closestShapes[:,0]));
+                shapeIDs.append(list(closestShapes[:,1]));
+        return shapeType_codes, shapeIDs
+
+    @writing
+    def displayShapesAtLocations(self, shapeType_codes, locations):
+        """Blocks the spaces at locations, in order. Returns whether each
+        location was valid.
+        """
+        cells, valid = self._cellsOfLocations(locations);
+        for shapeType_code, cell, isValid in zip(shapeType_codes, cells, valid):
+            if(isValid):
+                row, col = divmod(int(cell), self.numCols);
+                self._occupyCell(row, col, shapeType_code);
+        return [bool(isValid) for isValid in valid]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""
+Concurrent construction of the shape learners of a word.
+
+When a ShapeLearnerManager starts a new word (newCollection), it resolves the
+settings of each letter (InteractionSettings.generateSettings, which reads
+the dataset's files) and builds a ShapeLearner, with its letter model, for
+each letter it hasn't learnt before, one after the other. A ShapeLearnerPool
+does this in a pool of threads instead, for all the letters of the word at
+once, and as soon as the word is received (prefetch) rather than when the
+robot responds to it; PooledShapeLearnerManager then takes the learners from
+the pool, in the order of the letters of the word. A letter is built once,
+however many times it appears in the word. The learners prefetched for a word
+which isn't the one started (e.g. when another word was received in the
+meantime) are dropped when a word is started.
+
+The settings are kept for each letter, so that checking the datasets of the
+letters of the words seen before doesn't read the files again.
+
+The learners are built in threads, so they only overlap where the file reads
+and numpy release the GIL: measure the gain with the datasets of the
+experiment before using the pool (learning_words_nao.py's ~learner_workers).
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from shape_learning.shape_learner_manager import ShapeLearnerManager
+
+class _Settings:
+    """Result of the settings of a letter whose learner is being built."""
+    def __init__(self, result):
+        self.result = result
+
+    def get(self):
+        return self.result.get()[0]
+
+class ShapeLearnerPool:
+    def __init__(self, generateSettings, numWorkers=4):
+        """
+        :param generateSettings: returns the settings of the learner of a
+        letter (raises a RuntimeError if the letter has no dataset)
+        """
+        self.generateSettings = generateSettings
+        self._pool = ThreadPool(numWorkers)
+        self._lock = threading.Lock()
+        self._settings = {} #letter -> result of its settings
+        self._learners = {} #letter -> result of its settings and learner, until taken
+
+    def prefetch(self, letters, learnt=()):
+        """Starts building the learners of the letters (only resolving the
+        settings of those learnt), without waiting for them.
+        """
+        with self._lock:
+            for letter in letters:
+                if letter in learnt:
+                    if letter not in self._settings:
+                        self._settings[letter] = self._pool.apply_async(self.generateSettings, (letter,))
+                elif letter not in self._learners:
+                    self._learners[letter] = self._pool.apply_async(self._build, (letter,))
+                    if letter not in self._settings:
+                        self._settings[letter] = _Settings(self._learners[letter])
+
+    def _build(self, letter):
+        from shape_learning.shape_learner import ShapeLearner
+        settings = self.generateSettings(letter)
+        return settings, ShapeLearner(settings)
+
+    def settings(self, letter):
+        """:returns: the settings of the letter (waits for them if they are
+        being resolved)"""
+        self.prefetch([letter], learnt=[letter])
+        with self._lock:
+            result = self._settings[letter]
+        return result.get()
+
+    def takeLearner(self, letter):
+        """:returns: the settings and the learner of the letter (waits for
+        them if they are being built); it is built anew if asked for again"""
+        self.prefetch([letter])
+        with self._lock:
+            result = self._learners.pop(letter)
+        return result.get()
+
+    def dropLearners(self):
+        """Forgets the learners prefetched but not taken (those being built
+        are dropped once they are)."""
+        with self._lock:
+            self._learners = {}
+
+    def close(self):
+        self.dropLearners()
+        self._pool.close()
+
+class PooledShapeLearnerManager(ShapeLearnerManager):
+    """ShapeLearnerManager whose learners are built by a ShapeLearnerPool."""
+    def __init__(self, pool, *args, **kwargs):
+        ShapeLearnerManager.__init__(self, pool.settings, *args, **kwargs)
+        self.pool = pool
+
+    def prefetch(self, word):
+        """Starts building the learners of the letters of a word to come."""
+        self.pool.prefetch(word, learnt=self.shapesLearnt)
+
+    def newCollection(self, collection):
+        self.prefetch(collection) #before the datasets of its letters are checked, one after the other
+        return ShapeLearnerManager.newCollection(self, collection)
+
+    def initialiseShapeLearners(self):
+        """Sets up the learners of the current collection as
+        ShapeLearnerManager does, the learners of the letters not learnt
+        before being taken from the pool.
+        """
+        collection = self.currentCollection
+        self.prefetch(collection)
+        learners = []
+        settings = []
+        seenBefore = []
+        try:
+            for letter in collection:
+                if letter in self.shapesLearnt:
+                    #as ShapeLearnerManager does for a single letter (it
+                    #doesn't build a learner for a letter learnt before)
+                    self.currentCollection = letter
+                    ShapeLearnerManager.initialiseShapeLearners(self)
+                    learners += self.shapeLearners_currentCollection
+                    settings += self.settings_shapeLearners_currentCollection
+                    seenBefore += self.shapeLearnersSeenBefore_currentCollection
+                else:
+                    letterSettings, learner = self.pool.takeLearner(letter)
+                    self.shapesLearnt.append(letter)
+                    self.shapeLearners_all.append(learner)
+                    self.settings_shapeLearners_all.append(letterSettings)
+                    learners.append(learner)
+                    settings.append(letterSettings)
+                    seenBefore.append(False)
+        finally:
+            self.currentCollection = collection
+        self.shapeLearners_currentCollection = learners
+        self.settings_shapeLearners_currentCollection = settings
+        self.shapeLearnersSeenBefore_currentCollection = seenBefore
+        self.pool.dropLearners() #those prefetched for other words
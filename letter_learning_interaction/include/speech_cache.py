@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Cache of pre-synthesized speech for the phrases of the interaction.
+
+The robot's phrases (see InteractionSettings.getPhrases) are known in
+advance, and those with a word formatted into them can only be formatted with
+the words of the cards (see word_card_detection) or with letters. A
+SpeechCache renders all of them to audio files, in a pool of workers, ahead of
+time (at startup, in the background, or offline with
+scripts/buildSpeechCache.py), so that saying one of them is playing its file,
+without the latency of the synthesis. Anything else is synthesized live.
+
+The rendering, playing and live synthesis are done by a backend:
+- NaoqiSpeechBackend: ALTextToSpeech.sayToFile and ALAudioPlayer.playFile
+  (the files are on the robot)
+- LocalSpeechBackend: a stand-in which writes silent WAV files lasting as
+  long as the text would take to say, and only takes time to "say" things
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import wave
+from multiprocessing.pool import ThreadPool
+
+from letter_learning_interaction.interaction_settings import InteractionSettings
+from letter_learning_interaction.word_card_detection import tags_words_mapping, tags_letters_mapping
+
+#said by learning_words_nao.py in response to feedback, whatever the language
+FEEDBACK_RESPONSE_PHRASES = ['Ok, thanks for helping me', "Ok, I'll work on the %s"]
+
+LETTERS = sorted(tags_letters_mapping.values())
+
+def utterances(language, words=None):
+    """:returns: the phrases of the interaction in the given language, those
+    with a %s formatted with each of the words (by default the words of the
+    cards) and letters
+    """
+    if words is None:
+        words = sorted(set(tags_words_mapping.values()))
+    introPhrase, demo_response_phrases, asking_phrases_after_feedback, asking_phrases_after_word, word_response_phrases, word_again_response_phrases, testPhrase, thankYouPhrase = InteractionSettings.getPhrases(language)
+
+    texts = [introPhrase, testPhrase, thankYouPhrase]
+    for phrases in [demo_response_phrases, asking_phrases_after_feedback, asking_phrases_after_word, word_response_phrases, word_again_response_phrases, FEEDBACK_RESPONSE_PHRASES]:
+        for phrase in phrases:
+            if '%s' in phrase:
+                texts.extend(phrase % word for word in list(words) + LETTERS)
+            else:
+                texts.append(phrase)
+
+    unique = []
+    seen = set()
+    for text in texts:
+        if text not in seen:
+            seen.add(text)
+            unique.append(text)
+    return unique
+
+class SpeechCache:
+    """Says texts by playing their pre-rendered audio file, or else by
+    synthesizing them live.
+
+    The files are named after a hash of the voice and the text. The index of
+    those rendered is kept in indexFile (by default <directory>/index.json),
+    on the machine running the cache, while the files may be on the robot.
+    """
+    def __init__(self, backend, directory, indexFile=None):
+        self.backend = backend
+        self.directory = directory
+        self.indexFile = indexFile or os.path.join(directory, 'index.json')
+        self.rendered = set() #names of the files rendered
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pool = None
+        if os.path.exists(self.indexFile):
+            with open(self.indexFile) as f:
+                index = json.load(f)
+            if index.get('voice') == backend.voice():
+                self.rendered = set(index['files'])
+
+    def fileName(self, text):
+        key = self.backend.voice() + '\n' + text
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest()[:20] + '.wav')
+
+    def missing(self, texts):
+        with self._lock:
+            return [text for text in texts if os.path.basename(self.fileName(text)) not in self.rendered]
+
+    def render(self, texts, numWorkers=4):
+        """Renders the texts which aren't in the cache yet, with a pool of
+        workers (blocking).
+
+        :returns: the number of texts rendered
+        """
+        texts = self.missing(texts)
+        if texts:
+            pool = ThreadPool(numWorkers)
+            try:
+                pool.map(self._render, texts)
+            finally:
+                pool.close()
+                pool.join()
+            self.save()
+        return len(texts)
+
+    def renderAsync(self, texts, numWorkers=4, callback=None):
+        """Renders the texts which aren't in the cache yet in the background;
+        they are said from the cache as soon as they are rendered.
+
+        :param callback: called with the number of texts rendered once done
+        """
+        texts = self.missing(texts)
+        self._pool = ThreadPool(numWorkers)
+        def done(results):
+            self.save()
+            if callback is not None:
+                callback(len(texts))
+        self._pool.map_async(self._render, texts, callback=done)
+        self._pool.close()
+
+    def _render(self, text):
+        path = self.fileName(text)
+        self.backend.render(text, path)
+        with self._lock:
+            self.rendered.add(os.path.basename(path))
+
+    def save(self):
+        with self._lock:
+            index = {'voice': self.backend.voice(), 'files': sorted(self.rendered)}
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.indexFile))):
+            os.makedirs(os.path.dirname(os.path.abspath(self.indexFile)))
+        temporaryFile = self.indexFile + '.tmp'
+        with open(temporaryFile, 'w') as f:
+            json.dump(index, f, indent=1, sort_keys=True)
+        os.rename(temporaryFile, self.indexFile)
+
+    def say(self, text):
+        """Says the text, from the cache if it has been rendered (as
+        ALTextToSpeech.say, blocks until it has been said)."""
+        path = self.fileName(text)
+        with self._lock:
+            cached = os.path.basename(path) in self.rendered
+        if cached:
+            try:
+                self.backend.play(path)
+                self.hits += 1
+                return
+            except Exception: #e.g. the file was deleted: render it again next time
+                with self._lock:
+                    self.rendered.discard(os.path.basename(path))
+        self.misses += 1
+        self.backend.say(text)
+
+class NaoqiSpeechBackend:
+    """Renders with ALTextToSpeech.sayToFile and plays with
+    ALAudioPlayer.playFile (the cache directory is on the robot)."""
+    def __init__(self, textToSpeech, audioPlayer):
+        self.textToSpeech = textToSpeech
+        self.audioPlayer = audioPlayer
+        self._voice = '%s/%s' % (textToSpeech.getLanguage(), textToSpeech.getVoice())
+
+    def voice(self):
+        return self._voice
+
+    def render(self, text, path):
+        self.textToSpeech.sayToFile(text, path)
+
+    def play(self, path):
+        self.audioPlayer.playFile(path)
+
+    def say(self, text):
+        self.textToSpeech.say(text)
+
+class LocalSpeechBackend:
+    """Stand-in for a speech synthesizer, for tests and simulations: texts
+    take len(words)/rate seconds to say, plus synthesisLatency when
+    synthesized live, and are rendered as silent WAV files of that duration.
+    """
+    SAMPLE_RATE = 1000 #the files are only silence
+
+    def __init__(self, rate=2.5, synthesisLatency=0.3, sleep=time.sleep, language='english'):
+        self.rate = rate
+        self.synthesisLatency = synthesisLatency
+        self.sleep = sleep
+        self.language = language
+
+    def voice(self):
+        return 'local/' + self.language
+
+    def duration(self, text):
+        return len(text.split())/float(self.rate)
+
+    def render(self, text, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError: #created by another worker
+                pass
+        output = wave.open(path, 'wb')
+        try:
+            output.setnchannels(1)
+            output.setsampwidth(2)
+            output.setframerate(self.SAMPLE_RATE)
+            output.writeframes(b'\x00\x00'*int(self.duration(text)*self.SAMPLE_RATE))
+        finally:
+            output.close()
+
+    def play(self, path):
+        audio = wave.open(path, 'rb')
+        try:
+            duration = audio.getnframes()/float(audio.getframerate())
+        finally:
+            audio.close()
+        self.sleep(duration)
+
+    def say(self, text):
+        self.sleep(self.synthesisLatency + self.duration(text))
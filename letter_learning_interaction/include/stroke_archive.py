@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Columnar archive of user-drawn shapes (demonstrations), for analysing and
+building datasets from large numbers of recorded shapes.
+
+An archive is a directory of numpy arrays, which are memory-mapped when read
+so that any shape can be accessed without loading the whole archive:
+
+- points.npy: the points of all the strokes, one after the other (float32, Nx2)
+- stroke_offsets.npy: index in points of the first point of each stroke, plus
+  the total number of points (int64)
+- shape_offsets.npy: index of the first stroke of each shape, plus the total
+  number of strokes (int64)
+- session.npy, word.npy, letter.npy: metadata of each shape (byte strings,
+  empty if unknown)
+- start_time.npy, end_time.npy: time of the first and last stroke of each
+  shape (float64 seconds, NaN if unknown)
+
+It doesn't depend on ROS. The strokes written by countShapes.py (csv rows of
+'shape,stroke,x0,y0,x1,y1,...') can be read with readStrokesCsv.
+"""
+
+import csv
+import os
+
+import numpy
+
+class StrokeArchiveWriter:
+    """Accumulates shapes, and writes them as an archive with save()."""
+    def __init__(self):
+        self.points = []
+        self.strokeLengths = []
+        self.shapeLengths = []
+        self.session = []
+        self.word = []
+        self.letter = []
+        self.startTime = []
+        self.endTime = []
+
+    def addShape(self, strokes, session='', word='', letter='', startTime=numpy.nan, endTime=numpy.nan):
+        """
+        :param strokes: the strokes of the shape, each a sequence of (x,y)
+        points (or a flat sequence x0,y0,x1,y1,...)
+        """
+        for stroke in strokes:
+            stroke = numpy.asarray(stroke, dtype=numpy.float32).reshape(-1, 2)
+            self.points.append(stroke)
+            self.strokeLengths.append(len(stroke))
+        self.shapeLengths.append(len(strokes))
+        self.session.append(session)
+        self.word.append(word)
+        self.letter.append(letter)
+        self.startTime.append(startTime)
+        self.endTime.append(endTime)
+
+    def __len__(self):
+        return len(self.shapeLengths)
+
+    def save(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        if self.points:
+            points = numpy.concatenate(self.points)
+        else:
+            points = numpy.zeros((0, 2), dtype=numpy.float32)
+        columns = {'points': points,
+                   'stroke_offsets': _offsets(self.strokeLengths),
+                   'shape_offsets': _offsets(self.shapeLengths),
+                   'session': _strings(self.session),
+                   'word': _strings(self.word),
+                   'letter': _strings(self.letter),
+                   'start_time': numpy.array(self.startTime, dtype=numpy.float64),
+                   'end_time': numpy.array(self.endTime, dtype=numpy.float64)}
+        for name, column in columns.items():
+            numpy.save(os.path.join(directory, name + '.npy'), column)
+
+def _offsets(lengths):
+    offsets = numpy.zeros(len(lengths) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+def _strings(values):
+    return numpy.array([value.encode('utf-8') if not isinstance(value, bytes) else value for value in values],
+                       dtype=bytes) if values else numpy.zeros(0, dtype='S1')
+
+class StrokeArchive:
+    """Read access to an archive written by StrokeArchiveWriter.
+
+    Shapes are returned as views of the (memory-mapped) points array.
+    """
+    def __init__(self, directory, mmap=True):
+        mmapMode = 'r' if mmap else None
+        load = lambda name: numpy.load(os.path.join(directory, name + '.npy'), mmap_mode=mmapMode)
+        self.points = load('points')
+        self.strokeOffsets = load('stroke_offsets')
+        self.shapeOffsets = load('shape_offsets')
+        self.session = load('session')
+        self.word = load('word')
+        self.letter = load('letter')
+        self.startTime = load('start_time')
+        self.endTime = load('end_time')
+
+    def __len__(self):
+        return len(self.shapeOffsets) - 1
+
+    def strokes(self, shape):
+        """The strokes of a shape, as a list of Nx2 arrays."""
+        offsets = self.strokeOffsets[self.shapeOffsets[shape]:self.shapeOffsets[shape + 1] + 1]
+        return [self.points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def shapePoints(self, shape):
+        """All the points of a shape (its strokes one after the other), as an
+        Nx2 array."""
+        start = self.strokeOffsets[self.shapeOffsets[shape]]
+        end = self.strokeOffsets[self.shapeOffsets[shape + 1]]
+        return self.points[start:end]
+
+    def metadata(self, shape):
+        """(session, word, letter, startTime, endTime) of a shape."""
+        return (self.session[shape].decode('utf-8'), self.word[shape].decode('utf-8'),
+                self.letter[shape].decode('utf-8'), float(self.startTime[shape]), float(self.endTime[shape]))
+
+    def select(self, session=None, word=None, letter=None):
+        """Indexes of the shapes matching all the given metadata (each either
+        a value or a list of values)."""
+        selected = numpy.ones(len(self), dtype=bool)
+        for column, values in [(self.session, session), (self.word, word), (self.letter, letter)]:
+            if values is None:
+                continue
+            if isinstance(values, (str, bytes)) or not hasattr(values, '__iter__'):
+                values = [values]
+            selected &= numpy.isin(column, _strings(list(values)))
+        return numpy.flatnonzero(selected)
+
+def readStrokesCsv(path):
+    """Reads the strokes written by countShapes.py.
+
+    :returns: the strokes of each shape, in order, as lists of Nx2 arrays
+    """
+    shapes = []
+    currentShape = None
+    with open(path) as csvfile:
+        for row in csv.reader(csvfile, delimiter=',', quotechar='|'):
+            if len(row) < 2:
+                continue
+            shape, stroke = int(row[0]), int(row[1])
+            points = numpy.array(row[2:], dtype=numpy.float32).reshape(-1, 2)
+            if shape != currentShape or stroke == 0:
+                shapes.append([])
+                currentShape = shape
+            shapes[-1].append(points)
+    return shapes
@@ -2,10 +2,29 @@ import logging; logger = logging.getLogger("text_shaper")
 logger.setLevel(logging.DEBUG)
 
 import numpy
-from scipy import interpolate
 from collections import OrderedDict
 
-from shape_learning.shape_modeler import ShapeModeler #for normaliseShapeHeight()
+#scipy.interpolate and shape_learning's ShapeModeler (for normaliseShapeHeight()
+#and getShapeCentre()) are slow to import: they are imported once, when first
+#needed, by these accessors (which raise an ImportError if they are missing).
+_interpolate = None
+_ShapeModeler = None
+
+def scipyInterpolate():
+    """:returns: the scipy.interpolate module"""
+    global _interpolate
+    if _interpolate is None:
+        from scipy import interpolate
+        _interpolate = interpolate
+    return _interpolate
+
+def shapeModeler():
+    """:returns: shape_learning's ShapeModeler class"""
+    global _ShapeModeler
+    if _ShapeModeler is None:
+        from shape_learning.shape_modeler import ShapeModeler
+        _ShapeModeler = ShapeModeler
+    return _ShapeModeler
 
 SIZESCALE_HEIGHT = 0.016   #Desired height of 'a' (metres)
 SIZESCALE_WIDTH = 0.016    #Desired width of 'a' (metres)
@@ -129,6 +148,7 @@ class ShapedWord:
         return gx_min, gy_min, gx_max, gy_max
 
     def downsample(self, downsampling_factor):
+        interpolate = scipyInterpolate()
 
         downsampled_paths = []
 
@@ -183,6 +203,7 @@ class TextShaper:
 
         :returns: a ShapedWord that contains the path of individual letters
         """
+        ShapeModeler = shapeModeler()
         
         paths = []
 
@@ -318,6 +339,7 @@ class ScreenManager:
         return letter, bb
 
     def find_letter(self, path):
+        ShapeModeler = shapeModeler()
 
         x,y = ShapeModeler.getShapeCentre(path)
         return self.closest_letter(x, y)
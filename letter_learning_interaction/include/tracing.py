@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+"""
+Lightweight latency tracing across nodes.
+
+Each input of the interaction (a word, a demonstration) gets a trace ID when
+it enters the system, which is carried along with it (e.g. in the trace_id
+field of Shape messages; trajectories, whose header fields are all in use,
+are identified by their header's stamp, recorded with their trace ID). Each
+stage it goes through records a span (name, trace ID, start and end times) to
+its node's Tracer, a ring buffer of the latest spans, which can be exported as
+a Chrome trace (JSON, as read by chrome://tracing or Perfetto). The traces of
+several nodes can be merged into one waterfall per trace ID with
+scripts/mergeTraces.py.
+
+A disabled Tracer records nothing: span() then costs a function call.
+"""
+
+import collections
+import json
+import os
+import random
+import threading
+import time
+
+def newTraceId():
+    return '%016x' % random.getrandbits(64)
+
+class Span:
+    __slots__ = ['name', 'traceId', 'start', 'end', 'thread', 'attributes']
+
+    def __init__(self, name, traceId, start, end, thread, attributes):
+        self.name = name
+        self.traceId = traceId
+        self.start = start
+        self.end = end
+        self.thread = thread
+        self.attributes = attributes
+
+class _NoSpan:
+    """What span() returns when tracing is disabled."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+_noSpan = _NoSpan()
+
+class _ActiveSpan:
+    __slots__ = ['tracer', 'name', 'traceId', 'attributes', 'start']
+
+    def __init__(self, tracer, name, traceId, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.traceId = traceId
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = self.tracer.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.traceId, self.start, self.tracer.clock(), **self.attributes)
+        return False
+
+    def set(self, **attributes):
+        """Adds attributes to the span (e.g. results only known inside it)."""
+        self.attributes.update(attributes)
+
+class Tracer:
+    """Records the spans of a process to a ring buffer of the latest ones.
+    """
+    def __init__(self, process, enabled=False, capacity=10000, clock=time.time):
+        """
+        :param process: name of the process (e.g. the node) in the traces
+        :param capacity: number of spans kept (the oldest are dropped)
+        :param clock: function returning the current time, in seconds
+        """
+        self.process = process
+        self.enabled = enabled
+        self.clock = clock
+        self._spans = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def now(self):
+        return self.clock()
+
+    def span(self, name, traceId, **attributes):
+        """:returns: a context manager recording a span around its block"""
+        if not self.enabled:
+            return _noSpan
+        return _ActiveSpan(self, name, traceId, attributes)
+
+    def record(self, name, traceId, start, end, **attributes):
+        """Records a span measured by the caller (times from the tracer's clock)."""
+        if not self.enabled:
+            return
+        span = Span(name, traceId, start, end, threading.current_thread().name, attributes)
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def toChromeTrace(self):
+        """:returns: the spans as a Chrome trace (complete events, times in
+        microseconds, the trace ID of each in its args)"""
+        pid = os.getpid()
+        threads = {}
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': self.process}}]
+        for span in self.spans():
+            if span.thread not in threads:
+                threads[span.thread] = len(threads) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': threads[span.thread],
+                               'args': {'name': span.thread}})
+            args = dict(span.attributes)
+            args['trace_id'] = span.traceId
+            events.append({'name': span.name, 'cat': self.process, 'ph': 'X', 'pid': pid, 'tid': threads[span.thread],
+                           'ts': span.start*1e6, 'dur': (span.end - span.start)*1e6, 'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, path):
+        """Writes the spans to a Chrome trace file."""
+        trace = self.toChromeTrace()
+        with open(path, 'w') as f:
+            json.dump(trace, f, default=str)
+        return len(trace['traceEvents'])
+
+def traceNode(process):
+    """Creates the Tracer of a node from its parameters:
+    - ~tracing: whether to record spans (default: False)
+    - ~trace_buffer_size: number of spans kept (default: 10000)
+    - ~trace_file: Chrome trace file written at shutdown, and whenever a
+      message is received on the dump_traces topic (default: none)
+
+    Times are ROS times (as those of the message headers).
+    """
+    import rospy
+    from std_msgs.msg import Empty
+    tracer = Tracer(process, enabled=rospy.get_param('~tracing', False),
+                    capacity=rospy.get_param('~trace_buffer_size', 10000), clock=rospy.get_time)
+    traceFile = rospy.get_param('~trace_file', '')
+    if tracer.enabled and traceFile:
+        def dump(*args):
+            numEvents = tracer.dump(traceFile)
+            rospy.loginfo('Wrote %d trace events to %s', numEvents, traceFile)
+        rospy.on_shutdown(dump)
+        tracer.dumpSubscriber = rospy.Subscriber('dump_traces', Empty, dump)
+    return tracer
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""
+Least-recently-used cache of the trajectories of the words written.
+
+Shaping a word, placing it, resampling it and building its trajectory
+messages only depends on the word, on the current shapes of its letters (the
+state of their learners) and on the layout of the writing surface, so when a
+word is asked for again while none of its letters has been learnt since, its
+trajectories can be reused. The entries are keyed by the word, the layout and
+a digest of the shapes' paths, so once a letter has been learnt the entries of
+the words containing it are no longer hit (and are dropped as the least
+recently used).
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy
+
+def shapesDigest(shapes):
+    """:returns: a digest of the types and paths of the shapes"""
+    digest = hashlib.sha1()
+    for shape in shapes:
+        digest.update(shape.shapeType.encode('utf-8') if not isinstance(shape.shapeType, bytes) else shape.shapeType)
+        digest.update(numpy.ascontiguousarray(shape.path, dtype=float).data)
+    return digest.hexdigest()
+
+class TrajectoryCache:
+    def __init__(self, capacity=32):
+        """
+        :param capacity: number of words kept (0 disables the cache)
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() #key -> value, from the least recently used
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(word, layout, shapes):
+        return (word, layout, shapesDigest(shapes))
+
+    def get(self, key):
+        """:returns: the value cached for the key, or None"""
+        value = self._entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries[key] = value #most recently used
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
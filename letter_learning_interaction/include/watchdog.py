@@ -1,84 +1,391 @@
 #!/usr/bin/env python
 
 """Classes for managing watchdog timers over ROS topics.
+
+All the timers of a process are run by a single TimerScheduler thread, so
+clearing a watchdog only moves its deadline instead of starting a new thread.
+
+Besides plain clears (Empty messages on one topic per device), watchdogs can
+be cleared by heartbeats: a HeartbeatPublisher sends numbered, timestamped
+heartbeats for any number of devices over a single topic, and a
+HeartbeatMonitor keeps a watchdog and link statistics (round-trip time,
+jitter, loss) for each device. The monitor measures the round-trip time by
+pinging the devices (on <heartbeat topic>/ping), which the HeartbeatPublisher
+echoes back (on <heartbeat topic>/echo): both ends of the measure are taken on
+the monitor's clock.
+
+The statistics are those of the link between the machines running the
+HeartbeatPublisher (watchdog_clearer.py) and the HeartbeatMonitor, so the
+publisher has to run on the device itself. The tablet app doesn't (it only
+publishes plain clears on watchdog_clear/tablet), so the interaction keeps a
+plain Watchdog for it, without link statistics.
 """
 
+import heapq
+import itertools
+import threading
+import time
+
 import rospy
 from std_msgs.msg import Empty
-from threading import Timer
+from letter_learning_interaction.msg import Heartbeat, HeartbeatStatistics
+
+class ScheduledTimer:
+    """A one-shot (or, if period is given, periodic) timer run by a
+    TimerScheduler. Callbacks are run on the scheduler's thread, so they
+    should return quickly.
+    """
+    def __init__(self, scheduler, callback, period=None):
+        self.scheduler = scheduler;
+        self.callback = callback;
+        self.period = period;
+        self.deadline = None; #None when not scheduled
+        self._entry = None; #sequence number of this timer's current entry in the scheduler's heap
+
+    def start(self, delay):
+        """Schedule (or re-schedule) the timer to fire delay seconds from now.
+        """
+        self.scheduler._schedule(self, time.time() + delay);
+
+    def cancel(self):
+        self.scheduler._cancel(self);
+
+    def isScheduled(self):
+        return self.deadline is not None;
+
+class TimerScheduler:
+    """Runs any number of timers on a single thread, from a heap of deadlines.
+
+    Moving a deadline later (as happens every time a watchdog is cleared) does
+    not touch the heap: the stale entry is re-queued when it comes up.
+    """
+    def __init__(self):
+        self._heap = [];
+        self._sequence = itertools.count();
+        self._condition = threading.Condition(threading.Lock());
+
+        self._thread = threading.Thread(target=self._run, name='timer_scheduler');
+        self._thread.daemon = True;
+        self._thread.start();
+
+    def createTimer(self, callback, period=None):
+        return ScheduledTimer(self, callback, period);
+
+    def _push(self, timer, deadline):
+        timer._entry = next(self._sequence);
+        heapq.heappush(self._heap, (deadline, timer._entry, timer));
+
+    def _schedule(self, timer, deadline):
+        with self._condition:
+            queued = timer._entry is not None;
+            if(queued and deadline >= timer.deadline):
+                timer.deadline = deadline; #postponed: re-queued when the current entry comes up
+            else:
+                timer.deadline = deadline;
+                self._push(timer, deadline);
+                self._condition.notify();
+
+    def _cancel(self, timer):
+        with self._condition:
+            timer.deadline = None;
+            timer._entry = None;
+
+    def _nextDueTimer(self):
+        with self._condition:
+            while True:
+                if(not self._heap):
+                    self._condition.wait();
+                    continue;
+
+                deadline, entry, timer = self._heap[0];
+                if(entry != timer._entry): #timer has been cancelled or re-queued since
+                    heapq.heappop(self._heap);
+                    continue;
+
+                now = time.time();
+                if(deadline > now):
+                    self._condition.wait(deadline - now);
+                    continue;
+
+                heapq.heappop(self._heap);
+                if(timer.deadline > now): #postponed
+                    self._push(timer, timer.deadline);
+                    continue;
+
+                if(timer.period is not None):
+                    timer.deadline = max(timer.deadline + timer.period, now);
+                    self._push(timer, timer.deadline);
+                else:
+                    timer.deadline = None;
+                    timer._entry = None;
+                return timer;
+
+    def _run(self):
+        while True:
+            timer = self._nextDueTimer();
+            try:
+                timer.callback();
+            except Exception as e:
+                rospy.logerr('Timer callback failed: %s', e);
+
+_defaultScheduler = None;
+_defaultSchedulerLock = threading.Lock();
+def getDefaultScheduler():
+    """Returns the scheduler shared by all watchdogs and watchdog clearers of
+    the process (started on first use).
+    """
+    global _defaultScheduler
+    with _defaultSchedulerLock:
+        if(_defaultScheduler is None):
+            _defaultScheduler = TimerScheduler();
+        return _defaultScheduler;
+
+class LinkStatistics:
+    """Round-trip time, jitter and loss of the link to a device.
+
+    The round-trip times are those of the pings echoed by the device, timed on
+    the monitor's clock. The jitter is the variation of the transit time
+    (receive time minus send stamp) between consecutive heartbeats: the offset
+    between the clocks of the device and the monitor cancels out, so they
+    don't need to be synchronised.
+    """
+    def __init__(self):
+        self.received = 0;
+        self.lost = 0;
+        self.jitter = 0.0;
+        self.lastSequence = None;
+        self.lastTransit = None;
+        self.echoes = 0;
+        self.roundTripTime = 0.0;
+        self.meanRoundTripTime = 0.0;
+        self.maxRoundTripTime = 0.0;
+
+    def update(self, sequence, sentTime, receivedTime):
+        transit = receivedTime - sentTime;
+        if(self.lastSequence is not None):
+            gap = (sequence - self.lastSequence) % 2**32;
+            if(gap == 0 or gap >= 2**31): #duplicate or late heartbeat, already counted as lost
+                return;
+            self.lost += gap - 1;
+            self.jitter += (abs(transit - self.lastTransit) - self.jitter)/16.0;
+        self.received += 1;
+        self.lastTransit = transit;
+        self.lastSequence = sequence;
+
+    def updateRoundTrip(self, roundTripTime):
+        self.echoes += 1;
+        self.roundTripTime = roundTripTime;
+        self.meanRoundTripTime += (roundTripTime - self.meanRoundTripTime)/self.echoes;
+        self.maxRoundTripTime = max(self.maxRoundTripTime, roundTripTime) if self.echoes > 1 else roundTripTime;
+
+    def lossRate(self):
+        if(self.received + self.lost == 0):
+            return 0.0;
+        return float(self.lost)/(self.received + self.lost);
 
 class Watchdog:
-    """Listens for watchdog timer clears over a topic and if the timer 
-    overflows then a warning is raised that device responsible for 
+    """Listens for watchdog timer clears over a topic and if the timer
+    overflows then a warning is raised that device responsible for
     clearing the timer has not performed as expected.
+
+    If clearTopic is None, the watchdog is only cleared by calls to onClear()
+    or onHeartbeat() (see HeartbeatMonitor).
     """
-    def __init__(self, clearTopic, timeout_sec, userHandler=None):
+    def __init__(self, clearTopic, timeout_sec, userHandler=None, scheduler=None):
         self.clearTopic = clearTopic;
         self.timeout_sec = timeout_sec;
         self.handler = userHandler if userHandler is not None else self.defaultHandler;
-        self.subscriber = rospy.Subscriber(self.clearTopic, Empty, self.onClear);
-        
+        scheduler = scheduler if scheduler is not None else getDefaultScheduler();
+        self.timer = scheduler.createTimer(self.handler);
+        self.statistics = LinkStatistics();
+        if(self.clearTopic is not None):
+            self.subscriber = rospy.Subscriber(self.clearTopic, Empty, self.onClear);
+
         rospy.loginfo('Starting new timer');
         self.responsive = True;
         self.running = True;
-        self.timer = Timer(self.timeout_sec, self.handler);
-        self.timer.start();
-    
+        self.timer.start(self.timeout_sec);
+
     def onClear(self, message):
-        self.timer.cancel(); #clear timer
         if(self.running):
             if(not self.responsive):
                 rospy.loginfo('Re-connection');
             self.responsive = True;
-            self.timer = Timer(self.timeout_sec, self.handler); #schedule new timeout
-            self.timer.start();
-        
+            self.timer.start(self.timeout_sec); #move the timeout
+        else:
+            self.timer.cancel();
+
+    def onHeartbeat(self, heartbeat):
+        self.statistics.update(heartbeat.sequence, heartbeat.stamp.to_sec(), rospy.Time.now().to_sec());
+        self.onClear(heartbeat);
+
     def stop(self):
         self.timer.cancel(); #stop timer
         self.running = False;
         rospy.loginfo('Stopped');
-        
+
     def restart(self):
         self.responsive = True;
         self.running = True;
-        self.timer = Timer(self.timeout_sec, self.handler);
-        self.timer.start();
-    
+        self.timer.start(self.timeout_sec);
+
     def defaultHandler(self):
-        rospy.loginfo('Haven\'t received a clear on \'' + self.clearTopic + '\' topic');
+        rospy.loginfo('Haven\'t received a clear on \'' + str(self.clearTopic) + '\' topic');
         self.responsive = False;
-        
+
     def isResponsive(self):
         if(self.running):
             return self.responsive
         else:
             raise RuntimeError("responsiveness cannot be determined while the watchdog is not running");
-    
+
     def isRunning(self):
         return self.running;
-        
+
 class WatchdogClearer:
     """Publishes watchdog timer clears over a topic.
-    """    
-    def __init__(self, clearTopic, timeBetweenClears_sec):
+    """
+    def __init__(self, clearTopic, timeBetweenClears_sec, scheduler=None):
         self.clearTopic = clearTopic;
         self.timeBetweenClears_sec = timeBetweenClears_sec;
         self.publisher = rospy.Publisher(self.clearTopic, Empty, queue_size=10);
 
-        self.timer = Timer(self.timeBetweenClears_sec, self.clearWatchdog);
-        self.timer.start();
-    
+        scheduler = scheduler if scheduler is not None else getDefaultScheduler();
+        self.timer = scheduler.createTimer(self.clearWatchdog, period=self.timeBetweenClears_sec);
+        self.timer.start(self.timeBetweenClears_sec);
+
     def clearWatchdog(self):
-        self.timer.cancel();
         self.publisher.publish(Empty()); #clear watchdog
-        self.timer = Timer(self.timeBetweenClears_sec, self.clearWatchdog); #schedule next clear
-        self.timer.start();
-    
+
     def stop(self):
         self.timer.cancel();
         rospy.loginfo('Stopping publishing clears');
-        
+
     def restart(self):
         rospy.loginfo('Restarting publishing clears');
-        self.timer = Timer(self.timeBetweenClears_sec, self.clearWatchdog);
-        self.timer.start();
+        self.timer.start(self.timeBetweenClears_sec);
+
+class HeartbeatPublisher:
+    """Publishes heartbeats for any number of devices over a single topic, and
+    echoes the pings of the HeartbeatMonitor for them.
+    """
+    def __init__(self, heartbeatTopic, devices, timeBetweenHeartbeats_sec, scheduler=None):
+        self.heartbeatTopic = heartbeatTopic;
+        self.devices = list(devices);
+        self.timeBetweenHeartbeats_sec = timeBetweenHeartbeats_sec;
+        self.publisher = rospy.Publisher(self.heartbeatTopic, Heartbeat, queue_size=10*len(self.devices));
+        self.sequences = dict((device, 0) for device in self.devices);
+        self.echoPublisher = rospy.Publisher(self.heartbeatTopic + '/echo', Heartbeat, queue_size=10*len(self.devices));
+        self.pingSubscriber = rospy.Subscriber(self.heartbeatTopic + '/ping', Heartbeat, self.onPing);
+
+        scheduler = scheduler if scheduler is not None else getDefaultScheduler();
+        self.timer = scheduler.createTimer(self.publishHeartbeats, period=self.timeBetweenHeartbeats_sec);
+        self.timer.start(self.timeBetweenHeartbeats_sec);
+
+    def publishHeartbeats(self):
+        stamp = rospy.Time.now();
+        for device in self.devices:
+            self.publisher.publish(Heartbeat(device=device, sequence=self.sequences[device], stamp=stamp));
+            self.sequences[device] = (self.sequences[device] + 1) % 2**32;
+
+    def onPing(self, ping):
+        if(ping.device in self.devices):
+            self.echoPublisher.publish(ping); #unchanged: the stamp is the monitor's
+
+    def stop(self):
+        self.timer.cancel();
+        rospy.loginfo('Stopping publishing heartbeats');
+
+    def restart(self):
+        rospy.loginfo('Restarting publishing heartbeats');
+        self.timer.start(self.timeBetweenHeartbeats_sec);
+
+class HeartbeatMonitor:
+    """Listens for the heartbeats of many devices over a single topic, keeps a
+    Watchdog for each of them, pings them every timeBetweenPings_sec to
+    measure the round-trip time, and periodically publishes their link
+    statistics (if statisticsTopic is not None).
+    """
+    def __init__(self, heartbeatTopic, timeout_sec, devices=(), userHandler=None,
+                 statisticsTopic='heartbeat_statistics', timeBetweenStatistics_sec=1.0,
+                 timeBetweenPings_sec=1.0, scheduler=None):
+        """
+        :param devices: devices to monitor from the start (others are
+        monitored from their first heartbeat)
+        :param userHandler: called with the name of the device when one of
+        the watchdogs times out
+        """
+        self.heartbeatTopic = heartbeatTopic;
+        self.timeout_sec = timeout_sec;
+        self.userHandler = userHandler;
+        self.scheduler = scheduler if scheduler is not None else getDefaultScheduler();
+
+        self.watchdogs = {};
+        self._lock = threading.Lock();
+        for device in devices:
+            self.watchdog(device);
+
+        self.subscriber = rospy.Subscriber(self.heartbeatTopic, Heartbeat, self.onHeartbeat);
+        self.echoSubscriber = rospy.Subscriber(self.heartbeatTopic + '/echo', Heartbeat, self.onEcho);
+        self.pingPublisher = rospy.Publisher(self.heartbeatTopic + '/ping', Heartbeat, queue_size=10);
+        self.pingSequence = 0;
+        self.pingTimer = self.scheduler.createTimer(self.ping, period=timeBetweenPings_sec);
+        self.pingTimer.start(timeBetweenPings_sec);
+        self.statisticsPublisher = None;
+        if(statisticsTopic is not None):
+            self.statisticsPublisher = rospy.Publisher(statisticsTopic, HeartbeatStatistics, queue_size=10);
+            self.statisticsTimer = self.scheduler.createTimer(self.publishStatistics, period=timeBetweenStatistics_sec);
+            self.statisticsTimer.start(timeBetweenStatistics_sec);
+
+    def watchdog(self, device):
+        """Returns the watchdog of a device (created if necessary).
+        """
+        with self._lock:
+            if(device not in self.watchdogs):
+                handler = None;
+                if(self.userHandler is not None):
+                    handler = lambda: self.userHandler(device);
+                watchdog = Watchdog(None, self.timeout_sec, handler, self.scheduler);
+                watchdog.clearTopic = self.heartbeatTopic + '[' + device + ']';
+                self.watchdogs[device] = watchdog;
+            return self.watchdogs[device];
+
+    def onHeartbeat(self, heartbeat):
+        self.watchdog(heartbeat.device).onHeartbeat(heartbeat);
+
+    def ping(self):
+        stamp = rospy.Time.now();
+        for device in list(self.watchdogs.keys()):
+            self.pingPublisher.publish(Heartbeat(device=device, sequence=self.pingSequence, stamp=stamp));
+        self.pingSequence = (self.pingSequence + 1) % 2**32;
+
+    def onEcho(self, echo):
+        with self._lock:
+            watchdog = self.watchdogs.get(echo.device);
+        if(watchdog is not None):
+            watchdog.statistics.updateRoundTrip((rospy.Time.now() - echo.stamp).to_sec());
+
+    def isResponsive(self, device):
+        return self.watchdog(device).isResponsive();
+
+    def publishStatistics(self):
+        for device, watchdog in list(self.watchdogs.items()):
+            statistics = watchdog.statistics;
+            message = HeartbeatStatistics();
+            message.device = device;
+            message.responsive = watchdog.isRunning() and watchdog.responsive;
+            message.received = statistics.received;
+            message.lost = statistics.lost;
+            message.loss_rate = statistics.lossRate();
+            message.round_trip_time = statistics.roundTripTime;
+            message.mean_round_trip_time = statistics.meanRoundTripTime;
+            message.max_round_trip_time = statistics.maxRoundTripTime;
+            message.jitter = statistics.jitter;
+            self.statisticsPublisher.publish(message);
+
+    def stop(self):
+        self.pingTimer.cancel();
+        if(self.statisticsPublisher is not None):
+            self.statisticsTimer.cancel();
+        for watchdog in self.watchdogs.values():
+            watchdog.stop();
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Builds words from the fiducial markers (chilitags) of letter cards, when the
+'GO' card is shown.
+
+The detector keeps an index of the last time each tag was seen (with its pose
+and whether it was facing the camera), updated as detections arrive, so
+building a word is a lookup in that index. It doesn't depend on ROS: times are
+given in seconds by the caller.
+"""
+
+special_tags = {'tag_17':'test',
+                'tag_302':'stop',
+                'tag_300':'next',
+                'tag_301':'prev',
+                'tag_430':'help',
+                'tag_341':'go'
+                }
+
+tags_words_mapping = {'tag_5':'cow',
+                      'tag_6':'son',
+                      'tag_7':'cue',
+                      'tag_8':'new',
+                      'tag_9':'use',
+                      'tag_10':'cou',
+                      'tag_11':'son',
+                      'tag_12':'ces',
+                      'tag_13':'une', # no tag_14: too many false positives!
+                      'tag_15':'nos',
+                      'tag_16':'ose',
+                      'tag_18':'eau'
+                      }
+
+tags_letters_mapping = {}
+
+#tags_words_mapping.update(special_tags)
+
+# Add individual letters: tag IDs are the ASCII code of the letter
+for char in range(ord('a'),ord('z') + 1):
+    tags_letters_mapping["tag_%d" % char] = chr(char)
+
+GO_TAG = 'tag_341'
+
+def invertTransform(translation, rotation):
+    """Inverse of the transform (translation, rotation quaternion [x,y,z,w]),
+    as tf's lookupTransform in the other direction would return it.
+    """
+    x, y, z, w = rotation
+    inverseRotation = (-x, -y, -z, w)
+
+    #rotate -translation by the inverse rotation (v' = v + 2w(u x v) + 2u x (u x v))
+    vx, vy, vz = -translation[0], -translation[1], -translation[2]
+    ux, uy, uz = -x, -y, -z
+    cx = uy*vz - uz*vy; cy = uz*vx - ux*vz; cz = ux*vy - uy*vx
+    ccx = uy*cz - uz*cy; ccy = uz*cx - ux*cz; ccz = ux*cy - uy*cx
+    inverseTranslation = (vx + 2*(w*cx + ccx), vy + 2*(w*cy + ccy), vz + 2*(w*cz + ccz))
+    return inverseTranslation, inverseRotation
+
+class TagSighting:
+    """Last time a tag was seen, and its pose (the camera in the tag's frame).
+    """
+    __slots__ = ['stamp', 'translation', 'rotation', 'facing']
+
+    def __init__(self, stamp, translation, rotation):
+        self.stamp = stamp
+        self.translation = translation
+        self.rotation = rotation
+        self.facing = not (rotation[2] - rotation[3] > 0)
+
+class WordCardDetector:
+
+    def __init__(self, maxTagAge=0.3, goCardTimeout=1.0, lettersMapping=None):
+        """
+        :param maxTagAge: how recently (in seconds) a letter must have been
+        seen to be part of the word
+        :param goCardTimeout: time (in seconds) during which the 'GO' card is
+        ignored after it triggered a word (it's not likely to get two words
+        within that time)
+        """
+        self.maxTagAge = maxTagAge
+        self.goCardTimeout = goCardTimeout
+        self.lettersMapping = lettersMapping if lettersMapping is not None else tags_letters_mapping
+
+        self.lastSeen = {} # tag -> TagSighting
+        self.lastGo = None
+        self.prevWord = ''
+
+    def onTagDetected(self, tag, translation, rotation, stamp):
+        """Records a detection of a tag, given as the transform from the camera
+        frame to the tag's frame.
+
+        :returns: True if it was the 'GO' card and a word should be built
+        (with buildWord()) now.
+        """
+        if tag == GO_TAG:
+            if self.lastGo is not None and stamp - self.lastGo < self.goCardTimeout:
+                return False
+            self.lastGo = stamp
+            return True
+
+        if tag in self.lettersMapping:
+            translation, rotation = invertTransform(translation, rotation)
+            self.lastSeen[tag] = TagSighting(stamp, translation, rotation)
+        return False
+
+    def buildWord(self, now):
+        """The letters seen (and facing the camera) at most maxTagAge seconds
+        before now, sorted from left to right in the camera's view.
+
+        :returns: the word, or '' if no letter has been seen
+        """
+        lettersDetected = []
+        for tag, sighting in self.lastSeen.items():
+            if now - sighting.stamp < self.maxTagAge and sighting.facing:
+                lettersDetected.append((self.lettersMapping[tag], sighting.translation[0]))
+
+        lettersDetected.sort(key=lambda letter: -letter[1])
+        return ''.join([l for l, _ in lettersDetected])
+
+    def isNewWord(self, word):
+        """Whether a word should be published, i.e. it is not the word which
+        has just been published (or part thereof). Remembers it if so.
+        """
+        if word in self.prevWord:
+            return False
+        self.prevWord = word
+        return True
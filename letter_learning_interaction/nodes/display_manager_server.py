@@ -1,11 +1,71 @@
 #!/usr/bin/env python
 from letter_learning_interaction.srv import *
+from letter_learning_interaction.msg import DisplayState, DisplayStateChange
+import itertools
+import time
+import numpy
 import rospy
 from letter_learning_interaction.shape_display_manager import ShapeDisplayManager
 
+# ------------------------------------------------------- STATE REPLICATION
+# The state of the display is published (as a latched snapshot and as changes)
+# so that other nodes can keep a local replica to answer read-only queries.
+# The version restarts from 0 with the server, so it comes with the epoch (the
+# server's start time) for replicas to tell a restart from a missed change.
+stateEpoch = None;
+stateVersion = 0;
+
+def cellStates(cells):
+    shapes = shapeDisplayManager.shapesDrawn.reshape(-1, 2)[cells];
+    shapes = numpy.where(numpy.isnan(shapes), -1, shapes).astype(int);
+    return shapes[:,0].tolist(), shapes[:,1].tolist()
+
+def makeStateMessage():
+    state = DisplayState();
+    state.epoch = stateEpoch;
+    state.version = stateVersion;
+    state.num_rows = shapeDisplayManager.numRows;
+    state.num_cols = shapeDisplayManager.numCols;
+    state.num_shape_types = len(shapeDisplayManager.positionLists);
+    [state.shape_type_code, state.shape_id] = cellStates(range(shapeDisplayManager.numRows*shapeDisplayManager.numCols));
+    return state;
+
+def publishChanges():
+    #must be called with the display manager's lock held for writing, so that
+    #changes are published in the order they are made
+    global stateVersion
+    [cleared, cells] = shapeDisplayManager.takeChanges();
+    if(not cleared and len(cells) == 0):
+        return;
+    stateVersion += 1;
+
+    change = DisplayStateChange();
+    change.epoch = stateEpoch;
+    change.version = stateVersion;
+    change.cleared = cleared;
+    change.cells = cells;
+    [change.shape_type_code, change.shape_id] = cellStates(cells);
+    pub_state_changes.publish(change);
+    pub_state.publish(makeStateMessage());
+
+# ---------------------------------------------------------------- SERVICES
+# rospy handles each request in its own thread: changes to the display and the
+# publication of those changes are made atomic by holding the display 
+# manager's lock for writing.
+
+#log one request out of logRequestsEvery (never if 0)
+logRequestsEvery = 0;
+requestCounter = itertools.count();
+def logRequest():
+    return logRequestsEvery > 0 and next(requestCounter) % logRequestsEvery == 0;
+
+
 def handle_clear_all_shapes(request):
-    shapeDisplayManager.clearAllShapes();
-    rospy.loginfo('Shapes cleared');
+    with shapeDisplayManager.lock.writing():
+        shapeDisplayManager.clearAllShapes();
+        publishChanges();
+    if(logRequest()):
+        rospy.loginfo('Shapes cleared');
     response = clearAllShapesResponse();
     response.success.data = True; #probably not necessary
     return response;
@@ -13,49 +73,113 @@ def handle_clear_all_shapes(request):
 def handle_display_new_shape(request):
     response = displayNewShapeResponse();
 
-    location = shapeDisplayManager.displayNewShape(request.shape_type_code);
+    with shapeDisplayManager.lock.writing():
+        location = shapeDisplayManager.displayNewShape(request.shape_type_code);
+        publishChanges();
     response.location.x = location[0];
     response.location.y = location[1];
     
-    rospy.loginfo('Shape added at '+str(location));
+    if(logRequest()):
+        rospy.loginfo('Shape added at '+str(location));
     return response;
 
 def handle_index_of_location(request):
     response = indexOfLocationResponse();
     location = [request.location.x, request.location.y];
     [response.row, response.column] = shapeDisplayManager.indexOfLocation(location);
-    rospy.loginfo('Index returned: ' + str(response.row) + ', ' + str(response.column));
+    if(logRequest()):
+        rospy.loginfo('Index returned: ' + str(response.row) + ', ' + str(response.column));
     return response;  
     
 def handle_shape_at_location(request):
     response = shapeAtLocationResponse();
     location = [request.location.x, request.location.y];
     [response.shape_type_code, response.shape_id] = shapeDisplayManager.shapeAtLocation(location);
-    rospy.loginfo('Shape at location returned: '+str(response.shape_type_code)+'_'+str(response.shape_id));
+    if(logRequest()):
+        rospy.loginfo('Shape at location returned: '+str(response.shape_type_code)+'_'+str(response.shape_id));
     return response;
     
 def handle_closest_shapes_to_location(request):
     response = closestShapesToLocationResponse();
     location = [request.location.x, request.location.y];
     [response.shape_type_code, response.shape_id] = shapeDisplayManager.closestShapesToLocation(location);
-    rospy.loginfo('Closest shape(s) to location returned: '+str(response.shape_type_code)+'_'+str(response.shape_id));
+    if(logRequest()):
+        rospy.loginfo('Closest shape(s) to location returned: '+str(response.shape_type_code)+'_'+str(response.shape_id));
     return response;
 
 def handle_possible_to_display(request):
     response = isPossibleToDisplayNewShapeResponse();
     response.is_possible.data = shapeDisplayManager.isPossibleToDisplayNewShape(request.shape_type_code);
-    rospy.loginfo('If possible returned '+str(response.is_possible.data));
+    if(logRequest()):
+        rospy.loginfo('If possible returned '+str(response.is_possible.data));
     return response;
 
 def handle_display_shape_at_location(request):
     response = displayShapeAtLocationResponse();
     location = [request.location.x, request.location.y];
-    response.success.data = shapeDisplayManager.displayShapeAtLocation(request.shape_type_code, location);
-    rospy.loginfo('Shape added at :' +str(location))
+    with shapeDisplayManager.lock.writing():
+        response.success.data = shapeDisplayManager.displayShapeAtLocation(request.shape_type_code, location);
+        publishChanges();
+    if(logRequest()):
+        rospy.loginfo('Shape added at :' +str(location))
+    return response;
+    
+# ------------------------------------------------------------- BATCH QUERIES
+def locationsOfRequest(request):
+    return [[location.x, location.y] for location in request.locations];
+
+def handle_indexes_of_locations(request):
+    response = indexesOfLocationsResponse();
+    [rows, columns] = shapeDisplayManager.indexesOfLocations(locationsOfRequest(request));
+    response.row = rows.tolist();
+    response.column = columns.tolist();
+    if(logRequest()):
+        rospy.loginfo('Indexes returned for '+str(len(request.locations))+' locations');
+    return response;
+
+def handle_shapes_at_locations(request):
+    response = shapesAtLocationsResponse();
+    [shapeType_codes, shapeIDs] = shapeDisplayManager.shapesAtLocations(locationsOfRequest(request));
+    response.shape_type_code = shapeType_codes.tolist();
+    response.shape_id = shapeIDs.tolist();
+    if(logRequest()):
+        rospy.loginfo('Shapes at '+str(len(request.locations))+' locations returned');
+    return response;
+
+def handle_closest_shapes_to_locations(request):
+    response = closestShapesToLocationsResponse();
+    [shapeType_codes, shapeIDs] = shapeDisplayManager.closestShapesToLocations(locationsOfRequest(request));
+    for locationShapeType_codes, locationShapeIDs in zip(shapeType_codes, shapeIDs):
+        response.shape_type_code.extend([int(code) for code in locationShapeType_codes]);
+        response.shape_id.extend([int(shapeID) for shapeID in locationShapeIDs]);
+        response.num_shapes.append(len(locationShapeIDs));
+    if(logRequest()):
+        rospy.loginfo('Closest shape(s) to '+str(len(request.locations))+' locations returned');
+    return response;
+
+def handle_display_shapes_at_locations(request):
+    response = displayShapesAtLocationsResponse();
+    with shapeDisplayManager.lock.writing():
+        response.success = shapeDisplayManager.displayShapesAtLocations(request.shape_type_code, locationsOfRequest(request));
+        publishChanges();
+    if(logRequest()):
+        rospy.loginfo(str(sum(response.success))+' shapes added');
     return response;
     
 def display_manager_server():
+    global shapeDisplayManager, pub_state, pub_state_changes, logRequestsEvery, stateEpoch
     rospy.init_node('display_manager_server')
+    stateEpoch = rospy.Time.from_sec(time.time()); #wall-clock time: distinct across restarts, even with simulated time
+    logRequestsEvery = rospy.get_param('~log_requests_every', 0);
+    #dimensions of the display grid and number of shape types it can position
+    shapeDisplayManager = ShapeDisplayManager(rospy.get_param('~num_rows', 3),
+                                              rospy.get_param('~num_cols', 5),
+                                              numShapeTypes=rospy.get_param('~num_shape_types', None));
+    shapeDisplayManager.takeChanges(); #the initial state is in the first snapshot
+
+    pub_state = rospy.Publisher('display_state', DisplayState, queue_size=1, latch=True);
+    pub_state_changes = rospy.Publisher('display_state_changes', DisplayStateChange, queue_size=50);
+    pub_state.publish(makeStateMessage());
     clear_service = rospy.Service('clear_all_shapes', clearAllShapes, handle_clear_all_shapes)
     rospy.loginfo("Ready to clear all shapes.");
     
@@ -76,10 +200,16 @@ def display_manager_server():
     
     possible_to_display_service = rospy.Service('possible_to_display_shape', isPossibleToDisplayNewShape, handle_possible_to_display)
     rospy.loginfo("Ready to determine is shape fits.");
+
+    indexes_of_locations_service = rospy.Service('indexes_of_locations', indexesOfLocations, handle_indexes_of_locations)
+    shapes_at_locations_service = rospy.Service('shapes_at_locations', shapesAtLocations, handle_shapes_at_locations)
+    closest_shapes_to_locations_service = rospy.Service('closest_shapes_to_locations', closestShapesToLocations, handle_closest_shapes_to_locations)
+    display_shapes_at_locations_service = rospy.Service('display_shapes_at_locations', displayShapesAtLocations, handle_display_shapes_at_locations)
+    rospy.loginfo("Ready to answer batch queries.");
     rospy.spin()
 
 if __name__ == "__main__":
-    shapeDisplayManager = ShapeDisplayManager();
+    shapeDisplayManager = None;
     
     display_manager_server()
     rospy.loginfo('shut down');
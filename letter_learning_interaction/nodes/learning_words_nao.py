@@ -8,15 +8,9 @@ receives interaction inputs e.g. which words to write and user demonstrations,
 passes these demonstrations to the learning algorithm, and publishes the 
 resulting learned shapes for the robot and tablet to draw.
 """
+import os
 import numpy
-from scipy import interpolate
-
-from letter_learning_interaction.interaction_settings import InteractionSettings
-
-from shape_learning.shape_learner_manager import ShapeLearnerManager
-from shape_learning.shape_modeler import ShapeModeler #for normaliseShapeHeight()
-
-from letter_learning_interaction.text_shaper import TextShaper, ScreenManager
+from copy import deepcopy
 
 import rospy
 from nav_msgs.msg import Path
@@ -24,71 +18,35 @@ from geometry_msgs.msg import PoseStamped, Point, PointStamped
 from std_msgs.msg import String, Empty, Bool, Float64MultiArray, MultiArrayDimension
 from letter_learning_interaction.msg import Shape as ShapeMsg
 
+from letter_learning_interaction.interaction_settings import InteractionSettings
 from letter_learning_interaction.state_machine import StateMachine
-from copy import deepcopy
-
-rospy.init_node("learning_words_nao")
-
-
-# -- interaction config parameters come from launch file
-
-#Nao parameters
-NAO_IP = rospy.get_param('~nao_ip','127.0.0.1') #default behaviour is to connect to simulator locally
-naoSpeaking = rospy.get_param('~nao_speaking',True) #whether or not the robot should speak
-naoWriting = rospy.get_param('~nao_writing',True) #whether or not the robot should move its arms
-naoStanding = rospy.get_param('~nao_standing', True) #whether or not the robot should stand or rest on its knies 
-naoConnected = rospy.get_param('~use_robot_in_interaction',True) #whether or not the robot is being used for the interaction (looking, etc.)
-naoWriting = naoWriting and naoConnected #use naoConnected var as the stronger property
-naoSpeaking = naoSpeaking and naoConnected
-
-LANGUAGE = rospy.get_param('~language','english')
+from letter_learning_interaction.tracing import Tracer, traceNode, newTraceId
+from letter_learning_interaction.sampling_profiler import profileNode
+from letter_learning_interaction.trajectory_cache import TrajectoryCache
+from letter_learning_interaction.text_shaper import ShapedWord, scipyInterpolate, shapeModeler
+from letter_learning_interaction import input_journal
+
+#scipy and shape_learning are slow to import: they are imported when first
+#used (see text_shaper's accessors). Importing this module has no
+#side effect: the node is set up by configure() (parameters, publishers,
+#tracing) and main.
+
+#spans of each turn, traced from the input which started it (see tracing.py)
+tracer = Tracer('learning_words_nao') #disabled until configured
+wordTraceId = '' #of the last word received
+turnTraceId = '' #of the input the robot is currently responding to
+trajectoryPublishedTime = None
+profiler = None #started on demand via ~set_profiling, once configured
+speech = None #what the robot says things with: its ALTextToSpeech proxy, or a SpeechCache of it
+trajectoryCache = TrajectoryCache(0) #trajectories of the words written (see trajectory_cache.py), disabled until configured
+inputJournal = None #where the inputs received are recorded (see input_journal.py), if anywhere
+wordManager = None #passes feedback to the shape learners and keeps history of words learnt, once created by main
 
 FRONT_INTERACTION = True
 
-NAO_HANDEDNESS = rospy.get_param('~nao_handedness','right')
-
-if NAO_HANDEDNESS.lower()=='right':
-    effector = "RArm"
-elif NAO_HANDEDNESS.lower()=='left':
-    effector = "LArm"
-else: 
-    print ('error in handedness param')
-
-
-#shape params       
-FRAME = rospy.get_param('~writing_surface_frame_id','writing_surface')  #Frame ID to publish points in
-FEEDBACK_TOPIC = rospy.get_param('~shape_feedback_topic','shape_feedback') #Name of topic to receive feedback on
-SHAPE_TOPIC = rospy.get_param('~trajectory_output_topic','/write_traj') #Name of topic to publish shapes to
-BOUNDING_BOXES_TOPIC = rospy.get_param('~bounding_boxes_topic','/boxes_to_draw') #Name of topic to publish bounding boxes of letters to
-SHAPE_TOPIC_DOWNSAMPLED = rospy.get_param('~trajectory_output_nao_topic','/write_traj_downsampled') #Name of topic to publish shapes to
-
-SHAPE_LOGGING_PATH = rospy.get_param('~shape_log','') # path to a log file where all learning steps will be stored
-
-#tablet params        
-CLEAR_SURFACE_TOPIC = rospy.get_param('~clear_writing_surface_topic','clear_screen')
-SHAPE_FINISHED_TOPIC = rospy.get_param('~shape_writing_finished_topic','shape_finished')
-#Name of topic to get gestures representing the active shape for demonstration
-GESTURE_TOPIC = rospy.get_param('~gesture_info_topic','gesture_info');
-
-#interaction params
-WORDS_TOPIC = rospy.get_param('~words_to_write_topic','words_to_write')
-PROCESSED_USER_SHAPE_TOPIC = rospy.get_param('~processed_user_shape_topic','user_shapes_processed');#Listen for user shapes
-TEST_TOPIC = rospy.get_param('~test_request_topic','test_learning');#Listen for when test card has been shown to the robot
-STOP_TOPIC = rospy.get_param('~stop_request_topic','stop_learning');#Listen for when stop card has been shown to the robot
-NEW_CHILD_TOPIC = rospy.get_param('~new_teacher_topic','new_child');#Welcome a new teacher but don't reset learning algorithm's 'memory'
-personSide = rospy.get_param('~person_side', NAO_HANDEDNESS.lower()) #side where person is (left/right)
-PUBLISH_STATUS_TOPIC = rospy.get_param('~camera_publishing_status_topic','camera_publishing_status') #Controls the camera based on the interaction state (turn it off for writing b/c CPU gets maxed)
-
 alternateSidesLookingAt = False #if true, nao will look to a different side each time. (not super tested)
-global nextSideToLookAt
 nextSideToLookAt = 'Right'
 
-
-# -- technical parameters come from the interaction_settings module
-
-#initialise arrays of phrases to say at relevant times
-introPhrase, demo_response_phrases, asking_phrases_after_feedback, asking_phrases_after_word, word_response_phrases, word_again_response_phrases, testPhrase, thankYouPhrase = InteractionSettings.getPhrases(LANGUAGE)
-
 demo_response_phrases_counter = 0
 asking_phrases_after_feedback_counter = 0
 asking_phrases_after_word_counter = 0
@@ -98,19 +56,112 @@ word_again_response_phrases_counter = 0
 #get appropriate angles for looking at things
 headAngles_lookAtTablet_down, headAngles_lookAtTablet_right, headAngles_lookAtTablet_left, headAngles_lookAtPerson_front, headAngles_lookAtPerson_right, headAngles_lookAtPerson_left = InteractionSettings.getHeadAngles()
 
-#trajectory publishing parameters
-t0, dt, delayBeforeExecuting = InteractionSettings.getTrajectoryTimings(naoWriting)
 NUMDESIREDSHAPEPOINTS = 7.0;#Number of points to downsample the length of shapes to 
 NUMPOINTS_SHAPEMODELER = 70 #Number of points used by ShapeModelers (@todo this could vary for each letter)
 DOWNSAMPLEFACTOR = float(NUMPOINTS_SHAPEMODELER-1)/float(NUMDESIREDSHAPEPOINTS-1)
 
 drawingLetterSubstates = ['WAITING_FOR_ROBOT_TO_CONNECT', 'WAITING_FOR_TABLET_TO_CONNECT', 'PUBLISHING_LETTER']
 
-pub_camera_status = rospy.Publisher(PUBLISH_STATUS_TOPIC,Bool, queue_size=10)
-pub_traj = rospy.Publisher(SHAPE_TOPIC, Path, queue_size=10)
-pub_bounding_boxes = rospy.Publisher(BOUNDING_BOXES_TOPIC, Float64MultiArray, queue_size=10)
-pub_traj_downsampled = rospy.Publisher(SHAPE_TOPIC_DOWNSAMPLED, Path, queue_size=10)
-pub_clear = rospy.Publisher(CLEAR_SURFACE_TOPIC, Empty, queue_size=10)
+
+def configure():
+    """Reads the node's parameters, and creates its publishers, tracer and
+    profiler (after rospy.init_node).
+    """
+    global tracer, profiler, trajectoryCache, inputJournal
+    global NAO_IP, naoSpeaking, naoWriting, naoStanding, naoConnected, LANGUAGE, NAO_HANDEDNESS, effector
+    global FRAME, FEEDBACK_TOPIC, SHAPE_TOPIC, BOUNDING_BOXES_TOPIC, SHAPE_TOPIC_DOWNSAMPLED, SHAPE_LOGGING_PATH
+    global CLEAR_SURFACE_TOPIC, SHAPE_FINISHED_TOPIC, GESTURE_TOPIC
+    global WORDS_TOPIC, PROCESSED_USER_SHAPE_TOPIC, TEST_TOPIC, STOP_TOPIC, NEW_CHILD_TOPIC, personSide, PUBLISH_STATUS_TOPIC
+    global introPhrase, demo_response_phrases, asking_phrases_after_feedback, asking_phrases_after_word, word_response_phrases, word_again_response_phrases, testPhrase, thankYouPhrase
+    global t0, dt, delayBeforeExecuting
+    global SPEECH_CACHE_DIRECTORY, SPEECH_CACHE_INDEX, SPEECH_CACHE_WORKERS, SPEECH_CACHE_RENDERING, LEARNER_WORKERS
+    global pub_camera_status, pub_traj, pub_bounding_boxes, pub_traj_downsampled, pub_clear
+
+    tracer = traceNode('learning_words_nao')
+    profiler = profileNode('learning_words_nao')
+
+    # -- interaction config parameters come from launch file
+
+    #Nao parameters
+    NAO_IP = rospy.get_param('~nao_ip','127.0.0.1') #default behaviour is to connect to simulator locally
+    naoSpeaking = rospy.get_param('~nao_speaking',True) #whether or not the robot should speak
+    naoWriting = rospy.get_param('~nao_writing',True) #whether or not the robot should move its arms
+    naoStanding = rospy.get_param('~nao_standing', True) #whether or not the robot should stand or rest on its knies 
+    naoConnected = rospy.get_param('~use_robot_in_interaction',True) #whether or not the robot is being used for the interaction (looking, etc.)
+    naoWriting = naoWriting and naoConnected #use naoConnected var as the stronger property
+    naoSpeaking = naoSpeaking and naoConnected
+
+    LANGUAGE = rospy.get_param('~language','english')
+
+    NAO_HANDEDNESS = rospy.get_param('~nao_handedness','right')
+
+    if NAO_HANDEDNESS.lower()=='right':
+        effector = "RArm"
+    elif NAO_HANDEDNESS.lower()=='left':
+        effector = "LArm"
+    else: 
+        print ('error in handedness param')
+
+
+    #shape params       
+    FRAME = rospy.get_param('~writing_surface_frame_id','writing_surface')  #Frame ID to publish points in
+    FEEDBACK_TOPIC = rospy.get_param('~shape_feedback_topic','shape_feedback') #Name of topic to receive feedback on
+    SHAPE_TOPIC = rospy.get_param('~trajectory_output_topic','/write_traj') #Name of topic to publish shapes to
+    BOUNDING_BOXES_TOPIC = rospy.get_param('~bounding_boxes_topic','/boxes_to_draw') #Name of topic to publish bounding boxes of letters to
+    SHAPE_TOPIC_DOWNSAMPLED = rospy.get_param('~trajectory_output_nao_topic','/write_traj_downsampled') #Name of topic to publish shapes to
+
+    SHAPE_LOGGING_PATH = rospy.get_param('~shape_log','') # path to a log file where all learning steps will be stored
+
+    #tablet params        
+    CLEAR_SURFACE_TOPIC = rospy.get_param('~clear_writing_surface_topic','clear_screen')
+    SHAPE_FINISHED_TOPIC = rospy.get_param('~shape_writing_finished_topic','shape_finished')
+    #Name of topic to get gestures representing the active shape for demonstration
+    GESTURE_TOPIC = rospy.get_param('~gesture_info_topic','gesture_info');
+
+    #interaction params
+    WORDS_TOPIC = rospy.get_param('~words_to_write_topic','words_to_write')
+    PROCESSED_USER_SHAPE_TOPIC = rospy.get_param('~processed_user_shape_topic','user_shapes_processed');#Listen for user shapes
+    TEST_TOPIC = rospy.get_param('~test_request_topic','test_learning');#Listen for when test card has been shown to the robot
+    STOP_TOPIC = rospy.get_param('~stop_request_topic','stop_learning');#Listen for when stop card has been shown to the robot
+    NEW_CHILD_TOPIC = rospy.get_param('~new_teacher_topic','new_child');#Welcome a new teacher but don't reset learning algorithm's 'memory'
+    personSide = rospy.get_param('~person_side', NAO_HANDEDNESS.lower()) #side where person is (left/right)
+    PUBLISH_STATUS_TOPIC = rospy.get_param('~camera_publishing_status_topic','camera_publishing_status') #Controls the camera based on the interaction state (turn it off for writing b/c CPU gets maxed)
+
+    #speech params (see speech_cache.py)
+    SPEECH_CACHE_DIRECTORY = rospy.get_param('~speech_cache_directory','') #directory of the pre-synthesized phrases, on the robot (none: always synthesize live)
+    SPEECH_CACHE_INDEX = rospy.get_param('~speech_cache_index','~/.ros/speech_cache.json') #index of the phrases already synthesized, locally
+    SPEECH_CACHE_WORKERS = rospy.get_param('~speech_cache_workers',2) #number of phrases synthesized at once
+    SPEECH_CACHE_RENDERING = rospy.get_param('~speech_cache_rendering','background') #synthesize the missing phrases at startup, in the 'background' or not ('none', e.g. when done offline)
+
+
+    # -- technical parameters come from the interaction_settings module
+
+    #initialise arrays of phrases to say at relevant times
+    introPhrase, demo_response_phrases, asking_phrases_after_feedback, asking_phrases_after_word, word_response_phrases, word_again_response_phrases, testPhrase, thankYouPhrase = InteractionSettings.getPhrases(LANGUAGE)
+
+    #trajectory publishing parameters
+    t0, dt, delayBeforeExecuting = InteractionSettings.getTrajectoryTimings(naoWriting)
+    trajectoryCache = TrajectoryCache(rospy.get_param('~trajectory_cache_size', 32)) #number of words whose trajectories are kept (0: none)
+    LEARNER_WORKERS = rospy.get_param('~learner_workers', 0) #number of shape learners built at once for a new word, in threads (see shape_learner_pool.py; 0: one after the other)
+
+    INPUT_JOURNAL = rospy.get_param('~input_journal','') #file to record the inputs received to, for replayJournal.py (none: not recorded)
+    if INPUT_JOURNAL:
+        #what the replay needs to behave as this session
+        parameters = {'language': LANGUAGE, 'nao_writing': naoWriting, 'nao_speaking': naoSpeaking,
+                      'nao_standing': naoStanding, 'nao_handedness': NAO_HANDEDNESS, 'person_side': personSide,
+                      'dataset_directory': rospy.get_param('~dataset_directory','default'),
+                      'trajectory_cache_size': trajectoryCache.capacity}
+        startTime = rospy.get_time()
+        inputJournal = input_journal.InputJournal(os.path.expanduser(INPUT_JOURNAL),
+                                                  {'node': rospy.get_name(), 'start_time': startTime, 'parameters': parameters}, startTime)
+        rospy.on_shutdown(inputJournal.close)
+        rospy.loginfo('Recording the inputs to ' + inputJournal.path)
+
+    pub_camera_status = rospy.Publisher(PUBLISH_STATUS_TOPIC,Bool, queue_size=10)
+    pub_traj = rospy.Publisher(SHAPE_TOPIC, Path, queue_size=10)
+    pub_bounding_boxes = rospy.Publisher(BOUNDING_BOXES_TOPIC, Float64MultiArray, queue_size=10)
+    pub_traj_downsampled = rospy.Publisher(SHAPE_TOPIC_DOWNSAMPLED, Path, queue_size=10)
+    pub_clear = rospy.Publisher(CLEAR_SURFACE_TOPIC, Empty, queue_size=10)
 
 
 
@@ -128,6 +179,9 @@ def onUserDrawnShapeReceived(shape):
     if(stateMachine.get_state() == "WAITING_FOR_FEEDBACK"
        or stateMachine.get_state() == "ASKING_FOR_FEEDBACK"):
 
+        receivedTime = tracer.now()
+        traceId = shape.trace_id or newTraceId()
+
         nbpts = len(shape.path)/2
         path = zip(shape.path[:nbpts], [-y for y in shape.path[nbpts:]])
         demo_from_template = screenManager.split_path_from_template(path)
@@ -139,7 +193,7 @@ def onUserDrawnShapeReceived(shape):
                 flatpath = [x for x, y in path]
                 flatpath.extend([-y for x, y in path])
 
-                demoShapesReceived.append(ShapeMsg(path=flatpath, shapeType=name))
+                demoShapesReceived.append(ShapeMsg(path=flatpath, shapeType=name, trace_id=traceId))
 
         else:
 
@@ -158,8 +212,11 @@ def onUserDrawnShapeReceived(shape):
                     rospy.logwarn('Received demonstration, but unable to find the letter that was demonstrated! Ignoring it.')
                     return
 
+            shape.trace_id = traceId
             demoShapesReceived = [shape] #replace any existing feedback with new
 
+        tracer.record('learning_words_nao/receive_demonstration', traceId, receivedTime, tracer.now(),
+                      letters="".join([s.shapeType for s in demoShapesReceived]))
     else:
         pass #ignore feedback
 
@@ -182,21 +239,24 @@ def onStopRequestReceived(message):
 def onClearScreenReceived(message):
     rospy.loginfo('Clearing display')
     try:
-        clear_all_shapes = rospy.ServiceProxy('clear_all_shapes', clearAllShapes)
-        resp1 = clear_all_shapes()
+        displayManager.clearAllShapes()
     except rospy.ServiceException, e:
         rospy.logerr("Service call failed: %s",e)
 
 wordReceived = None
 def onWordReceived(message):
-    global wordReceived 
+    global wordReceived, wordTraceId
     if(stateMachine.get_state() == "WAITING_FOR_FEEDBACK"
             or stateMachine.get_state() == "WAITING_FOR_WORD"
             or stateMachine.get_state() == "ASKING_FOR_FEEDBACK" 
             or stateMachine.get_state() == "STARTING_INTERACTION"
             or stateMachine.get_state() is None): #state machine hasn't started yet - word probably came from input arguments
         wordReceived = message.data
+        wordTraceId = newTraceId()
+        tracer.record('learning_words_nao/receive_word', wordTraceId, tracer.now(), tracer.now(), word=wordReceived)
         rospy.loginfo('Received word: '+wordReceived)
+        if LEARNER_WORKERS > 0 and wordManager is not None:
+            wordManager.prefetch(wordReceived) #build the learners of its letters while the robot gets to it
     else:
         wordReceived = None #ignore 
 
@@ -259,7 +319,7 @@ def respondToDemonstration(infoFromPrevState):
         demo_response_phrases_counter += 1
         if demo_response_phrases_counter==len(demo_response_phrases):
             demo_response_phrases_counter = 0
-        textToSpeech.say(toSay)
+        speech.say(toSay)
         rospy.loginfo('NAO: '+toSay)
 
 
@@ -285,6 +345,8 @@ def respondToDemonstrationWithFullWord(infoFromPrevState):
     #print('------------------------------------------ RESPONDING_TO_DEMONSTRATION_FULL_WORD')
     rospy.loginfo("STATE: RESPONDING_TO_DEMONSTRATION_FULL_WORD")
     demoShapesReceived = infoFromPrevState['demoShapesReceived']
+    global turnTraceId
+    turnTraceId = demoShapesReceived[0].trace_id or newTraceId()
 
     letters = "".join([s.shapeType for s in demoShapesReceived])
     
@@ -297,7 +359,7 @@ def respondToDemonstrationWithFullWord(infoFromPrevState):
         demo_response_phrases_counter += 1
         if demo_response_phrases_counter==len(demo_response_phrases):
             demo_response_phrases_counter = 0
-        textToSpeech.say(toSay)
+        speech.say(toSay)
         rospy.loginfo('NAO: '+toSay)
 
 
@@ -309,7 +371,8 @@ def respondToDemonstrationWithFullWord(infoFromPrevState):
         glyph = downsampleShape(glyph)
         rospy.loginfo("Received demo for " + shapeName)
         shapeIndex = wordManager.currentCollection.index(shapeName)
-        wordManager.respondToDemonstration(shapeIndex, glyph)
+        with tracer.span('learning_words_nao/learn_demonstration', turnTraceId, letter=shapeName):
+            wordManager.respondToDemonstration(shapeIndex, glyph)
 
     # 2- display the update word
 
@@ -339,9 +402,7 @@ def publishShape(infoFromPrevState):
     shape = shapesToPublish.pop(0) #publish next remaining shape (and remove from list)
 
     try:
-        display_new_shape = rospy.ServiceProxy('display_new_shape', displayNewShape)
-        response = display_new_shape(shape_type_code = shape.shapeType_code)
-        shapeCentre = numpy.array([response.location.x, response.location.y])
+        shapeCentre = numpy.array(displayManager.displayNewShape(shape.shapeType_code))
     except rospy.ServiceException, e:
         print "Service call failed: %s"%e
 
@@ -371,17 +432,36 @@ def publishShape(infoFromPrevState):
 def publishWord(infoFromPrevState):
     #print('------------------------------------------ PUBLISHING_WORD')
     rospy.loginfo("STATE: PUBLISHING_WORD")
+    global trajectoryPublishedTime
+
+    #the trajectories only depend on the word, the current shapes of its letters and the layout
+    layout = (screenManager.width, screenManager.height, FRAME, t0, dt, DOWNSAMPLEFACTOR)
+    cacheKey = TrajectoryCache.key(wordManager.currentCollection, layout, wordManager.shapesOfCurrentCollection())
+    cached = trajectoryCache.get(cacheKey)
+    if cached is None:
+        with tracer.span('learning_words_nao/shape_word', turnTraceId):
+            shapedWord = textShaper.shapeWord(wordManager)
+            placedWord = screenManager.place_word(shapedWord)
+
+        with tracer.span('learning_words_nao/make_trajectories', turnTraceId):
+            points = trajectoryPoints(placedWord)
+
+            # downsampled the trajectory for the robot arm motion
+            downsampledShapedWord = deepcopy(placedWord)
+            downsampledShapedWord.downsample(DOWNSAMPLEFACTOR)
+            downsampledPoints = trajectoryPoints(downsampledShapedWord)
+        #arrays only: the messages and the word placed on screen are made anew on every use
+        trajectoryCache.put(cacheKey, ([numpy.array(path, dtype=float) for path in placedWord.get_letters_paths(absolute=False)],
+                                       points, downsampledPoints))
+    else:
+        with tracer.span('learning_words_nao/reuse_trajectories', turnTraceId):
+            paths, points, downsampledPoints = cached
+            placedWord = screenManager.place_word(ShapedWord(wordManager.currentCollection, paths)) #back on screen, for the demonstrations to be matched against
 
-    shapedWord = textShaper.shapeWord(wordManager)
-    placedWord = screenManager.place_word(shapedWord)
-
-    traj = make_traj_msg(placedWord, float(dt)/DOWNSAMPLEFACTOR)
-
-    # downsampled the trajectory for the robot arm motion
-    downsampledShapedWord = deepcopy(placedWord)
-    downsampledShapedWord.downsample(DOWNSAMPLEFACTOR)
-
-    downsampledTraj = make_traj_msg(downsampledShapedWord, dt)
+    with tracer.span('learning_words_nao/make_trajectory_messages', turnTraceId):
+        traj = make_traj_msg_from_points(points, float(dt)/DOWNSAMPLEFACTOR)
+        downsampledTraj = make_traj_msg_from_points(downsampledPoints, dt)
+        downsampledTraj.header.stamp = traj.header.stamp
 
     ###
     # Request the tablet to display the letters' and word's bounding boxes
@@ -397,8 +477,11 @@ def publishWord(infoFromPrevState):
     if naoConnected:
         lookAtTablet()
 
-    pub_traj_downsampled.publish(downsampledTraj)
-    pub_traj.publish(traj)
+    #the trajectories are identified in traces by their header's stamp (its other fields are in use)
+    with tracer.span('learning_words_nao/publish_trajectories', turnTraceId, trajectory_stamp=traj.header.stamp.to_sec()):
+        pub_traj_downsampled.publish(downsampledTraj)
+        pub_traj.publish(traj)
+    trajectoryPublishedTime = tracer.now()
 
     nextState = "WAITING_FOR_LETTER_TO_FINISH"
     infoForNextState = {'state_cameFrom':  "PUBLISHING_WORD",'state_goTo': ["ASKING_FOR_FEEDBACK"],'centre': trajStartPosition, 'wordWritten':infoFromPrevState['wordToWrite']}
@@ -406,8 +489,7 @@ def publishWord(infoFromPrevState):
     return nextState, infoForNextState
 
 
-infoToRestore_waitForShapeToFinish = rospy.Subscriber(SHAPE_FINISHED_TOPIC, String, onShapeFinished)
-global shape_finished_subscriber
+infoToRestore_waitForShapeToFinish = None
 def waitForShapeToFinish(infoFromPrevState):
     global infoToRestore_waitForShapeToFinish
     #FORWARDER STATE
@@ -424,6 +506,8 @@ def waitForShapeToFinish(infoFromPrevState):
     #once shape has finished
     global shapeFinished
     if shapeFinished:
+        if trajectoryPublishedTime is not None:
+            tracer.record('learning_words_nao/writing', turnTraceId, trajectoryPublishedTime, tracer.now())
         
         # draw the templates for the demonstrations
         ref_boundingboxes = screenManager.place_reference_boundingboxes(wordManager.currentCollection)
@@ -502,7 +586,7 @@ def respondToFeedback(infoFromPrevState):
             if naoSpeaking:
                 toSay = 'Ok, thanks for helping me'
                 rospy.loginfo('NAO: '+toSay)
-                textToSpeech.say(toSay)
+                speech.say(toSay)
             #pass feedback to shape manager
             response = wordManager.feedbackManager(shapeIndex_messageFor, bestShape_index, noNewShape)
             if response == -1:
@@ -513,7 +597,7 @@ def respondToFeedback(infoFromPrevState):
                 shape_messageFor = wordManager.shapeAtIndexInCurrentCollection(shapeIndex_messageFor)
                 toSay = 'Ok, I\'ll work on the '+shape_messageFor
                 rospy.loginfo('NAO: '+toSay)
-                textToSpeech.say(toSay)
+                speech.say(toSay)
 
             [numItersConverged, newShape] = wordManager.feedbackManager(shapeIndex_messageFor, bestShape_index, noNewShape)
 
@@ -542,8 +626,11 @@ def respondToNewWord(infoFromPrevState):
     #print('------------------------------------------ RESPONDING_TO_NEW_WORD')
     rospy.loginfo("STATE: RESPONDING_TO_NEW_WORD")
     global shapeFinished, wordManager #@TODO make class attribute 
+    global turnTraceId
     wordToLearn = infoFromPrevState['wordReceived']
-    wordSeenBefore = wordManager.newCollection(wordToLearn)
+    turnTraceId = wordTraceId
+    with tracer.span('learning_words_nao/build_learners', turnTraceId, word=wordToLearn):
+        wordSeenBefore = wordManager.newCollection(wordToLearn)
     if naoSpeaking:
         if wordSeenBefore:
             global word_again_response_phrases_counter
@@ -566,7 +653,7 @@ def respondToNewWord(infoFromPrevState):
                 word_response_phrases_counter = 0
 
         rospy.loginfo('NAO: '+toSay)
-        textToSpeech.say(toSay)   
+        speech.say(toSay)   
 
     #clear screen
     screenManager.clear()
@@ -575,9 +662,10 @@ def respondToNewWord(infoFromPrevState):
 
     #start learning    
     shapesToPublish = []   
-    for i in range(len(wordToLearn)):
-        shape = wordManager.startNextShapeLearner()
-        shapesToPublish.append(shape)
+    with tracer.span('learning_words_nao/start_learners', turnTraceId, word=wordToLearn):
+        for i in range(len(wordToLearn)):
+            shape = wordManager.startNextShapeLearner()
+            shapesToPublish.append(shape)
 
     nextState = 'PUBLISHING_WORD'
     infoForNextState = {'state_cameFrom': "RESPONDING_TO_NEW_WORD",'shapesToPublish': shapesToPublish,'wordToWrite': wordToLearn}
@@ -676,7 +764,7 @@ def respondToTestCard(infoFromPrevState):
     #print('------------------------------------------ RESPONDING_TO_TEST_CARD')
     rospy.loginfo("STATE: RESPONDING_TO_TEST_CARD")
     if naoSpeaking:
-        textToSpeech.say(testPhrase)
+        speech.say(testPhrase)
         rospy.loginfo("NAO: "+testPhrase)
     nextState = "WAITING_FOR_WORD"
     infoForNextState = {'state_cameFrom': "RESPONDING_TO_TEST_CARD"}
@@ -687,7 +775,7 @@ def stopInteraction(infoFromPrevState):
     #print('------------------------------------------ STOPPING')
     rospy.loginfo("STATE: STOPPING")
     if naoSpeaking:
-        textToSpeech.say(thankYouPhrase)  
+        speech.say(thankYouPhrase)  
     if naoConnected:
         motionProxy.wbEnableEffectorControl(effector,False)
         motionProxy.rest()
@@ -858,6 +946,9 @@ def downsampleShape(shape):
         x_shape = (x_shape.T).tolist()[0]
         y_shape = (y_shape.T).tolist()[0]
 
+    interpolate = scipyInterpolate()
+    ShapeModeler = shapeModeler() #for normaliseShapeHeight()
+
     #make shape have the same number of points as the shape_modeler
     t_current = numpy.linspace(0, 1, numPointsInShape)
     t_desired = numpy.linspace(0, 1, NUMPOINTS_SHAPEMODELER)
@@ -888,25 +979,29 @@ def make_bounding_box_msg(bbox, selected=False):
 
     return bb
 
+def trajectoryPoints(shapedWord):
+    """:returns: the points of the letters of the word, one after the other
+    (an array of x, y)"""
+    return numpy.array([point for path in shapedWord.get_letters_paths() for point in path], dtype=float).reshape((-1, 2))
+
 def make_traj_msg(shapedWord, deltaT):
+    return make_traj_msg_from_points(trajectoryPoints(shapedWord), deltaT)
+
+def make_traj_msg_from_points(points, deltaT):
 
     traj = Path()
     traj.header.frame_id = FRAME
     traj.header.stamp = rospy.Time.now() + rospy.Duration(delayBeforeExecuting)
 
-    pointIdx = 0
-    for path in shapedWord.get_letters_paths():
-        for x, y in path:
-            point = PoseStamped()
+    for pointIdx, (x, y) in enumerate(points.tolist()):
+        point = PoseStamped()
 
-            point.pose.position.x = x
-            point.pose.position.y = y
-            point.header.frame_id = FRAME
-            point.header.stamp = rospy.Time(t0 + pointIdx * deltaT) #@TODO allow for variable time between points for now
+        point.pose.position.x = x
+        point.pose.position.y = y
+        point.header.frame_id = FRAME
+        point.header.stamp = rospy.Time(t0 + pointIdx * deltaT) #@TODO allow for variable time between points for now
 
-            traj.poses.append(deepcopy(point))
-
-            pointIdx += 1
+        traj.poses.append(point)
 
     return traj
 
@@ -934,7 +1029,7 @@ def lookAndAskForFeedback(toSay,side):
             motionProxy.setAngles(["HeadYaw", "HeadPitch"],headAngles_lookAtPerson_left,0.2)
 
     if naoSpeaking:
-        textToSpeech.say(toSay)
+        speech.say(toSay)
         rospy.loginfo('NAO: '+toSay)
 
 
@@ -946,28 +1041,52 @@ currentWord = []
 settings_shapeLearners = []
 
 
-if __name__ == "__main__":
-
+def getDatasetDirectory():
     datasetDirectory = rospy.get_param('~dataset_directory','default')
     if(datasetDirectory.lower()=='default'): #use default
         import inspect
+        from shape_learning.shape_modeler import ShapeModeler
         fileName = inspect.getsourcefile(ShapeModeler)
         installDirectory = fileName.split('/lib')[0]
         datasetDirectory = installDirectory + '/share/shape_learning/letter_model_datasets/uji_pen_chars2'
-    '''
-    #@TODO reenable command line usage
-    #parse arguments
-    import argparse
-    parser = argparse.ArgumentParser(description='Publish shapes on the \
-            /shapes_to_draw topic and adapt them based on feedback received on the /shape_feedback topic')
-    parser.add_argument('word', nargs='?', action="store",
-                    help='a string containing the letters to be learnt (if not present, will wait for one from ROS topic)')
-    parser.add_argument('--show', action='store_true', help='display plots of the shapes')
+    return datasetDirectory
 
-    args = parser.parse_args()
-
-    '''
+def createSpeechCache(backend):
+    """Creates the cache of the robot's phrases (with the words of the cards
+    and the letters), and synthesizes those missing from it.
 
+    :returns: the SpeechCache
+    """
+    from letter_learning_interaction.speech_cache import SpeechCache, utterances
+    cache = SpeechCache(backend, SPEECH_CACHE_DIRECTORY, os.path.expanduser(SPEECH_CACHE_INDEX))
+    texts = utterances(LANGUAGE)
+    numMissing = len(cache.missing(texts))
+    rospy.loginfo('Speech cache: %d of %d phrases to synthesize (%s)', numMissing, len(texts), SPEECH_CACHE_RENDERING)
+    if SPEECH_CACHE_RENDERING == 'startup':
+        cache.render(texts, SPEECH_CACHE_WORKERS)
+    elif SPEECH_CACHE_RENDERING == 'background':
+        cache.renderAsync(texts, SPEECH_CACHE_WORKERS, callback=lambda numRendered: rospy.loginfo('Speech cache: synthesized %d phrases', numRendered))
+    return cache
+
+def createWordManager():
+    """Creates the word manager, which passes feedback to the shape learners
+    and keeps history of words learnt (once the dataset directory is set).
+
+    :returns: the ShapeLearnerManager
+    """
+    if LEARNER_WORKERS > 0:
+        from letter_learning_interaction.shape_learner_pool import ShapeLearnerPool, PooledShapeLearnerManager
+        pool = ShapeLearnerPool(InteractionSettings.generateSettings, LEARNER_WORKERS)
+        rospy.on_shutdown(pool.close)
+        return PooledShapeLearnerManager(pool, SHAPE_LOGGING_PATH)
+    from shape_learning.shape_learner_manager import ShapeLearnerManager
+    return ShapeLearnerManager(InteractionSettings.generateSettings, SHAPE_LOGGING_PATH)
+
+def createStateMachine():
+    """Creates the interaction's state machine.
+
+    :returns: the state machine and the info to run it with
+    """
     stateMachine = StateMachine()
     stateMachine.add_state("STARTING_INTERACTION", startInteraction)
     stateMachine.add_state("WAITING_FOR_ROBOT_TO_CONNECT", waitForRobotToConnect)
@@ -989,36 +1108,100 @@ if __name__ == "__main__":
     stateMachine.set_start("WAITING_FOR_ROBOT_TO_CONNECT")
     infoForStartState = {'state_goTo': ["STARTING_INTERACTION"], 'state_cameFrom': None}
 
+    if tracer.enabled: #trace the states responding to inputs (not the waiting ones, which loop)
+        for state in TRACED_STATES:
+            stateMachine.handlers[state] = tracedState(state, stateMachine.handlers[state])
+    return stateMachine, infoForStartState
+
+TRACED_STATES = ["RESPONDING_TO_NEW_WORD", "PUBLISHING_WORD", "ASKING_FOR_FEEDBACK", "RESPONDING_TO_FEEDBACK",
+                 "RESPONDING_TO_DEMONSTRATION", "RESPONDING_TO_DEMONSTRATION_FULL_WORD", "RESPONDING_TO_TEST_CARD"]
+
+def tracedState(state, handler):
+    def run(infoFromPrevState):
+        start = tracer.now()
+        result = handler(infoFromPrevState)
+        tracer.record('learning_words_nao/' + state, turnTraceId, start, tracer.now()) #handler may start a new turn
+        return result
+    return run
+
+def journaled(kind, callback):
+    """:returns: the callback, recording the messages it receives to the
+    input journal (if any) before handling them
+    """
+    if inputJournal is None:
+        return callback
+    def record(message):
+        inputJournal.record(kind, rospy.get_time(), message)
+        callback(message)
+    return record
+
+def subscribeToInteractionInputs():
+    """Subscribes to the inputs of the interaction (word cards, demonstrations, etc.).
+
+    :returns: the subscribers
+    """
     #listen for a new child signal
-    new_child_subscriber = rospy.Subscriber(NEW_CHILD_TOPIC, String, onNewChildReceived)
+    new_child_subscriber = rospy.Subscriber(NEW_CHILD_TOPIC, String, journaled(input_journal.NEW_CHILD, onNewChildReceived))
 
     #listen for words to write
-    words_subscriber = rospy.Subscriber(WORDS_TOPIC, String, onWordReceived)
+    words_subscriber = rospy.Subscriber(WORDS_TOPIC, String, journaled(input_journal.WORD, onWordReceived))
 
     #listen for request to clear screen (from tablet)
-    clear_subscriber = rospy.Subscriber(CLEAR_SURFACE_TOPIC, Empty, onClearScreenReceived)
+    clear_subscriber = rospy.Subscriber(CLEAR_SURFACE_TOPIC, Empty, journaled(input_journal.CLEAR, onClearScreenReceived))
 
     #listen for test time
-    test_subscriber = rospy.Subscriber(TEST_TOPIC, Empty, onTestRequestReceived)
+    test_subscriber = rospy.Subscriber(TEST_TOPIC, Empty, journaled(input_journal.TEST, onTestRequestReceived))
 
     #listen for when to stop
-    stop_subscriber = rospy.Subscriber(STOP_TOPIC, Empty, onStopRequestReceived)
+    stop_subscriber = rospy.Subscriber(STOP_TOPIC, Empty, journaled(input_journal.STOP, onStopRequestReceived))
 
     #listen for user-drawn shapes
-    shape_subscriber = rospy.Subscriber(PROCESSED_USER_SHAPE_TOPIC, ShapeMsg, onUserDrawnShapeReceived)
+    shape_subscriber = rospy.Subscriber(PROCESSED_USER_SHAPE_TOPIC, ShapeMsg, journaled(input_journal.DEMONSTRATION, onUserDrawnShapeReceived))
 
     #listen for user-drawn finger gestures
-    gesture_subscriber = rospy.Subscriber(GESTURE_TOPIC, PointStamped, onSetActiveShapeGesture); 
+    gesture_subscriber = rospy.Subscriber(GESTURE_TOPIC, PointStamped, journaled(input_journal.GESTURE, onSetActiveShapeGesture)); 
+
+    #listen for when the robot/tablet has finished writing
+    shape_finished_subscriber = rospy.Subscriber(SHAPE_FINISHED_TOPIC, String, journaled(input_journal.SHAPE_FINISHED, onShapeFinished))
+
+    return [new_child_subscriber, words_subscriber, clear_subscriber, test_subscriber, stop_subscriber, shape_subscriber, gesture_subscriber, shape_finished_subscriber]
+
+
+if __name__ == "__main__":
+
+    rospy.init_node("learning_words_nao")
+    configure()
+
+    datasetDirectory = getDatasetDirectory()
+    '''
+    #@TODO reenable command line usage
+    #parse arguments
+    import argparse
+    parser = argparse.ArgumentParser(description='Publish shapes on the \
+            /shapes_to_draw topic and adapt them based on feedback received on the /shape_feedback topic')
+    parser.add_argument('word', nargs='?', action="store",
+                    help='a string containing the letters to be learnt (if not present, will wait for one from ROS topic)')
+    parser.add_argument('--show', action='store_true', help='display plots of the shapes')
+
+    args = parser.parse_args()
+
+    '''
+
+    stateMachine, infoForStartState = createStateMachine()
+
+    subscribers = subscribeToInteractionInputs()
 
     #initialise display manager for shapes (manages positioning of shapes)
-    from letter_learning_interaction.srv import *
+    from letter_learning_interaction.display_manager_client import DisplayManagerClient
+    displayManager = DisplayManagerClient()
     rospy.loginfo('Waiting for display manager services to become available')
-    rospy.wait_for_service('clear_all_shapes')
+    displayManager.waitForServices()
 
     rospy.sleep(2.0)  #Allow some time for the subscribers to do their thing, 
                         #or the first message will be missed (eg. first traj on tablet, first clear request locally)
 
     from letter_learning_interaction.watchdog import Watchdog #TODO: Make a ROS server so that *everyone* can access the connection statuses
+    #the tablet app only publishes plain clears (no heartbeats, see watchdog.py), so there are no link statistics for it
     tabletWatchdog = Watchdog('watchdog_clear/tablet', 0.4)
     #robotWatchdog = Watchdog('watchdog_clear/robot', 0.8)
 
@@ -1039,6 +1222,10 @@ if __name__ == "__main__":
         textToSpeech = ALProxy("ALTextToSpeech", NAO_IP, port)   
         textToSpeech.setLanguage(LANGUAGE.capitalize())
         #textToSpeech.setVolume(1.0)
+        speech = textToSpeech
+        if SPEECH_CACHE_DIRECTORY:
+            from letter_learning_interaction.speech_cache import NaoqiSpeechBackend
+            speech = createSpeechCache(NaoqiSpeechBackend(textToSpeech, ALProxy("ALAudioPlayer", NAO_IP, port)))
         if naoWriting:
             if naoStanding:
                 postureProxy.goToPosture("StandInit",0.2)
@@ -1052,8 +1239,9 @@ if __name__ == "__main__":
             armJoints_standInit = motionProxy.getAngles(effector,True)
 
     #initialise word manager (passes feedback to shape learners and keeps history of words learnt)
+    from letter_learning_interaction.text_shaper import TextShaper, ScreenManager
     InteractionSettings.setDatasetDirectory(datasetDirectory)
-    wordManager = ShapeLearnerManager(InteractionSettings.generateSettings, SHAPE_LOGGING_PATH)
+    wordManager = createWordManager()
     textShaper = TextShaper()
     screenManager = ScreenManager(0.2, 0.1395)
 
@@ -13,6 +13,13 @@ the demonstration was for.
 shape to give priority to if the demonstration was drawn next to multiple
 shapes (if using the 'basedOnClosestShapeToPosition' method to map user demo to
 intended shape).
+- Listening to several tablets at once: each tablet publishes in its own
+namespace (see the ~tablet_namespaces parameter), strokes and active shapes
+are kept per tablet, and processed shapes are tagged with the tablet they
+were drawn on.
+- Tracing (with the ~tracing parameter, see tracing.py): each shape gets a
+trace ID, carried by its processed shape message, and the time to receive its
+strokes and to process it are recorded.
 
 Implemented but not in use: 
 - Receiving touch and long-touch gestures and converting that to feedback for
@@ -25,32 +32,39 @@ from nav_msgs.msg import Path
 from std_msgs.msg import String, Empty
 from geometry_msgs.msg import PointStamped
 
-from letter_learning_interaction.srv import *
-from shape_learning.shape_learner_manager import ShapeLearnerManager, Shape
-from shape_learning.shape_modeler import ShapeModeler
+from letter_learning_interaction.display_manager_client import DisplayManagerClient
+from letter_learning_interaction.display_manager_replica import DisplayManagerReplica
 
 from letter_learning_interaction.msg import Shape as ShapeMsg
+from letter_learning_interaction.tracing import Tracer, traceNode, newTraceId
+from letter_learning_interaction.sampling_profiler import profileNode
 
 positionToShapeMappingMethod = 'basedOnClosestShapeToPosition';
 shapePreprocessingMethod = "merge" #"longestStroke";
+tracer = Tracer('tablet_input_interpreter'); #disabled until configured by main
 
 
 # ---------------------------------------------------- LISTENING FOR USER SHAPE
-strokes=[];
-def userShapePreprocessor(message):
-    global strokes
-    
+strokes = {}; #strokes of the shape currently being drawn, for each device
+firstStrokeTime = {}; #when the first stroke of the current shape was received, for each device
+def userShapePreprocessor(message, device):
     if(len(message.poses)==0): #a message with 0 poses signifies the shape has no more strokes
       
-        if(len(strokes) > 0):                
-            onUserDrawnShapeReceived(strokes, shapePreprocessingMethod, positionToShapeMappingMethod); 
+        if(len(strokes[device]) > 0):                
+            traceId = newTraceId();
+            tracer.record('tablet_input_interpreter/receive_strokes', traceId, firstStrokeTime[device], tracer.now(),
+                          device=device, strokes=len(strokes[device]));
+            with tracer.span('tablet_input_interpreter/process_shape', traceId, device=device):
+                onUserDrawnShapeReceived(strokes[device], device, shapePreprocessingMethod, positionToShapeMappingMethod, traceId); 
         else:
-            rospy.loginfo('empty demonstration. ignoring')
+            rospy.loginfo('empty demonstration from \''+device+'\'. ignoring')
             
-        strokes = [];
+        strokes[device] = [];
 
     else: #new stroke in shape - add it
-        rospy.loginfo('Got stroke to write with '+str(len(message.poses))+' points');
+        if(len(strokes[device]) == 0):
+            firstStrokeTime[device] = tracer.now();
+        rospy.loginfo('Got stroke to write with '+str(len(message.poses))+' points from \''+device+'\'');
         x_shape = [];
         y_shape = [];
         for poseStamped in message.poses:
@@ -65,11 +79,21 @@ def userShapePreprocessor(message):
         shape[numPointsInShape:] = y_shape;
         
         shape = numpy.reshape(shape, (-1, 1)); #explicitly make it 2D array with only one column
-        strokes.append(shape);
+        strokes[device].append(shape);
 
 
 # ------------------------------------------------------- PROCESSING USER SHAPE
-def onUserDrawnShapeReceived(path, shapePreprocessingMethod, positionToShapeMappingMethod):
+_Shape = None
+def shapeClass():
+    """:returns: shape_learning's Shape class (slow to import: imported when
+    the first shape is processed)"""
+    global _Shape
+    if _Shape is None:
+        from shape_learning.shape_learner_manager import Shape
+        _Shape = Shape
+    return _Shape
+
+def onUserDrawnShapeReceived(strokes, device, shapePreprocessingMethod, positionToShapeMappingMethod, traceId=''):
 
     #preprocess to turn multiple strokes into one path
     if(shapePreprocessingMethod == 'merge'):
@@ -79,8 +103,10 @@ def onUserDrawnShapeReceived(path, shapePreprocessingMethod, positionToShapeMapp
     else:
         path = processShape_firstStroke(strokes);
 
-    demoShapeReceived = Shape(path=path);
+    demoShapeReceived = shapeClass()(path=path);
     shapeMessage = makeShapeMessage(demoShapeReceived);
+    shapeMessage.device = device;
+    shapeMessage.trace_id = traceId;
     pub_shapes.publish(shapeMessage);
 
 # ---------------------------------------- FORMATTING SHAPE OBJECT INTO ROS MSG
@@ -126,26 +152,19 @@ def processShape_firstStroke(strokes):
     return strokes[0];        
 
 # ----------------- PROCESS GESTURES FOR SETTING ACTIVE SHAPE FOR DEMONSTRATION
-activeShapeForDemonstration_type = None;
-def onSetActiveShapeGesture(message):
-    global activeShapeForDemonstration_type
-    
+activeShapeForDemonstration_type = {}; #for each device
+def onSetActiveShapeGesture(message, device):
     gestureLocation = [message.point.x, message.point.y];
     #map gesture location to shape drawn
     try:
-        shape_at_location = rospy.ServiceProxy('shape_at_location', shapeAtLocation);
-        request = shapeAtLocationRequest();
-        request.location.x = gestureLocation[0];
-        request.location.y = gestureLocation[1];
-        response = shape_at_location(request);
-        shapeType_code = response.shape_type_code;
-        shapeID = response.shape_id;
+        [shapeType_code, shapeID] = displayManager.shapeAtLocation(gestureLocation);
     except rospy.ServiceException, e:
         rospy.logerr("Service call failed: %s",e);
+        return;
         
     if(shapeType_code != -1 and shapeID != -1):
-        activeShapeForDemonstration_type = shapeType_code;
-        rospy.loginfo('Setting active shape to shape ' + str(shapeType_code));
+        activeShapeForDemonstration_type[device] = shapeType_code;
+        rospy.loginfo('Setting active shape on \''+device+'\' to shape ' + str(shapeType_code));
 
 '''  
     
@@ -163,13 +182,7 @@ def touchInfoManager(pointStamped):
         
         #map touch location to closest shape drawn
         try:
-            shape_at_location = rospy.ServiceProxy('shape_at_location', shapeAtLocation);
-            request = shapeAtLocationRequest();
-            request.location.x = touchLocation[0];
-            request.location.y = touchLocation[1];
-            response = shape_at_location(request);
-            shapeType_code = response.shape_type_code;
-            shapeID = response.shape_id;
+            [shapeType_code, shapeID] = displayManager.shapeAtLocation(touchLocation);
         except rospy.ServiceException, e:
             rospy.logerr("Service call failed: %s",e);
         
@@ -181,9 +194,7 @@ def touchInfoManager(pointStamped):
             rospy.loginfo('Ignoring touch because not on valid shape');
         else:
             try:
-                possible_to_display = rospy.ServiceProxy('possible_to_display_shape', isPossibleToDisplayNewShape);
-                response = possible_to_display(shape_type_code = shapeType_code);
-                ableToDisplay = response.is_possible.data;
+                ableToDisplay = displayManager.isPossibleToDisplayNewShape(shapeType_code);
             except rospy.ServiceException, e:
                 ableToDisplay = False;
                 rospy.logerr("Service call failed: %s",e);
@@ -217,14 +228,7 @@ def gestureManager(pointStamped):
         
         #map touch location to closest shape drawn
         try:
-            shape_at_location = rospy.ServiceProxy('shape_at_location', shapeAtLocation);
-            request = shapeAtLocationRequest();
-            request.location.x = gestureLocation[0];
-            request.location.y = gestureLocation[1];
-            response = shape_at_location(request);
-            shapeType_code = response.shape_type_code;
-            shapeID = response.shape_id;
-            #rospy.loginfo( response.location);
+            [shapeType_code, shapeID] = displayManager.shapeAtLocation(gestureLocation);
         except rospy.ServiceException, e:
             rospy.logerr("Service call failed: %s",e);
                   
@@ -234,10 +238,7 @@ def gestureManager(pointStamped):
             rospy.loginfo('Ignoring touch because not on valid shape');
         else:
             try:
-                possible_to_display = rospy.ServiceProxy('possible_to_display_shape', isPossibleToDisplayNewShape);
-                response = possible_to_display(shape_type_code = shapeType_code);
-                ableToDisplay = response.is_possible.data;
-                #rospy.loginfo( response.location);
+                ableToDisplay = displayManager.isPossibleToDisplayNewShape(shapeType_code);
             except rospy.ServiceException, e:
                 ableToDisplay = False;
                 rospy.logerr("Service call failed: %s",e);
@@ -270,6 +271,8 @@ def listenForAllGestures():
 if __name__ == "__main__":
 
     rospy.init_node("tablet_input_interpreter");
+    tracer = traceNode('tablet_input_interpreter');
+    profiler = profileNode('tablet_input_interpreter'); #started on demand via ~set_profiling
     '''
     #Topic for location of 'new shape like this one' gesture
     TOUCH_TOPIC = rospy.get_param('~touch_info_topic','touch_info');         
@@ -288,20 +291,36 @@ if __name__ == "__main__":
     #Name of topic to publish processed shapes on
     PROCESSED_USER_SHAPE_TOPIC = rospy.get_param('~processed_user_shape_topic','user_shapes_processed');
 
-    #listen for gesture representing active demo shape 
-    gesture_subscriber = rospy.Subscriber(GESTURE_TOPIC, PointStamped, onSetActiveShapeGesture); 
-    
-    #listen for user-drawn shapes
-    shape_subscriber = rospy.Subscriber(USER_DRAWN_SHAPES_TOPIC, Path, userShapePreprocessor);
-    
+    #initialise display manager for shapes (manages positioning of shapes)
+    #cached query results are invalidated by the changes the server publishes
+    displayManager = DisplayManagerClient(useCache=rospy.get_param('~cache_display_queries', False));
+    displayManager.waitForServices();
+    #answer read-only queries from a local replica of the display state
+    if(rospy.get_param('~use_display_replica', True)):
+        displayManager = DisplayManagerReplica(displayManager);
+        if(not displayManager.waitForState(rospy.get_param('~display_state_timeout', 5.0))):
+            rospy.logwarn('Display state not received yet: answering queries with the display manager services until it is');
+
+    #Namespaces of the tablets to listen to (the default, a single empty
+    #namespace, listens to the topics above directly)
+    TABLET_NAMESPACES = rospy.get_param('~tablet_namespaces', ['']);
 
     pub_shapes = rospy.Publisher(PROCESSED_USER_SHAPE_TOPIC, ShapeMsg, queue_size=10);
-    
-    #initialise display manager for shapes (manages positioning of shapes)
-    rospy.wait_for_service('shape_at_location'); 
-    rospy.wait_for_service('possible_to_display_shape'); 
-    rospy.wait_for_service('closest_shapes_to_location');
-    rospy.wait_for_service('display_shape_at_location');
-    rospy.wait_for_service('index_of_location');
 
+    gesture_subscribers = [];
+    shape_subscribers = [];
+    for namespace in TABLET_NAMESPACES:
+        device = namespace.strip('/');
+        strokes[device] = [];
+        activeShapeForDemonstration_type[device] = None;
+
+        #listen for gesture representing active demo shape 
+        gesture_subscribers.append(rospy.Subscriber(rospy.names.ns_join(namespace, GESTURE_TOPIC),
+                                                    PointStamped, onSetActiveShapeGesture, device));
+    
+        #listen for user-drawn shapes
+        shape_subscribers.append(rospy.Subscriber(rospy.names.ns_join(namespace, USER_DRAWN_SHAPES_TOPIC),
+                                                  Path, userShapePreprocessor, device));
+        rospy.loginfo('Listening to tablet \''+device+'\'');
+    
     rospy.spin();
@@ -1,31 +1,48 @@
 #!/usr/bin/env python
-'''Publish watchdog clears on the /watchdog_clear/device_name topic every
-time_between_clears seconds.
-'''
+'''Publish heartbeats for one or more devices on a single topic every
+time_between_clears seconds (the watchdog side is a HeartbeatMonitor, which
+also publishes round-trip time, jitter and loss statistics for each device,
+and whose pings are echoed back).
+
+Run it on the device itself: the statistics are those of the link between
+the machine it runs on and the monitor's (run on the same machine, they only
+measure the loopback).
 
-#@TODO possibly better to just use rospy.sleep instead of the watchdog clearer class
+Unless --heartbeats_only is given, watchdog clears are also published on the
+/watchdog_clear/device_name topic of each device, for plain Watchdogs.
+'''
 
 import rospy
-from letter_learning_interaction.watchdog import WatchdogClearer
+from letter_learning_interaction.watchdog import HeartbeatPublisher, WatchdogClearer
 
 if __name__ == "__main__":
     #parse arguments
     import argparse
-    parser = argparse.ArgumentParser(description='Publish watchdog clears \
-    on the /watchdog_clear/device_name topic.');
-    parser.add_argument('device_name', action="store", type=str,
-                    help='name of device which the watchdog is monitoring');
+    parser = argparse.ArgumentParser(description='Publish heartbeats \
+    for one or more devices on a single topic.');
+    parser.add_argument('device_names', action="store", type=str, nargs='+',
+                    help='names of the devices which the watchdogs are monitoring');
     parser.add_argument('time_between_clears', action="store", type=float,
-                    help='name of device which the watchdog is monitoring');
-    args = parser.parse_args();
-    
-    rospy.init_node(args.device_name + '_watchdog_clearer');
+                    help='time between two heartbeats of a device (seconds)');
+    parser.add_argument('--heartbeat_topic', action="store", type=str, default='heartbeat',
+                    help='topic to publish the heartbeats of all the devices on');
+    parser.add_argument('--heartbeats_only', action="store_true",
+                    help="don't also publish clears on the watchdog_clear/device_name topics");
+    args = parser.parse_args(rospy.myargv()[1:]);
+
+    if(len(args.device_names) == 1):
+        rospy.init_node(args.device_names[0] + '_watchdog_clearer');
+    else:
+        rospy.init_node('watchdog_clearer');
 
-    wdc=WatchdogClearer('watchdog_clear/'+args.device_name, args.time_between_clears);
-    rospy.loginfo('Starting new watchdog_clearer for '+args.device_name);
+    heartbeatPublisher = HeartbeatPublisher(args.heartbeat_topic, args.device_names, args.time_between_clears);
+    clearers = [];
+    if(not args.heartbeats_only):
+        clearers = [WatchdogClearer('watchdog_clear/'+device, args.time_between_clears) for device in args.device_names];
+    rospy.loginfo('Starting new watchdog_clearer for '+', '.join(args.device_names));
 
+    rospy.spin() #heartbeats are published from the timer thread
 
-    while not rospy.is_shutdown():
-        pass
-    
-    wdc.stop();
+    heartbeatPublisher.stop();
+    for wdc in clearers:
+        wdc.stop();
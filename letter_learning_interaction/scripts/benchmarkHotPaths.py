@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+'''
+Micro-benchmarks of the hot paths of the interaction, run without a ROS master
+or robot (rospy and the messages are replaced by the stand-ins of
+ros_stand_ins.py):
+- TextShaper.shapeWord and ScreenManager.place_word
+- ShapedWord.downsample
+- downsampleShape and make_traj_msg (learning_words_nao.py)
+- ScreenManager.split_path_from_template and closest_letter
+- ShapeDisplayManager allocation and queries
+- userShapePreprocessor and stroke merging (tablet_input_interpreter.py)
+
+Inputs are parametrised by word length, points per stroke (or letter) and
+number of words on screen. Results are written to a JSON file, which can be
+compared to a baseline (a previous results file):
+
+    benchmarkHotPaths.py results.json [--baseline baseline.json]
+
+exits with status 1 if a benchmark got slower than the baseline by more than
+the tolerance. Benchmarks whose dependencies (e.g. shape_learning, scipy)
+can't be imported are reported as skipped.
+'''
+
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+
+import numpy
+
+import ros_stand_ins
+
+WORD_LENGTHS = [3, 6, 10]
+POINTS_PER_STROKE = [20, 70, 200]
+WORDS_ON_SCREEN = [1, 5, 20]
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+# ------------------------------------------------------------------ INPUTS
+class SyntheticLetter:
+    """A letter as given by a ShapeLearnerManager: shapeType and path (x
+    coordinates then y coordinates, as a column)."""
+    def __init__(self, letter, numPoints):
+        t = numpy.linspace(0, 2*numpy.pi, numPoints)
+        phase = LETTERS.index(letter)
+        self.shapeType = letter
+        self.path = numpy.concatenate([numpy.cos(t + phase) + 0.1*t, numpy.sin(2*t + phase)]).reshape((-1, 1))
+
+class SyntheticWord:
+    """Stands for the ShapeLearnerManager of a word."""
+    def __init__(self, word, numPoints):
+        self.currentCollection = word
+        self.letters = [SyntheticLetter(letter, numPoints) for letter in word]
+
+    def shapesOfCurrentCollection(self):
+        return self.letters
+
+def syntheticWord(length, numPoints):
+    return SyntheticWord(''.join(LETTERS[(7*i) % 26] for i in range(length)), numPoints)
+
+def strokeMessage(numPoints, x0=0.0):
+    from nav_msgs.msg import Path
+    from geometry_msgs.msg import PoseStamped
+    path = Path()
+    for i in range(numPoints):
+        pose = PoseStamped()
+        pose.pose.position.x = x0 + 0.001*i
+        pose.pose.position.y = 0.05 + 0.01*numpy.sin(i/5.0)
+        path.poses.append(pose)
+    return path
+
+# ---------------------------------------------------------------- BENCHMARKS
+# each returns the function to time for the given parameters, importing the
+# (lazily imported) dependencies of the code it times beforehand, so that a
+# missing one raises its ImportError here
+def bench_shapeWord(wordLength, pointsPerStroke):
+    from letter_learning_interaction.text_shaper import TextShaper, shapeModeler
+    shapeModeler()
+    word = syntheticWord(wordLength, pointsPerStroke)
+    return lambda: TextShaper.shapeWord(word)
+
+def bench_place_word(wordsOnScreen):
+    from letter_learning_interaction.text_shaper import ScreenManager, TextShaper
+    screenManager = ScreenManager(0.2, 0.1425)
+    shapedWord = TextShaper.shapeWord(syntheticWord(6, 70))
+    for i in range(wordsOnScreen):
+        screenManager.place_word(TextShaper.shapeWord(syntheticWord(6, 70)))
+    def run():
+        screenManager.place_word(shapedWord)
+        screenManager.words.pop()
+    return run
+
+def bench_ShapedWord_downsample(wordLength, pointsPerStroke):
+    from letter_learning_interaction.text_shaper import TextShaper, ShapedWord, scipyInterpolate
+    scipyInterpolate()
+    shapedWord = TextShaper.shapeWord(syntheticWord(wordLength, pointsPerStroke))
+    paths = shapedWord.get_letters_paths(absolute=False)
+    return lambda: ShapedWord(shapedWord.word, paths).downsample(float(69)/6)
+
+def bench_downsampleShape(pointsPerStroke):
+    node = loadNode('learning_words_nao')
+    node.scipyInterpolate()
+    node.shapeModeler()
+    shape = SyntheticLetter('a', pointsPerStroke).path
+    return lambda: node.downsampleShape(shape)
+
+def bench_make_traj_msg(wordLength, pointsPerStroke):
+    node = loadNode('learning_words_nao')
+    from letter_learning_interaction.text_shaper import TextShaper
+    shapedWord = TextShaper.shapeWord(syntheticWord(wordLength, pointsPerStroke))
+    return lambda: node.make_traj_msg(shapedWord, 0.1)
+
+def bench_split_path_from_template(wordLength, pointsPerStroke):
+    from letter_learning_interaction.text_shaper import ScreenManager
+    screenManager = ScreenManager(0.2, 0.1425)
+    word = syntheticWord(wordLength, pointsPerStroke).currentCollection
+    bbs = screenManager.place_reference_boundingboxes(word)
+    x1, y1, x2, y2 = bbs[0][0], min(bb[1] for bb in bbs), bbs[-1][2], max(bb[3] for bb in bbs)
+    numPoints = wordLength*pointsPerStroke
+    path = [(x1 + (x2 - x1)*i/float(numPoints - 1), (y1 + y2)/2 + (y2 - y1)/2*numpy.sin(i/7.0)) for i in range(numPoints)]
+    return lambda: screenManager.split_path_from_template(path)
+
+def bench_closest_letter(wordsOnScreen, wordLength):
+    from letter_learning_interaction.text_shaper import ScreenManager, TextShaper
+    screenManager = ScreenManager(0.2, 0.1425)
+    for i in range(wordsOnScreen):
+        shapedWord = TextShaper.shapeWord(syntheticWord(wordLength, 70))
+        screenManager.place_word(shapedWord)
+        shapedWord.origin = [0.01*i, 0.005*i]
+    return lambda: screenManager.closest_letter(10.0, 10.0) #not on a letter: distances to all of them
+
+def bench_ShapeDisplayManager_allocation(wordLength):
+    from letter_learning_interaction.shape_display_manager import ShapeDisplayManager
+    manager = ShapeDisplayManager(numRows=3, numCols=max(5, wordLength), numShapeTypes=wordLength)
+    def run():
+        manager.clearAllShapes()
+        for code in itertools.islice(itertools.cycle(range(wordLength)), 3*max(5, wordLength)):
+            manager.displayNewShape(code)
+    return run
+
+def bench_ShapeDisplayManager_queries(wordLength):
+    from letter_learning_interaction.shape_display_manager import ShapeDisplayManager
+    manager = ShapeDisplayManager(numRows=3, numCols=max(5, wordLength), numShapeTypes=wordLength)
+    for code in itertools.islice(itertools.cycle(range(wordLength)), 2*max(5, wordLength)):
+        manager.displayNewShape(code)
+    rng = random.Random(0)
+    locations = [[rng.uniform(0, 0.04*max(5, wordLength)), rng.uniform(0, 0.0465*3)] for i in range(100)] #within the display
+    def run():
+        for location in locations:
+            manager.shapeAtLocation(location)
+            manager.closestShapesToLocation(location)
+            manager.indexOfLocation(location)
+    return run
+
+def bench_userShapePreprocessor(pointsPerStroke, wordLength):
+    node = loadNode('tablet_input_interpreter')
+    node.shapeClass()
+    node.pub_shapes = ros_stand_ins.Publisher('user_shapes_processed', None)
+    node.activeShapeForDemonstration_type['bench'] = None
+    messages = [strokeMessage(pointsPerStroke, 0.02*i) for i in range(wordLength)] + [strokeMessage(0)]
+    def run():
+        node.strokes['bench'] = []
+        for message in messages:
+            node.userShapePreprocessor(message, 'bench')
+    return run
+
+def bench_processShape_mergeStrokes(pointsPerStroke, wordLength):
+    node = loadNode('tablet_input_interpreter')
+    strokes = []
+    for i in range(wordLength):
+        x = numpy.linspace(0, 0.02, pointsPerStroke) + 0.02*i
+        strokes.append(numpy.concatenate([x, numpy.sin(x)]).reshape((-1, 1)))
+    return lambda: node.processShape_mergeStrokes(strokes)
+
+BENCHMARKS = [
+    (bench_shapeWord, {'wordLength': WORD_LENGTHS, 'pointsPerStroke': POINTS_PER_STROKE}),
+    (bench_place_word, {'wordsOnScreen': WORDS_ON_SCREEN}),
+    (bench_ShapedWord_downsample, {'wordLength': WORD_LENGTHS, 'pointsPerStroke': POINTS_PER_STROKE}),
+    (bench_downsampleShape, {'pointsPerStroke': POINTS_PER_STROKE}),
+    (bench_make_traj_msg, {'wordLength': WORD_LENGTHS, 'pointsPerStroke': POINTS_PER_STROKE}),
+    (bench_split_path_from_template, {'wordLength': WORD_LENGTHS, 'pointsPerStroke': POINTS_PER_STROKE}),
+    (bench_closest_letter, {'wordsOnScreen': WORDS_ON_SCREEN, 'wordLength': WORD_LENGTHS}),
+    (bench_ShapeDisplayManager_allocation, {'wordLength': WORD_LENGTHS}),
+    (bench_ShapeDisplayManager_queries, {'wordLength': WORD_LENGTHS}),
+    (bench_userShapePreprocessor, {'pointsPerStroke': POINTS_PER_STROKE, 'wordLength': WORD_LENGTHS}),
+    (bench_processShape_mergeStrokes, {'pointsPerStroke': POINTS_PER_STROKE, 'wordLength': WORD_LENGTHS}),
+]
+
+_nodes = {}
+def loadNode(name):
+    if name not in _nodes:
+        node = ros_stand_ins.loadNode(name)
+        if hasattr(node, 'configure'): #as its main does
+            ros_stand_ins.init_node(name)
+            node.configure()
+        _nodes[name] = node
+    return _nodes[name]
+
+# ------------------------------------------------------------------ RUNNING
+def timeFunction(function, minTime, repeat):
+    """Times function, calibrating the number of calls per measurement so
+    that it lasts at least minTime.
+
+    :returns: (min, median) time per call in seconds, and the number of calls per measurement
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        if timer.timeit(number) >= minTime or number >= 10**6:
+            break
+        number *= 10
+    times = [t/number for t in timer.repeat(repeat, number)]
+    return min(times), float(numpy.median(times)), number
+
+def runBenchmarks(names=None, minTime=0.05, repeat=5, quick=False):
+    results = {}
+    skipped = {}
+    for benchmark, parameters in BENCHMARKS:
+        name = benchmark.__name__[len('bench_'):]
+        if names and not any(n in name for n in names):
+            continue
+        keys = sorted(parameters.keys())
+        for values in itertools.product(*[parameters[key][:1] if quick else parameters[key] for key in keys]):
+            kwargs = dict(zip(keys, values))
+            caseName = name + '[' + ','.join('%s=%s' % (key, kwargs[key]) for key in keys) + ']'
+            try:
+                function = benchmark(**kwargs)
+            except ImportError as e:
+                skipped[name] = 'missing dependency: %s' % e
+                break
+            except SyntaxError as e: #the nodes are python 2
+                skipped[name] = 'cannot be imported by python %s: %s' % (platform.python_version(), e)
+                break
+            best, median, number = timeFunction(function, minTime, repeat)
+            results[caseName] = {'min_us': best*1e6, 'median_us': median*1e6, 'calls': number}
+            print('%-70s %10.2f us (median %.2f us)' % (caseName, best*1e6, median*1e6))
+    for name, reason in sorted(skipped.items()):
+        print('%-70s skipped (%s)' % (name, reason))
+    return results, skipped
+
+def compare(results, baseline, tolerance):
+    """Prints the ratio of each result to the baseline (comparing the best
+    measurements, which are the least sensitive to the load of the machine).
+
+    :returns: the names of the benchmarks slower than the baseline by more than tolerance
+    """
+    regressions = []
+    print('\n%-70s %12s %12s %8s' % ('benchmark', 'baseline', 'now', 'ratio'))
+    for name in sorted(results.keys()):
+        if name not in baseline:
+            continue
+        before = baseline[name]['min_us']
+        now = results[name]['min_us']
+        ratio = now/before if before > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print('%-70s %10.2fus %10.2fus %7.2fx%s' % (name, before, now, ratio, flag))
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the interaction hot paths.');
+    parser.add_argument('output', action="store", type=str,
+                    help='JSON file to write the results to');
+    parser.add_argument('--baseline', action="store", type=str, default=None,
+                    help='JSON results to compare against');
+    parser.add_argument('--tolerance', action="store", type=float, default=0.2,
+                    help='relative slowdown from the baseline reported as a regression');
+    parser.add_argument('--only', action="store", nargs='+', default=None,
+                    help='only run the benchmarks whose name contains one of these');
+    parser.add_argument('--min_time', action="store", type=float, default=0.05,
+                    help='minimum duration of a measurement (seconds)');
+    parser.add_argument('--repeat', action="store", type=int, default=5,
+                    help='number of measurements of each benchmark');
+    parser.add_argument('--quick', action="store_true",
+                    help='only run the first value of each parameter');
+    args = parser.parse_args();
+
+    ros_stand_ins.install()
+
+    results, skipped = runBenchmarks(args.only, args.min_time, args.repeat, args.quick)
+    with open(args.output, 'w') as f:
+        json.dump({'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'results': results,
+                   'skipped': skipped}, f, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('\n%d regressions' % len(regressions))
+            sys.exit(1)
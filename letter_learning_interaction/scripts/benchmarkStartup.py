@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+'''
+Cold-start benchmark of the package's nodes: each node (nodes/<name>.py) is
+imported, without running its main, by a fresh interpreter, which times the
+import of each module it loads (the time spent in the module itself and with
+the modules it imports, as python 3's -X importtime, which python 2 lacks).
+For each node are reported:
+- the wall time of the interpreter importing it (from its start to its exit)
+- the time to import the node, and to import each of its direct imports
+- the modules which took the most time themselves
+
+    benchmarkStartup.py [nodes...] [--stand_ins] [--output results.json]
+
+With --stand_ins, rospy and the messages are the stand-ins of ros_stand_ins.py
+(installed before the timing starts), so that no ROS installation is needed;
+the calls the node makes to rospy while being imported (init_node,
+get_param, publishers...) are then reported too, as importing a node should
+have no side effect.
+'''
+
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+
+import ros_stand_ins #only imports standard modules, as rospy does
+
+NODES_DIRECTORY = os.path.join(ros_stand_ins.PACKAGE_DIRECTORY, 'nodes')
+
+#rospy functions whose calls by a node being imported are side effects
+SIDE_EFFECTS = ['init_node', 'get_param', 'set_param', 'Publisher', 'Subscriber', 'Service', 'ServiceProxy',
+                'wait_for_service', 'on_shutdown', 'sleep']
+
+class ImportTimer:
+    """Times the imports which load new modules, by wrapping __import__."""
+    def __init__(self):
+        self.records = [] #(name, depth, self time, cumulative time), in the order their imports ended
+        self._nested = [] #time spent in the nested imports of each import in progress
+
+    def install(self):
+        try:
+            import __builtin__ as builtins
+        except ImportError: #python 3
+            import builtins
+        self._builtins = builtins
+        self._import = builtins.__import__
+        builtins.__import__ = self._timedImport
+
+    def uninstall(self):
+        self._builtins.__import__ = self._import
+
+    def _timedImport(self, name, *args, **kwargs):
+        numModules = len(sys.modules)
+        self._nested.append(0.0)
+        start = timeit.default_timer()
+        try:
+            return self._import(name, *args, **kwargs)
+        finally:
+            elapsed = timeit.default_timer() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            if len(sys.modules) > numModules: #not already imported
+                self.records.append((name, len(self._nested), elapsed - nested, elapsed))
+
+def median(values):
+    values = sorted(values)
+    middle = len(values)//2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle])/2.0
+
+def countCalls(module, names, counts):
+    """Replaces the functions of module by wrappers counting their calls."""
+    for name in names:
+        function = getattr(module, name, None)
+        if function is None:
+            continue
+        def counted(*args, **kwargs):
+            counts[counted.name] = counts.get(counted.name, 0) + 1
+            return counted.function(*args, **kwargs)
+        counted.name, counted.function = name, function
+        setattr(module, name, counted)
+
+def importNode(name, standIns):
+    """Imports the node in this interpreter (run by measureNode).
+
+    :returns: the measurements (a dict)
+    """
+    calls = {}
+    if standIns:
+        ros_stand_ins.install()
+        countCalls(sys.modules['rospy'], SIDE_EFFECTS, calls)
+
+    try: #what loadNode uses
+        import imp
+    except ImportError:
+        import importlib.util
+
+    timer = ImportTimer()
+    timer.install()
+    start = timeit.default_timer()
+    try:
+        ros_stand_ins.loadNode(name)
+    finally:
+        total = timeit.default_timer() - start
+        timer.uninstall()
+    return {'import_s': total, 'modules': timer.records, 'rospy_calls': calls if standIns else None}
+
+def measureNode(name, standIns, repeat):
+    """Imports the node in repeat fresh interpreters.
+
+    :returns: the median measurements (a dict), or None and the error of the
+    interpreter if the node couldn't be imported
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--child', name] + (['--stand_ins'] if standIns else [])
+    runs = []
+    for i in range(repeat):
+        start = time.time()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, error = process.communicate()
+        wallTime = time.time() - start
+        if process.returncode != 0:
+            lines = error.decode('utf-8', 'replace').strip().splitlines()
+            return None, lines[-1] if lines else 'exit status %d' % process.returncode
+        run = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        run['wall_s'] = wallTime
+        runs.append(run)
+
+    #median over the runs of each module (by name, at its depth in the first run)
+    modules = []
+    for moduleName, depth, selfTime, cumulative in runs[0]['modules']:
+        times = [[record[2:] for record in run['modules'] if record[0] == moduleName][:1] for run in runs]
+        times = [t[0] for t in times if t]
+        modules.append({'name': moduleName, 'depth': depth,
+                        'self_s': median([t[0] for t in times]),
+                        'cumulative_s': median([t[1] for t in times])})
+    return {'wall_s': median([run['wall_s'] for run in runs]),
+            'import_s': median([run['import_s'] for run in runs]),
+            'modules': modules,
+            'rospy_calls': runs[0]['rospy_calls']}, None
+
+def printReport(name, result, top):
+    print('%s: %.0f ms to import (%.0f ms with the interpreter start)' % (name, result['import_s']*1e3, result['wall_s']*1e3))
+    direct = [module for module in result['modules'] if module['depth'] == 0]
+    for module in sorted(direct, key=lambda module: -module['cumulative_s'])[:top]:
+        print('    %-50s %8.1f ms' % (module['name'], module['cumulative_s']*1e3))
+    print('  slowest modules (by their own time):')
+    for module in sorted(result['modules'], key=lambda module: -module['self_s'])[:top]:
+        print('    %-50s %8.1f ms' % (module['name'], module['self_s']*1e3))
+    calls = result['rospy_calls']
+    if calls:
+        print('  side effects: ' + ', '.join('rospy.%s x%d' % (call, count) for call, count in sorted(calls.items())))
+    elif calls is not None:
+        print('  side effects: none')
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Measure the time to import each node of the package.');
+    parser.add_argument('nodes', action="store", nargs='*', default=None,
+                    help='nodes to measure (default: all of them)');
+    parser.add_argument('--stand_ins', action="store_true",
+                    help='use the stand-ins of rospy and the messages (no ROS installation needed)');
+    parser.add_argument('--repeat', action="store", type=int, default=5,
+                    help='number of interpreters importing each node');
+    parser.add_argument('--top', action="store", type=int, default=10,
+                    help='number of modules reported for each node');
+    parser.add_argument('--output', action="store", type=str, default=None,
+                    help='JSON file to write the results to');
+    parser.add_argument('--child', action="store", type=str, default=None,
+                    help=argparse.SUPPRESS);
+    args = parser.parse_args();
+
+    if args.child is not None:
+        print(json.dumps(importNode(args.child, args.stand_ins)))
+        sys.exit(0)
+
+    nodes = args.nodes or sorted(fileName[:-len('.py')] for fileName in os.listdir(NODES_DIRECTORY) if fileName.endswith('.py'))
+    results = {}
+    failed = {}
+    for name in nodes:
+        result, error = measureNode(name, args.stand_ins, args.repeat)
+        if result is None:
+            failed[name] = error
+            print('%s: cannot be imported (%s)\n' % (name, error))
+            continue
+        results[name] = result
+        printReport(name, result, args.top)
+        print('')
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0],
+                       'stand_ins': args.stand_ins,
+                       'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'results': results,
+                       'failed': failed}, f, indent=2, sort_keys=True)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+'''
+Benchmark the word card detection (WordCardDetector, as used by
+word_card_detector.py) on replayed tag detections, with a simulated clock.
+
+Detections are either synthetic (trials where the letters of a word are shown,
+then the GO card, among a number of other visible tags) or recorded: a csv file
+with one detection per row (stamp,tag,x,y,z,qx,qy,qz,qw, the pose of the tag
+in the camera frame) or a bag file with /tf messages (requires rosbag).
+
+Reports the latency from the GO card appearing to the word being published,
+the CPU time per detection and, for synthetic trials, the words which were
+missed, wrong, or published more than once.
+
+Doesn't need ROS nor a camera, e.g.:
+    benchmarkWordCardDetection.py --visible_tags 5 20 50 --trials 200
+'''
+
+import csv
+import os
+import random
+import sys
+import timeit
+
+import numpy as np
+
+try:
+    from letter_learning_interaction.word_card_detection import WordCardDetector, GO_TAG, tags_letters_mapping
+except ImportError: #not built with catkin: use the sources
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'include'))
+    from word_card_detection import WordCardDetector, GO_TAG, tags_letters_mapping
+
+letters_tags_mapping = dict((letter, tag) for tag, letter in tags_letters_mapping.items())
+FACING = (0., 0., 0., 1.)
+
+class Trial:
+    """Detections of one synthetic trial, as frames (stamp, [(tag, translation, rotation)]).
+    """
+    def __init__(self, word, goAppeared, frames):
+        self.word = word
+        self.goAppeared = goAppeared
+        self.frames = frames
+
+def makeTrial(startTime, word, numVisibleTags, frameRate, lettersDuration, goDuration, dropRate, noise):
+    """Letters of word lined up from left to right, visible for lettersDuration
+    seconds, then with the GO card for goDuration seconds. Tags other than
+    letters of the word and the GO card fill up numVisibleTags.
+    """
+    distractors = ['tag_%d' % (500 + i) for i in range(max(0, numVisibleTags - len(word) - 1))]
+    letterPoses = [(letters_tags_mapping[letter], (0.05*i, 0., 0.5)) for i, letter in enumerate(word)]
+
+    frames = []
+    goAppeared = startTime + lettersDuration
+    numFrames = int((lettersDuration + goDuration)*frameRate)
+    for i in range(numFrames):
+        stamp = startTime + float(i)/frameRate
+        detections = []
+        for tag, (x, y, z) in letterPoses:
+            detections.append((tag, (x + random.gauss(0, noise), y + random.gauss(0, noise), z), FACING))
+        for tag in distractors:
+            detections.append((tag, (random.uniform(-0.5, 0.5), random.uniform(-0.5, 0.5), 0.5), FACING))
+        if stamp >= goAppeared:
+            detections.append((GO_TAG, (0., 0.2, 0.5), FACING))
+        detections = [d for d in detections if random.random() >= dropRate]
+        random.shuffle(detections)
+        frames.append((stamp, detections))
+    return Trial(word, goAppeared, frames)
+
+def randomWord(letters='abcdefghijklmnopqrstuvwxyz'):
+    return ''.join(random.sample(letters, random.randint(2, 6)))
+
+def framesFromCsv(path):
+    frames = {}
+    with open(path) as csvfile:
+        for row in csv.reader(csvfile):
+            if not row or row[0] == 'stamp':
+                continue
+            stamp = float(row[0])
+            pose = list(map(float, row[2:9]))
+            frames.setdefault(stamp, []).append((row[1], tuple(pose[:3]), tuple(pose[3:])))
+    return sorted(frames.items())
+
+def framesFromBag(path, cameraFrame):
+    import rosbag
+    frames = []
+    with rosbag.Bag(path) as bag:
+        for _, message, _ in bag.read_messages(topics=['/tf', 'tf']):
+            for transform in message.transforms:
+                if transform.header.frame_id.lstrip('/') != cameraFrame:
+                    continue
+                t = transform.transform.translation
+                r = transform.transform.rotation
+                frames.append((transform.header.stamp.to_sec(),
+                               [(transform.child_frame_id.lstrip('/'), (t.x, t.y, t.z), (r.x, r.y, r.z, r.w))]))
+    frames.sort(key=lambda frame: frame[0])
+    return frames
+
+def replay(frames, detector, transportDelay):
+    """Feeds the frames to the detector as word_card_detector.py would, the
+    simulated clock being the stamp of the frame plus the transport delay plus
+    the (measured) processing time.
+
+    :returns: the publications (time, word), the processing times of each
+    detection, and the number of detections
+    """
+    publications = []
+    processingTimes = []
+    numDetections = 0
+    for stamp, detections in frames:
+        received = stamp + transportDelay
+        frameStart = timeit.default_timer()
+        goCardSeen = False
+        for tag, translation, rotation in detections:
+            start = timeit.default_timer()
+            if detector.onTagDetected(tag, translation, rotation, stamp):
+                goCardSeen = True
+            processingTimes.append(timeit.default_timer() - start)
+            numDetections += 1
+        if goCardSeen: #once all the tags of the frame are indexed
+            start = timeit.default_timer()
+            word = detector.buildWord(received + start - frameStart)
+            if word and detector.isNewWord(word):
+                publications.append((received + timeit.default_timer() - frameStart, word))
+            processingTimes[-1] += timeit.default_timer() - start
+    return publications, processingTimes, numDetections
+
+def cpuTime():
+    times = os.times()
+    return times[0] + times[1]
+
+def printTimes(label, times, unit, scale):
+    if len(times) == 0:
+        print('  %s: none' % label)
+        return
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])*scale
+    print('  %s (%s): p50 %.3f, p90 %.3f, p99 %.3f, max %.3f' % (label, unit, p50, p90, p99, max(times)*scale))
+
+def benchmarkSynthetic(args, numVisibleTags):
+    detector = WordCardDetector(args.max_tag_age, args.go_card_timeout)
+    trials = []
+    startTime = 0.
+    previousWord = None
+    for i in range(args.trials):
+        word = randomWord()
+        if previousWord is not None and random.random() < args.repeat_rate:
+            word = previousWord[:random.randint(1, len(previousWord))] #same word (or part thereof) again
+        trials.append(makeTrial(startTime, word, max(numVisibleTags, len(word) + 1), args.frame_rate,
+                                args.letters_duration, args.go_duration, args.drop_rate, args.noise))
+        startTime += args.letters_duration + args.go_duration + args.pause
+        previousWord = word
+
+    frames = [frame for trial in trials for frame in trial.frames]
+    cpuStart = cpuTime()
+    publications, processingTimes, numDetections = replay(frames, detector, args.transport_delay)
+    cpu = cpuTime() - cpuStart
+
+    #attribute each publication to the trial it happened in
+    latencies = []
+    missed = wrong = duplicates = suppressed = 0
+    trialEnds = [trial.frames[-1][0] + args.pause for trial in trials]
+    previousPublished = ''
+    for trial, end in zip(trials, trialEnds):
+        published = [(t, w) for t, w in publications if trial.frames[0][0] <= t < end]
+        if len(published) == 0:
+            if trial.word in previousPublished:
+                suppressed += 1 #not published because it is (part of) the previous word
+            else:
+                missed += 1
+            continue
+        latencies.append(published[0][0] - trial.goAppeared)
+        wrong += sum(1 for _, w in published if w != trial.word)
+        duplicates += len(published) - 1
+        previousPublished = published[-1][1]
+
+    print('%d visible tags, %d trials, %d detections:' % (numVisibleTags, len(trials), numDetections))
+    printTimes('GO to publish latency', latencies, 'ms', 1e3)
+    printTimes('processing time per detection', processingTimes, 'us', 1e6)
+    print('  CPU per detection: %.2f us' % (1e6*cpu/max(numDetections, 1)))
+    print('  published: %d, missed: %d, wrong: %d, duplicates: %d, suppressed as same word: %d' %
+          (len(publications), missed, wrong, duplicates, suppressed))
+
+def benchmarkRecorded(args):
+    if args.input.endswith('.bag'):
+        frames = framesFromBag(args.input, args.camera_frame)
+    else:
+        frames = framesFromCsv(args.input)
+
+    detector = WordCardDetector(args.max_tag_age, args.go_card_timeout)
+    cpuStart = cpuTime()
+    publications, processingTimes, numDetections = replay(frames, detector, args.transport_delay)
+    cpu = cpuTime() - cpuStart
+
+    #GO card appearances: first detection of the GO card after it has not been seen for goCardTimeout
+    goAppearances = []
+    lastGo = None
+    for stamp, detections in frames:
+        if any(tag == GO_TAG for tag, _, _ in detections):
+            if lastGo is None or stamp - lastGo >= args.go_card_timeout:
+                goAppearances.append(stamp)
+            lastGo = stamp
+    latencies = []
+    for appeared in goAppearances:
+        following = [t for t, _ in publications if t >= appeared]
+        if following and following[0] - appeared < args.go_card_timeout:
+            latencies.append(following[0] - appeared)
+    duplicates = sum(1 for (_, w1), (_, w2) in zip(publications, publications[1:]) if w2 in w1 or w1 in w2)
+
+    print('%s: %d detections, %d GO card appearances' % (args.input, numDetections, len(goAppearances)))
+    printTimes('GO to publish latency', latencies, 'ms', 1e3)
+    printTimes('processing time per detection', processingTimes, 'us', 1e6)
+    print('  CPU per detection: %.2f us' % (1e6*cpu/max(numDetections, 1)))
+    print('  published: %d (%s), consecutive overlapping words: %d' %
+          (len(publications), ', '.join(w for _, w in publications), duplicates))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark word card detection on replayed tag detections.');
+    parser.add_argument('--input', action="store", type=str, default=None,
+                    help='csv (stamp,tag,x,y,z,qx,qy,qz,qw) or bag file of recorded detections (default: synthetic trials)');
+    parser.add_argument('--camera_frame', action="store", type=str, default='v4l_frame',
+                    help='frame of the detections in a bag file');
+    parser.add_argument('--visible_tags', action="store", type=int, nargs='+', default=[5, 20, 50],
+                    help='numbers of tags visible in the synthetic trials');
+    parser.add_argument('--trials', action="store", type=int, default=100,
+                    help='number of synthetic trials (words shown) for each number of visible tags');
+    parser.add_argument('--frame_rate', action="store", type=float, default=30.,
+                    help='detections per second of each visible tag');
+    parser.add_argument('--letters_duration', action="store", type=float, default=1.,
+                    help='time the letters are shown before the GO card (seconds)');
+    parser.add_argument('--go_duration', action="store", type=float, default=1.5,
+                    help='time the GO card is shown (seconds)');
+    parser.add_argument('--pause', action="store", type=float, default=0.5,
+                    help='time without any card between two trials (seconds)');
+    parser.add_argument('--drop_rate', action="store", type=float, default=0.1,
+                    help='probability of a tag not being detected in a frame');
+    parser.add_argument('--noise', action="store", type=float, default=0.005,
+                    help='standard deviation of the position of the letters (m)');
+    parser.add_argument('--repeat_rate', action="store", type=float, default=0.1,
+                    help='probability of showing the previous word (or part thereof) again');
+    parser.add_argument('--transport_delay', action="store", type=float, default=0.01,
+                    help='delay between a detection and its reception by the detector (seconds)');
+    parser.add_argument('--max_tag_age', action="store", type=float, default=0.3,
+                    help='see WordCardDetector');
+    parser.add_argument('--go_card_timeout', action="store", type=float, default=1.0,
+                    help='see WordCardDetector');
+    parser.add_argument('--seed', action="store", type=int, default=0,
+                    help='seed of the synthetic trials');
+    args = parser.parse_args();
+
+    random.seed(args.seed)
+    if args.input is not None:
+        benchmarkRecorded(args)
+    else:
+        for numVisibleTags in args.visible_tags:
+            benchmarkSynthetic(args, numVisibleTags)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+'''
+Build the letter datasets of a letter_model_dataset_directory ('[a-z].dat'
+files and 'params.dat') from the demonstrations recorded in stroke archives
+(see exportStrokeArchive.py), the letters being built in a pool of processes.
+
+Only the shapes of which the letter is known are used. Each shape (its strokes
+merged, in order) is resampled to NUMPOINTS_SHAPEMODELER points and
+normalised to a height of 1.
+'''
+
+import os
+import sys
+
+import numpy
+
+try:
+    from letter_learning_interaction.stroke_archive import StrokeArchive
+    from letter_learning_interaction.letter_dataset import NUMPOINTS_SHAPEMODELER, resampleShapes, normaliseShapeHeights, writeDataset, writeParams
+except ImportError: #not built with catkin: use the sources
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'include'))
+    from stroke_archive import StrokeArchive
+    from letter_dataset import NUMPOINTS_SHAPEMODELER, resampleShapes, normaliseShapeHeights, writeDataset, writeParams
+
+def buildLetter(task):
+    """Writes the dataset of one letter from its shapes in each archive.
+
+    :returns: the letter and the number of shapes written
+    """
+    letter, shapesPerArchive, outputDirectory, numPoints, minPoints = task
+    datasets = []
+    for archivePath, indexes in shapesPerArchive:
+        archive = StrokeArchive(archivePath)
+        indexes = numpy.asarray(indexes, dtype=numpy.int64)
+        starts = archive.strokeOffsets[archive.shapeOffsets[indexes]]
+        ends = archive.strokeOffsets[archive.shapeOffsets[indexes + 1]]
+        keep = ends - starts >= minPoints
+        if not numpy.any(keep):
+            continue
+        shapes = resampleShapes(archive.points, starts[keep], ends[keep], numPoints)
+        shapes[:, numPoints:] *= -1 #tablet y axis points down, the shape modelers' up
+        datasets.append(normaliseShapeHeights(shapes))
+
+    if not datasets:
+        return letter, 0
+    shapes = numpy.concatenate(datasets)
+    writeDataset(os.path.join(outputDirectory, letter + '.dat'), shapes)
+    return letter, len(shapes)
+
+if __name__ == "__main__":
+    #parse arguments
+    import argparse
+    parser = argparse.ArgumentParser(description='Build letter datasets from recorded demonstrations');
+    parser.add_argument('output', action="store",
+                    help='dataset directory to write the [a-z].dat and params.dat files to');
+    parser.add_argument('archives', action="store", nargs='+',
+                    help='stroke archive directories to read the demonstrations from');
+    parser.add_argument('--letters', action="store", type=str, default=None,
+                    help='only build the datasets of these letters (e.g. abc)');
+    parser.add_argument('--num_points', action="store", type=int, default=NUMPOINTS_SHAPEMODELER,
+                    help='number of points of the shapes');
+    parser.add_argument('--min_points', action="store", type=int, default=2,
+                    help='ignore demonstrations with fewer points than this');
+    parser.add_argument('--initial_param_value', action="store", type=float, default=0.0,
+                    help='initial value of the parameter to vary written to params.dat for each letter');
+    parser.add_argument('--processes', action="store", type=int, default=None,
+                    help='number of processes building letters in parallel (default: one per CPU)');
+    args = parser.parse_args();
+
+    #group the shapes of all the archives by letter
+    shapesPerLetter = {};
+    for archivePath in args.archives:
+        archive = StrokeArchive(archivePath);
+        letters = numpy.char.decode(numpy.asarray(archive.letter), 'utf-8');
+        for letter in numpy.unique(letters):
+            if letter == '' or (args.letters is not None and letter not in args.letters):
+                continue;
+            shapesPerLetter.setdefault(letter, []).append((archivePath, numpy.flatnonzero(letters == letter)));
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output);
+
+    tasks = [(letter, shapes, args.output, args.num_points, args.min_points) for letter, shapes in sorted(shapesPerLetter.items())];
+    import multiprocessing
+    pool = multiprocessing.Pool(args.processes);
+    try:
+        results = pool.map(buildLetter, tasks, chunksize=1);
+    finally:
+        pool.close();
+        pool.join();
+
+    built = dict((letter, numShapes) for letter, numShapes in results if numShapes > 0);
+    writeParams(os.path.join(args.output, 'params.dat'), dict((letter, args.initial_param_value) for letter in built));
+    for letter in sorted(built.keys()):
+        print('%s: %d demonstrations' % (letter, built[letter]));
+    print('Built %d letter datasets in %s' % (len(built), args.output));
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+'''
+Synthesizes the robot's phrases (see speech_cache.py) ahead of an
+experiment, so that learning_words_nao.py doesn't have to at startup:
+
+    buildSpeechCache.py /home/nao/speech_cache --nao_ip <robot> --language french
+
+then run the interaction with speech_cache_directory:=/home/nao/speech_cache
+(and the same speech_cache_index). With --local, the phrases are rendered by
+the stand-in backend (silent files, e.g. to try the cache without a robot).
+'''
+
+import os
+import time
+
+from letter_learning_interaction.speech_cache import SpeechCache, NaoqiSpeechBackend, LocalSpeechBackend, utterances
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Synthesize the phrases of the interaction to a speech cache.');
+    parser.add_argument('directory', action="store", type=str,
+                    help='directory of the speech cache (on the robot, unless --local)');
+    parser.add_argument('--language', action="store", type=str, default='english',
+                    help='language of the phrases');
+    parser.add_argument('--words', action="store", nargs='+', default=None,
+                    help='words to format the phrases with (default: the words of the cards)');
+    parser.add_argument('--index', action="store", type=str, default='~/.ros/speech_cache.json',
+                    help='index of the phrases synthesized (as the speech_cache_index parameter of the node)');
+    parser.add_argument('--nao_ip', action="store", type=str, default='127.0.0.1',
+                    help='address of the robot');
+    parser.add_argument('--port', action="store", type=int, default=9559,
+                    help='NAOqi port of the robot');
+    parser.add_argument('--local', action="store_true",
+                    help='use the local stand-in backend instead of the robot');
+    parser.add_argument('--workers', action="store", type=int, default=2,
+                    help='number of phrases synthesized at once');
+    args = parser.parse_args();
+
+    if args.local:
+        backend = LocalSpeechBackend(language=args.language)
+    else:
+        from naoqi import ALProxy
+        textToSpeech = ALProxy("ALTextToSpeech", args.nao_ip, args.port)
+        textToSpeech.setLanguage(args.language.capitalize())
+        backend = NaoqiSpeechBackend(textToSpeech, ALProxy("ALAudioPlayer", args.nao_ip, args.port))
+
+    cache = SpeechCache(backend, args.directory, os.path.expanduser(args.index))
+    texts = utterances(args.language, args.words)
+    start = time.time()
+    numRendered = cache.render(texts, args.workers)
+    print('%d phrases, %d synthesized in %.1f s (index: %s)' % (len(texts), numRendered, time.time() - start, cache.indexFile))
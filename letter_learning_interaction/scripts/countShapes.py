@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 '''
 Count things received from rosbags of nao_ros_cowriter experiment.
+
+Either live, while a rosbag is being played, or offline (--bags), reading
+the bag files directly: a directory of bags is then processed in parallel, and
+the counters of all the sessions are written to a single csv file.
 '''
 
+import os
 import rospy
 from nav_msgs.msg import Path
 from std_msgs.msg import Empty, String
@@ -12,100 +17,200 @@ WORDS_TOPIC = 'words_to_write';
 TEST_TOPIC = 'test_learning';
 STOP_TOPIC = 'stop_learning';
 
-time_firstEvent = None;
-userShapes = [];
-strokes = []
-numUserShapes=0;
-numStrokes = 0;
-numCorrectionsReceivedForThisWord = 0;
-interactionFinished = False;
-def on_user_traj(message):
-    global numStrokes, numCorrectionsReceivedForThisWord,time_firstEvent, strokes, userShapes
-    if(time_firstEvent is None):
-        time_firstEvent = rospy.Time.now();
-        
-    if(len(message.poses)==0 and numStrokes > 0): #shape finished
-        global numUserShapes
-        numUserShapes+=1;
-        
-        numStrokes = 0;
-        strokes = [];
-        numCorrectionsReceivedForThisWord += 1;
-        userShapes.append(strokes);
-    elif(len(message.poses)>0 and not interactionFinished):
-        stroke = [];
-        for point in message.poses:
-            stroke.extend([point.pose.position.x, point.pose.position.y]);
-            
-        strokeString = ','.join(map(str, stroke))
-        writer_letters.writerow([str(numUserShapes) + ',' + str(numStrokes) + ',' +strokeString]);
-        numStrokes += 1;
-        writer.writerow(['Word','Number of corrections received', 'Number of corrections responded to', 'Number of corrections ignored']);
-        
-numRobotShapes=0
-numCorrectionsRespondedToForThisWord = -1; #don't count the first drawing as a 'correction' 
-def on_robot_traj(message):
-    global numRobotShapes, numCorrectionsRespondedToForThisWord,time_firstEvent
-    if(time_firstEvent is None):
-        time_firstEvent = rospy.Time.now();
-    numRobotShapes+=1;
-    numCorrectionsRespondedToForThisWord += 1;
-
-numWords = 0;
-numCorrectionsIgnored = 0;
-prevWord = None;
-def on_word(message):
-    global numWords, numCorrectionsReceivedForThisWord, numCorrectionsRespondedToForThisWord, numCorrectionsIgnored, prevWord,time_firstEvent
-    if(time_firstEvent is None):
-        time_firstEvent = rospy.Time.now();
-    if(message.data != 'end'):
-        numWords += 1;
-    #if(prevWord is not None):
-    if(True):
-        numCorrectionsIgnoredForThisWord = numCorrectionsReceivedForThisWord - numCorrectionsRespondedToForThisWord;
-        print('Number of corrections received for previous word: ' + str(numCorrectionsReceivedForThisWord))
-        print('Number of corrections responded to for previous word: '+str(numCorrectionsRespondedToForThisWord))
-        print('Number of corrections ignored: ' + str(numCorrectionsIgnoredForThisWord))
-        numCorrectionsIgnored += numCorrectionsIgnoredForThisWord;
-        writer.writerow([prevWord,str(numCorrectionsReceivedForThisWord),str(numCorrectionsRespondedToForThisWord),str(numCorrectionsIgnoredForThisWord)]);
-        numCorrectionsRespondedToForThisWord = -1;
-        numCorrectionsReceivedForThisWord = 0;        
-    else:
-        writer.writerow(['Word','Number of corrections received', 'Number of corrections responded to', 'Number of corrections ignored']);
-    print('-------------------Number of word requests received: ' + str(numWords) + ' ('+message.data+')');
-    prevWord = message.data;
-    
-numWordsBeforeTest = 0;    
-def onTestRequestReceived(message):
-    global numWordsBeforeTest
-    print('Number of words before test: '+str(numWords));
-    numWordsBeforeTest = numWords;
-    
-def onStopRequestReceived(message):
-    global interactionFinished
-    interactionFinished = True;
-    message = String()
-    message.data = 'end'
-    on_word(message);
-    print('Total number of user-drawn shapes: '+str(numUserShapes));
-    print('Total number of robot-drawn shape messages: '+str(numRobotShapes));
-    print('Total number of corrections ignored: '+str(numCorrectionsIgnored));
-    print('Total number of words: '+str(numWords));
-    time_stop = rospy.Time.now();
-    duration = time_stop - time_firstEvent;
-    print('Total time: '+str(duration.to_sec()))
-           
-    
-    #writer.writerow(['Total number of robot-drawn shape messages',str(numRobotShapes)]);
-    writer.writerow(['Total number of words', str(numWords)]);
-    writer.writerow(['Number of words before test', str(numWordsBeforeTest)]);
-    writer.writerow(['Total number of robot-drawn letters',str(numRobotShapes+2*numWords)]); #three letter words are sent as one message\
-    writer.writerow(['Total number of user-drawn shapes',str(numUserShapes)]);
-    writer.writerow(['Total number of user-drawn shapes responded to',str(numUserShapes-numCorrectionsIgnored)]);
-    writer.writerow(['Total number of corrections ignored', str(numCorrectionsIgnored)]);
-    
-
-args = None
+WORDS_HEADER = ['Word','Number of corrections received', 'Number of corrections responded to', 'Number of corrections ignored'];
+
+class SessionCounter:
+    """Counters of one interaction session. Rows for the words (and totals)
+    and for the strokes of user-drawn shapes are given to writer.writerow and
+    writer_letters.writerow.
+    """
+    def __init__(self, writer, writer_letters, verbose=True):
+        self.writer = writer;
+        self.writer_letters = writer_letters;
+        self.verbose = verbose;
+
+        self.time_firstEvent = None;
+        self.time_stop = None;
+        self.userShapes = [];
+        self.strokes = [];
+        self.numUserShapes = 0;
+        self.numStrokes = 0;
+        self.numCorrectionsReceivedForThisWord = 0;
+        self.interactionFinished = False;
+
+        self.numRobotShapes = 0;
+        self.numCorrectionsRespondedToForThisWord = -1; #don't count the first drawing as a 'correction'
+
+        self.numWords = 0;
+        self.numCorrectionsIgnored = 0;
+        self.prevWord = None;
+        self.numWordsBeforeTest = 0;
+
+    def log(self, text):
+        if(self.verbose):
+            print(text);
+
+    def onEvent(self, time):
+        if(self.time_firstEvent is None):
+            self.time_firstEvent = time;
+
+    def on_user_traj(self, message, time):
+        self.onEvent(time);
+
+        if(len(message.poses)==0 and self.numStrokes > 0): #shape finished
+            self.numUserShapes+=1;
+
+            self.numStrokes = 0;
+            self.strokes = [];
+            self.numCorrectionsReceivedForThisWord += 1;
+            self.userShapes.append(self.strokes);
+        elif(len(message.poses)>0 and not self.interactionFinished):
+            stroke = [];
+            for point in message.poses:
+                stroke.extend([point.pose.position.x, point.pose.position.y]);
+
+            strokeString = ','.join(map(str, stroke))
+            self.writer_letters.writerow([str(self.numUserShapes) + ',' + str(self.numStrokes) + ',' +strokeString]);
+            self.numStrokes += 1;
+
+    def on_robot_traj(self, message, time):
+        self.onEvent(time);
+        self.numRobotShapes+=1;
+        self.numCorrectionsRespondedToForThisWord += 1;
+
+    def on_word(self, message, time):
+        self.onEvent(time);
+        if(message.data != 'end'):
+            self.numWords += 1;
+
+        numCorrectionsIgnoredForThisWord = self.numCorrectionsReceivedForThisWord - self.numCorrectionsRespondedToForThisWord;
+        self.log('Number of corrections received for previous word: ' + str(self.numCorrectionsReceivedForThisWord))
+        self.log('Number of corrections responded to for previous word: '+str(self.numCorrectionsRespondedToForThisWord))
+        self.log('Number of corrections ignored: ' + str(numCorrectionsIgnoredForThisWord))
+        self.numCorrectionsIgnored += numCorrectionsIgnoredForThisWord;
+        self.writer.writerow([self.prevWord,str(self.numCorrectionsReceivedForThisWord),str(self.numCorrectionsRespondedToForThisWord),str(numCorrectionsIgnoredForThisWord)]);
+        self.numCorrectionsRespondedToForThisWord = -1;
+        self.numCorrectionsReceivedForThisWord = 0;
+
+        self.log('-------------------Number of word requests received: ' + str(self.numWords) + ' ('+message.data+')');
+        self.prevWord = message.data;
+
+    def onTestRequestReceived(self, message, time):
+        self.log('Number of words before test: '+str(self.numWords));
+        self.numWordsBeforeTest = self.numWords;
+
+    def onStopRequestReceived(self, message, time):
+        self.interactionFinished = True;
+        message = String()
+        message.data = 'end'
+        self.on_word(message, time);
+        self.time_stop = time;
+        self.log('Total number of user-drawn shapes: '+str(self.numUserShapes));
+        self.log('Total number of robot-drawn shape messages: '+str(self.numRobotShapes));
+        self.log('Total number of corrections ignored: '+str(self.numCorrectionsIgnored));
+        self.log('Total number of words: '+str(self.numWords));
+        self.log('Total time: '+str(self.duration()))
+
+        for row in self.totals():
+            self.writer.writerow(row);
+
+    def duration(self):
+        if(self.time_firstEvent is None or self.time_stop is None):
+            return 0.0;
+        return (self.time_stop - self.time_firstEvent).to_sec();
+
+    def totals(self):
+        #['Total number of robot-drawn shape messages',str(self.numRobotShapes)]
+        return [['Total number of words', str(self.numWords)],
+                ['Number of words before test', str(self.numWordsBeforeTest)],
+                ['Total number of robot-drawn letters',str(self.numRobotShapes+2*self.numWords)], #three letter words are sent as one message
+                ['Total number of user-drawn shapes',str(self.numUserShapes)],
+                ['Total number of user-drawn shapes responded to',str(self.numUserShapes-self.numCorrectionsIgnored)],
+                ['Total number of corrections ignored', str(self.numCorrectionsIgnored)]];
+
+class RowCollector:
+    """Stands for a csv writer, keeping the rows in a list."""
+    def __init__(self):
+        self.rows = [];
+
+    def writerow(self, row):
+        self.rows.append(row);
+
+def countBag(bagPath):
+    """Counts the messages of one bag file, as the live mode would while it is
+    played. Returns the session name, the rows for the words and totals, the
+    rows for the letters, the totals and the duration of the session.
+    """
+    import rosbag
+
+    session = os.path.splitext(os.path.basename(bagPath))[0];
+    writer = RowCollector();
+    writer_letters = RowCollector();
+    counter = SessionCounter(writer, writer_letters, verbose=False);
+    handlers = {SHAPES_TOPIC.strip('/'): counter.on_user_traj,
+                LETTER_TOPIC.strip('/'): counter.on_robot_traj,
+                WORDS_TOPIC.strip('/'): counter.on_word,
+                TEST_TOPIC.strip('/'): counter.onTestRequestReceived,
+                STOP_TOPIC.strip('/'): counter.onStopRequestReceived};
+    topics = list(handlers.keys()) + ['/'+topic for topic in handlers.keys()];
+
+    lastTime = None;
+    with rosbag.Bag(bagPath) as bag:
+        for topic, message, time in bag.read_messages(topics=topics):
+            handlers[topic.strip('/')](message, time);
+            lastTime = time;
+
+    if(not counter.interactionFinished):
+        rospy.logwarn('No stop request in %s: counting up to the end of the bag' % bagPath);
+        counter.onStopRequestReceived(Empty(), lastTime);
+
+    return session, writer.rows, writer_letters.rows, counter.totals(), counter.duration();
+
+def countBags(bagPaths, output, output_letters, numProcesses=None):
+    """Counts the bags in a pool of processes, and writes the rows of all the
+    sessions to output (with the name of the session as first column) and
+    the letters of each session to output_letters/<session>.csv.
+    """
+    import csv
+    import multiprocessing
+
+    pool = multiprocessing.Pool(numProcesses);
+    try:
+        results = pool.map(countBag, bagPaths, chunksize=1);
+    finally:
+        pool.close();
+        pool.join();
+
+    if(not os.path.isdir(output_letters)):
+        os.makedirs(output_letters);
+
+    overallTotals = None;
+    totalDuration = 0.0;
+    with open(output,'wb') as csvfile:
+        writer = csv.writer(csvfile, delimiter=' ', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['Session'] + WORDS_HEADER);
+        for session, rows, letterRows, totals, duration in results:
+            for row in rows:
+                writer.writerow([session] + row);
+
+            with open(os.path.join(output_letters, session + '.csv'),'wb') as csvfile_letters:
+                writer_letters = csv.writer(csvfile_letters, delimiter=' ', quoting=csv.QUOTE_MINIMAL)
+                for row in letterRows:
+                    writer_letters.writerow(row);
+
+            if(overallTotals is None):
+                overallTotals = [[name, int(value)] for name, value in totals];
+            else:
+                for total, (_, value) in zip(overallTotals, totals):
+                    total[1] += int(value);
+            totalDuration += duration;
+            print('%s: %d words, %d user-drawn shapes' % (session, int(totals[0][1]), int(totals[3][1])));
+
+        if(overallTotals is not None):
+            for name, value in overallTotals:
+                writer.writerow(['All sessions', name, str(value)]);
+            writer.writerow(['All sessions', 'Total time', str(totalDuration)]);
+    print('Counted %d sessions' % len(results));
 
 if __name__ == "__main__":
     #parse arguments
@@ -114,30 +219,44 @@ if __name__ == "__main__":
     parser.add_argument('output', action="store",
                     help='a string containing the name of csv file to write to');
     parser.add_argument('output_letters', action="store",
-                    help='a string containing the name of csv file to write letter strokes to');
-    global args
+                    help='a string containing the name of csv file to write letter strokes to (with --bags: the directory to write one such file per bag to)');
+    parser.add_argument('--bags', action="store", nargs='+', default=None,
+                    help='bag files (or directories of bag files) to read directly instead of listening to a rosbag being played');
+    parser.add_argument('--processes', action="store", type=int, default=None,
+                    help='number of processes reading bags in parallel (default: one per CPU)');
     args = parser.parse_args();
 
-    import csv
-    csvfile = open(args.output,'wb')
-    writer = csv.writer(csvfile, delimiter=' ',
-                                #quotechar='|', 
-                                quoting=csv.QUOTE_MINIMAL)
-
-    csvfile_letters = open(args.output_letters,'wb')
-    writer_letters = csv.writer(csvfile_letters, delimiter=' ',
-                                #quotechar='', 
-                                quoting=csv.QUOTE_MINIMAL)
-    
-    
-    rospy.init_node('shape_counter')
-    user_traj = rospy.Subscriber(SHAPES_TOPIC, Path, on_user_traj)
-    robot_traj = rospy.Subscriber(LETTER_TOPIC, Path, on_robot_traj)
-    words_subscriber = rospy.Subscriber(WORDS_TOPIC, String, on_word);
-    test_subscriber = rospy.Subscriber(TEST_TOPIC, Empty, onTestRequestReceived);
-    stop_subscriber = rospy.Subscriber(STOP_TOPIC, Empty, onStopRequestReceived); 
-    print('Waiting for rosbag to start')
-
-    rospy.spin()
-    csvfile.close()
-    csvfile_letters.close()
+    if(args.bags is not None):
+        bagPaths = [];
+        for path in args.bags:
+            if(os.path.isdir(path)):
+                bagPaths.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.bag')));
+            else:
+                bagPaths.append(path);
+        countBags(bagPaths, args.output, args.output_letters, args.processes);
+    else:
+        import csv
+        csvfile = open(args.output,'wb')
+        writer = csv.writer(csvfile, delimiter=' ',
+                                    #quotechar='|',
+                                    quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(WORDS_HEADER);
+
+        csvfile_letters = open(args.output_letters,'wb')
+        writer_letters = csv.writer(csvfile_letters, delimiter=' ',
+                                    #quotechar='',
+                                    quoting=csv.QUOTE_MINIMAL)
+
+        rospy.init_node('shape_counter')
+        counter = SessionCounter(writer, writer_letters);
+        withTime = lambda handler: (lambda message: handler(message, rospy.Time.now()));
+        user_traj = rospy.Subscriber(SHAPES_TOPIC, Path, withTime(counter.on_user_traj))
+        robot_traj = rospy.Subscriber(LETTER_TOPIC, Path, withTime(counter.on_robot_traj))
+        words_subscriber = rospy.Subscriber(WORDS_TOPIC, String, withTime(counter.on_word));
+        test_subscriber = rospy.Subscriber(TEST_TOPIC, Empty, withTime(counter.onTestRequestReceived));
+        stop_subscriber = rospy.Subscriber(STOP_TOPIC, Empty, withTime(counter.onStopRequestReceived));
+        print('Waiting for rosbag to start')
+
+        rospy.spin()
+        csvfile.close()
+        csvfile_letters.close()
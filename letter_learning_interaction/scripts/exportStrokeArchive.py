@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+'''
+Export user-drawn shapes to a columnar stroke archive (see
+letter_learning_interaction.stroke_archive), from the letters csv files written
+by countShapes.py or directly from the bags of nao_ros_cowriter experiments.
+
+The session of a shape is the name of the file it comes from. Shapes read from
+bags also get the word requested when they were drawn, their start and end
+times and, when /rosout was recorded, the letter which learning_words_nao.py
+attributed the demonstration to.
+'''
+
+import os
+import re
+
+try:
+    from letter_learning_interaction.stroke_archive import StrokeArchiveWriter, readStrokesCsv
+except ImportError: #not built with catkin: use the sources
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'include'))
+    from stroke_archive import StrokeArchiveWriter, readStrokesCsv
+
+SHAPES_TOPIC = 'user_shapes';
+WORDS_TOPIC = 'words_to_write';
+STOP_TOPIC = 'stop_learning';
+ROSOUT_TOPIC = 'rosout';
+
+#logged by learning_words_nao.py when a demonstration is attributed to a letter
+DEMONSTRATION_LOG = re.compile(r'^Received demonstration for (?:selected letter )?(\S+)$');
+
+def readBag(bagPath):
+    """Reads the user-drawn shapes of a bag, as countShapes.py counts them.
+
+    :returns: the session name, and a list of (strokes, word, letter,
+    startTime, endTime) for each shape
+    """
+    import rosbag
+
+    session = os.path.splitext(os.path.basename(bagPath))[0];
+    shapes = [];
+    strokes = [];
+    startTime = None;
+    word = '';
+    interactionFinished = False;
+    topics = [SHAPES_TOPIC, WORDS_TOPIC, STOP_TOPIC, ROSOUT_TOPIC];
+
+    with rosbag.Bag(bagPath) as bag:
+        for topic, message, time in bag.read_messages(topics=topics + ['/'+topic for topic in topics]):
+            topic = topic.strip('/');
+            if(topic == SHAPES_TOPIC):
+                if(len(message.poses) == 0 and len(strokes) > 0): #shape finished
+                    shapes.append([strokes, word, '', startTime, time.to_sec()]);
+                    strokes = [];
+                elif(len(message.poses) > 0 and not interactionFinished):
+                    if(len(strokes) == 0):
+                        startTime = time.to_sec();
+                    strokes.append([(point.pose.position.x, point.pose.position.y) for point in message.poses]);
+            elif(topic == WORDS_TOPIC):
+                word = message.data;
+            elif(topic == STOP_TOPIC):
+                interactionFinished = True;
+            elif(topic == ROSOUT_TOPIC):
+                match = DEMONSTRATION_LOG.match(message.msg);
+                if(match and shapes and shapes[-1][2] == ''):
+                    shapes[-1][2] = match.group(1); #the last shape finished is the one being attributed
+
+    return session, shapes;
+
+if __name__ == "__main__":
+    #parse arguments
+    import argparse
+    parser = argparse.ArgumentParser(description='Export user-drawn shapes to a stroke archive');
+    parser.add_argument('output', action="store",
+                    help='directory to write the archive to');
+    parser.add_argument('inputs', action="store", nargs='+',
+                    help='letters csv files written by countShapes.py and/or bag files (or directories of them)');
+    parser.add_argument('--processes', action="store", type=int, default=None,
+                    help='number of processes reading bags in parallel (default: one per CPU)');
+    args = parser.parse_args();
+
+    paths = [];
+    for path in args.inputs:
+        if(os.path.isdir(path)):
+            paths.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith('.bag') or name.endswith('.csv')));
+        else:
+            paths.append(path);
+    bagPaths = [path for path in paths if path.endswith('.bag')];
+    csvPaths = [path for path in paths if not path.endswith('.bag')];
+
+    archive = StrokeArchiveWriter();
+    for path in csvPaths:
+        session = os.path.splitext(os.path.basename(path))[0];
+        for strokes in readStrokesCsv(path):
+            archive.addShape(strokes, session=session);
+
+    if(bagPaths):
+        import multiprocessing
+        pool = multiprocessing.Pool(args.processes);
+        try:
+            results = pool.map(readBag, bagPaths, chunksize=1);
+        finally:
+            pool.close();
+            pool.join();
+        for session, shapes in results:
+            for strokes, word, letter, startTime, endTime in shapes:
+                archive.addShape(strokes, session, word, letter, startTime, endTime);
+
+    archive.save(args.output);
+    print('Exported %d shapes from %d files to %s' % (len(archive), len(paths), args.output));
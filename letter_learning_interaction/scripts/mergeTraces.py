@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+'''
+Merge the Chrome traces written by the nodes (see tracing.py, ~trace_file)
+into one trace file.
+
+With --by_trace, the spans are instead grouped by trace ID: each trace (e.g.
+one turn of the interaction, from the word or demonstration which started it)
+becomes a process of the merged trace, with one row per node, so that every
+turn shows as its own waterfall. Traces are ordered by their first span.
+'''
+
+import json
+
+def loadEvents(paths):
+    events = []
+    for path in paths:
+        with open(path) as f:
+            events.extend(json.load(f)['traceEvents'])
+    return events
+
+def groupByTrace(events):
+    """:returns: the span events of the trace events, one process per trace
+    ID and one thread per node (named after the processes of the input)"""
+    processNames = dict((e['pid'], e['args']['name']) for e in events if e.get('ph') == 'M' and e['name'] == 'process_name')
+    spans = [e for e in events if e.get('ph') == 'X' and e.get('args', {}).get('trace_id')]
+    firstSpan = {}
+    for span in spans:
+        traceId = span['args']['trace_id']
+        firstSpan[traceId] = min(firstSpan.get(traceId, span['ts']), span['ts'])
+    traceIds = sorted(firstSpan, key=lambda traceId: firstSpan[traceId])
+    tracePids = dict((traceId, i + 1) for i, traceId in enumerate(traceIds))
+    nodes = sorted(set(processNames.get(span['pid'], str(span['pid'])) for span in spans))
+    nodeTids = dict((node, i + 1) for i, node in enumerate(nodes))
+
+    merged = []
+    for traceId in traceIds:
+        merged.append({'name': 'process_name', 'ph': 'M', 'pid': tracePids[traceId], 'tid': 0, 'args': {'name': 'trace ' + traceId}})
+        merged.append({'name': 'process_sort_index', 'ph': 'M', 'pid': tracePids[traceId], 'tid': 0, 'args': {'sort_index': tracePids[traceId]}})
+        for node in nodes:
+            merged.append({'name': 'thread_name', 'ph': 'M', 'pid': tracePids[traceId], 'tid': nodeTids[node], 'args': {'name': node}})
+    for span in spans:
+        span = dict(span)
+        node = processNames.get(span['pid'], str(span['pid']))
+        span['pid'], span['tid'] = tracePids[span['args']['trace_id']], nodeTids[node]
+        merged.append(span)
+    return merged
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Merge the Chrome traces of several nodes');
+    parser.add_argument('output', action="store",
+                    help='merged trace file to write');
+    parser.add_argument('traces', action="store", nargs='+',
+                    help='trace files written by the nodes');
+    parser.add_argument('--by_trace', action="store_true",
+                    help='one waterfall (process) per trace ID instead of one process per node');
+    args = parser.parse_args();
+
+    events = loadEvents(args.traces);
+    if args.by_trace:
+        events = groupByTrace(events);
+    with open(args.output, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f);
+    print('Wrote %d events to %s' % (len(events), args.output));
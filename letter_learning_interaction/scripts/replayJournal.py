@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+'''
+Replays the inputs of a session recorded by learning_words_nao.py (with its
+input_journal parameter, see input_journal.py) through its state machine and
+shape learners, in-process and without ROS, tablet or robot, as
+simulateInteraction.py does (same fakes, see its arguments):
+
+    replayJournal.py session.journal --dataset_directory <letter datasets>
+
+The node is set up with the parameters recorded in the journal, and each input
+is delivered on its topic at the time it was received, relative to the start
+of the node. By default, time is virtual, so the session is replayed as fast
+as it can be; with --real_time, it is replayed in real time, the inputs being
+delivered from another thread as rospy does. If the journal doesn't end with
+the stop card, it is shown --tail seconds after the last input. A journal
+reopened by later sessions holds each of them: the last one is replayed,
+unless another is chosen with --session.
+
+Reports the same timings as simulateInteraction.py, and a digest of the
+trajectories the robot wrote: two replays of a journal with the same --seed
+write the same trajectories.
+'''
+
+import hashlib
+import json
+import random
+import threading
+import time
+
+import numpy
+
+import ros_stand_ins
+from simulateInteraction import Recorder, percentiles, startNode, stopNode, printTimings
+
+#kind of input -> topic of the node it is received on (name of the module's attribute)
+TOPICS = {'word': 'WORDS_TOPIC', 'demonstration': 'PROCESSED_USER_SHAPE_TOPIC', 'gesture': 'GESTURE_TOPIC',
+          'test': 'TEST_TOPIC', 'stop': 'STOP_TOPIC',
+          'shape_finished': 'SHAPE_FINISHED_TOPIC', 'new_child': 'NEW_CHILD_TOPIC', 'clear': 'CLEAR_SURFACE_TOPIC'}
+
+class TrajectoryDigest:
+    """Hashes the trajectories the robot writes."""
+    def __init__(self, node):
+        import rospy
+        from nav_msgs.msg import Path
+        self.digest = hashlib.sha1()
+        self.subscriber = rospy.Subscriber(node.SHAPE_TOPIC, Path, self.onTrajectory)
+
+    def onTrajectory(self, traj):
+        points = [(pose.pose.position.x, pose.pose.position.y) for pose in traj.poses]
+        self.digest.update(numpy.ascontiguousarray(points, dtype=float).data)
+
+class Player:
+    """Publishes the inputs of a journal on the node's topics."""
+    def __init__(self, node, inputs, startTime, skip, recorder):
+        import rospy
+        from std_msgs.msg import Empty
+        from letter_learning_interaction import input_journal
+        self.recorder = recorder
+        self.kindNames = input_journal.KIND_NAMES
+        self.inputs = [(inputTime - startTime, kind, message) for kind, inputTime, message in inputs
+                       if input_journal.KIND_NAMES[kind] not in skip]
+        self.stopped = any(self.kindNames[kind] == 'stop' for _, kind, _ in self.inputs)
+        self.replayed = {}
+        self.publishers = {}
+        for _, kind, message in self.inputs:
+            if kind not in self.publishers:
+                self.publishers[kind] = rospy.Publisher(getattr(node, TOPICS[self.kindNames[kind]]), type(message), queue_size=10)
+        self.pub_stop = rospy.Publisher(node.STOP_TOPIC, Empty, queue_size=10)
+
+    def end(self):
+        """:returns: the time of the last input"""
+        return self.inputs[-1][0] if self.inputs else 0.0
+
+    def deliver(self, kind, message):
+        name = self.kindNames[kind]
+        self.replayed[name] = self.replayed.get(name, 0) + 1
+        if name in ['word', 'demonstration']:
+            self.recorder.onInput(name)
+        self.publishers[kind].publish(message)
+
+    def stop(self):
+        from std_msgs.msg import Empty
+        self.pub_stop.publish(Empty())
+
+    def schedule(self, clock, tail):
+        """Schedules the inputs on a virtual clock."""
+        for offset, kind, message in self.inputs:
+            clock.schedule(offset, lambda kind=kind, message=message: self.deliver(kind, message))
+        if not self.stopped:
+            clock.schedule(self.end() + tail, self.stop)
+
+    def play(self, start, tail):
+        """Delivers the inputs in real time, from start (wall-clock time)."""
+        for offset, kind, message in self.inputs:
+            time.sleep(max(start + offset - time.time(), 0))
+            self.deliver(kind, message)
+        if not self.stopped:
+            time.sleep(max(start + self.end() + tail - time.time(), 0))
+            self.stop()
+
+def replay(args):
+    """Replays the journal.
+
+    :returns: the report (a dict)
+    """
+    clock = ros_stand_ins.Clock() if args.real_time else ros_stand_ins.VirtualClock()
+    ros_stand_ins.install(clock) #for the messages of the journal (startNode installs them again, with the parameters)
+    from letter_learning_interaction import input_journal
+    sessions = input_journal.readJournal(args.journal)
+    metadata, inputs = sessions[args.session]
+    params = dict(metadata.get('parameters', {}), tracing=args.trace is not None)
+    if args.dataset_directory is not None:
+        params['dataset_directory'] = args.dataset_directory
+    startTime = metadata.get('start_time', inputs[0][1] if inputs else 0.0)
+
+    random.seed(args.seed)
+    numpy.random.seed(args.seed)
+    node, infoForStartState, displayManager, speechCacheDirectory = startNode(clock, params, args)
+
+    recorder = Recorder(clock, node)
+    digest = TrajectoryDigest(node)
+    player = Player(node, inputs, startTime, args.skip, recorder)
+    for state, handler in list(node.stateMachine.handlers.items()):
+        if handler is not None:
+            node.stateMachine.handlers[state] = recorder.timedHandler(state, handler)
+
+    wallStart = time.time()
+    if args.real_time:
+        feeder = threading.Thread(target=player.play, args=(wallStart, args.tail))
+        feeder.daemon = True
+        feeder.start()
+    else:
+        player.schedule(clock, args.tail)
+    node.stateMachine.run(infoForStartState)
+    wallDuration = time.time() - wallStart
+    duration = clock.now() - (wallStart if args.real_time else 0.0)
+    stopNode(node, args, speechCacheDirectory)
+
+    return {
+        'journal': args.journal,
+        'session': args.session % len(sessions),
+        'sessions': len(sessions),
+        'inputs': len(player.inputs),
+        'replayed': player.replayed,
+        'real_time': args.real_time,
+        'turns': recorder.turns,
+        'trajectories_digest': digest.digest.hexdigest(),
+        'interaction_time': duration,
+        'wall_clock_time': wallDuration,
+        'turns_per_minute': recorder.turns/(duration/60.0) if duration > 0 else 0.0,
+        'response_latency': dict((kind, {'interaction': percentiles([l for l, _ in latencies]),
+                                         'wall_clock': percentiles([w for _, w in latencies])})
+                                 for kind, latencies in recorder.responses.items()),
+        'turn_duration': dict((kind, percentiles(durations)) for kind, durations in recorder.turnDurations.items()),
+        'states': dict((state, {'interaction_time': sum(i for i, _ in visits),
+                                'wall_clock': percentiles([w for _, w in visits])})
+                       for state, visits in recorder.states.items()),
+        'display_manager_calls': displayManager.calls,
+        'trajectory_cache': {'hits': node.trajectoryCache.hits, 'misses': node.trajectoryCache.misses},
+    }
+
+def printReport(report):
+    print('Replayed %d inputs of session %d/%d of %s (%s)' % (report['inputs'], report['session'] + 1, report['sessions'], report['journal'],
+          ', '.join('%d %s' % (count, kind) for kind, count in sorted(report['replayed'].items()))))
+    print('%.1f s of interaction in %.2f s of wall-clock time (x%.0f)'
+          % (report['interaction_time'], report['wall_clock_time'], report['interaction_time']/max(report['wall_clock_time'], 1e-9)))
+    print('%d turns (%.2f per minute), trajectories digest %s' % (report['turns'], report['turns_per_minute'], report['trajectories_digest']))
+    printTimings(report)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Replay a journal of the inputs of learning_words_nao.py without ROS, tablet or robot')
+    parser.add_argument('journal', action="store", type=str,
+                    help='journal of the inputs of the session (as written with the input_journal parameter)')
+    parser.add_argument('--session', action="store", type=int, default=-1,
+                    help='index of the session to replay, if the journal was reopened by later sessions (default: the last one)')
+    parser.add_argument('--real_time', action="store_true",
+                    help='replay the inputs in real time (default: on a virtual clock, as fast as possible)')
+    parser.add_argument('--dataset_directory', action="store", type=str, default=None,
+                    help='letter model dataset directory (default: that of the session)')
+    parser.add_argument('--skip', action="store", nargs='+', default=[], choices=sorted(TOPICS),
+                    help='kinds of inputs not to replay')
+    parser.add_argument('--tail', action="store", type=float, default=60.0,
+                    help='seconds after the last input to show the stop card, if the session wasn\'t stopped')
+    parser.add_argument('--seed', action="store", type=int, default=0,
+                    help='seed of the random number generators')
+    parser.add_argument('--speech_rate', action="store", type=float, default=2.5,
+                    help='words said per second by the robot')
+    parser.add_argument('--speech_latency', action="store", type=float, default=0.3,
+                    help='seconds before the robot starts to say something')
+    parser.add_argument('--speech_cache', action="store_true",
+                    help='say the robot\'s phrases from a speech cache (without the speech latency when cached)')
+    parser.add_argument('--motion_latency', action="store", type=float, default=1.5,
+                    help='seconds taken by the robot\'s blocking motions (posture, arm down, rest)')
+    parser.add_argument('--display_manager_latency', action="store", type=float, default=0.002,
+                    help='seconds taken by each display manager service call')
+    parser.add_argument('--output', action="store", type=str, default=None,
+                    help='write the report to this JSON file')
+    parser.add_argument('--trace', action="store", type=str, default=None,
+                    help='trace the replayed interaction to this Chrome trace file')
+    parser.add_argument('--verbose', action="store_true",
+                    help='log the node\'s messages')
+    args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    report = replay(args)
+    printReport(report)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
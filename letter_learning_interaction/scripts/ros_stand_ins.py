@@ -0,0 +1,512 @@
+#!/usr/bin/env python
+'''
+In-process stand-ins for rospy and the message packages used by this package,
+so that its modules (and nodes) can be imported and run without a ROS master,
+e.g. by benchmarks and simulations.
+
+install() puts them in sys.modules (before the modules using them are
+imported):
+- rospy: topics and services are delivered synchronously within the process,
+  parameters come from a dict, and time is read from a Clock, which can be a
+  VirtualClock (rospy.sleep then advances the time instead of waiting)
+- std_msgs, geometry_msgs, nav_msgs, tf2_msgs: the messages used here
+- letter_learning_interaction.msg and .srv: built from the package's own msg
+  and srv files
+
+Messages are plain objects with the fields (and defaults) of their
+definition.
+'''
+
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import types
+
+PACKAGE = 'letter_learning_interaction'
+PACKAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+STANDARD_MESSAGES = {
+    'std_msgs/Header': 'uint32 seq\ntime stamp\nstring frame_id',
+    'std_msgs/String': 'string data',
+    'std_msgs/Empty': '',
+    'std_msgs/Bool': 'bool data',
+    'std_msgs/MultiArrayDimension': 'string label\nuint32 size\nuint32 stride',
+    'std_msgs/MultiArrayLayout': 'MultiArrayDimension[] dim\nuint32 data_offset',
+    'std_msgs/Float64MultiArray': 'MultiArrayLayout layout\nfloat64[] data',
+    'geometry_msgs/Point': 'float64 x\nfloat64 y\nfloat64 z',
+    'geometry_msgs/Vector3': 'float64 x\nfloat64 y\nfloat64 z',
+    'geometry_msgs/Quaternion': 'float64 x\nfloat64 y\nfloat64 z\nfloat64 w',
+    'geometry_msgs/Pose': 'Point position\nQuaternion orientation',
+    'geometry_msgs/PoseStamped': 'Header header\nPose pose',
+    'geometry_msgs/PointStamped': 'Header header\nPoint point',
+    'geometry_msgs/Transform': 'Vector3 translation\nQuaternion rotation',
+    'geometry_msgs/TransformStamped': 'Header header\nstring child_frame_id\nTransform transform',
+    'nav_msgs/Path': 'Header header\ngeometry_msgs/PoseStamped[] poses',
+    'tf2_msgs/TFMessage': 'geometry_msgs/TransformStamped[] transforms',
+}
+
+NUMERIC_TYPES = ['byte', 'char', 'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64']
+FLOAT_TYPES = ['float32', 'float64']
+
+# ------------------------------------------------------------------------ TIME
+class Clock:
+    """Wall-clock time."""
+    def now(self):
+        return time.time()
+
+    def sleep(self, duration):
+        if duration > 0:
+            time.sleep(duration)
+
+class VirtualClock:
+    """Time which only advances when slept (or advanced) through: sleeping
+    returns immediately, so code full of sleeps runs as fast as it can while
+    seeing the time it would have taken.
+
+    Callbacks can be scheduled at a virtual time: they are run, in order of
+    time, by the sleep (or advance) which goes past it, with the clock set to
+    that time.
+    """
+    def __init__(self, start=0.0):
+        self.time = start
+        self._lock = threading.Lock()
+        self._events = []
+        self._sequence = itertools.count()
+
+    def now(self):
+        return self.time
+
+    def schedule(self, delay, callback):
+        with self._lock:
+            heapq.heappush(self._events, (self.time + max(delay, 0), next(self._sequence), callback))
+
+    def advance(self, duration):
+        target = self.time + max(duration, 0)
+        while True:
+            with self._lock:
+                if not self._events or self._events[0][0] > target:
+                    self.time = max(self.time, target)
+                    return
+                due, _, callback = heapq.heappop(self._events)
+                self.time = max(self.time, due)
+            callback() #may itself sleep, moving the time past target
+
+    def sleep(self, duration):
+        self.advance(duration)
+
+class Duration(object):
+    __slots__ = ['secs', 'nsecs']
+
+    def __init__(self, secs=0, nsecs=0):
+        total = secs + nsecs*1e-9
+        self.secs = int(total // 1)
+        self.nsecs = int(round((total - self.secs)*1e9))
+
+    @classmethod
+    def from_sec(cls, secs):
+        return cls(secs)
+
+    def to_sec(self):
+        return self.secs + self.nsecs*1e-9
+
+    def __add__(self, other):
+        return type(self)(self.to_sec() + other.to_sec())
+
+    def __sub__(self, other):
+        return Duration(self.to_sec() - other.to_sec())
+
+    def __lt__(self, other):
+        return self.to_sec() < other.to_sec()
+
+    def __eq__(self, other):
+        return isinstance(other, Duration) and self.to_sec() == other.to_sec()
+
+    def __hash__(self):
+        return hash(self.to_sec())
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_sec())
+
+class Time(Duration):
+    __slots__ = []
+
+    @staticmethod
+    def now():
+        return Time(_state.clock.now())
+
+    def __add__(self, duration):
+        return Time(self.to_sec() + duration.to_sec())
+
+    def __sub__(self, other):
+        if isinstance(other, Time):
+            return Duration(self.to_sec() - other.to_sec())
+        return Time(self.to_sec() - other.to_sec())
+
+# -------------------------------------------------------------------- MESSAGES
+class Message(object):
+    __slots__ = []
+    _type = ''
+    _fields = []
+
+    def __init__(self, *args, **kwargs):
+        for (name, default), value in zip(self._fields, args):
+            setattr(self, name, value)
+        for name, default in self._fields[len(args):]:
+            setattr(self, name, kwargs[name] if name in kwargs else default())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, n) == getattr(other, n) for n, _ in self._fields)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __getstate__(self):
+        return [getattr(self, name) for name, _ in self._fields]
+
+    def __setstate__(self, state):
+        for (name, _), value in zip(self._fields, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '%s(%s)' % (self._type, ', '.join('%s=%r' % (n, getattr(self, n)) for n, _ in self._fields))
+
+class MessageRegistry:
+    """Message classes built from msg/srv definitions."""
+    def __init__(self):
+        self.definitions = {}
+        self.classes = {}
+
+    def resolve(self, typeName, package):
+        if typeName == 'Header':
+            return 'std_msgs/Header'
+        if '/' in typeName:
+            return typeName
+        if package + '/' + typeName in self.definitions or package + '/' + typeName in self.classes:
+            return package + '/' + typeName
+        return 'std_msgs/' + typeName
+
+    def defaultFactory(self, typeName, package):
+        isArray = typeName.endswith(']')
+        baseType = typeName[:typeName.index('[')] if isArray else typeName
+        if isArray:
+            return list
+        if baseType in NUMERIC_TYPES:
+            return int
+        if baseType in FLOAT_TYPES:
+            return float
+        if baseType == 'bool':
+            return bool
+        if baseType == 'string':
+            return str
+        if baseType == 'time':
+            return Time
+        if baseType == 'duration':
+            return Duration
+        fullName = self.resolve(baseType, package)
+        return lambda: self.messageClass(fullName)()
+
+    def makeClass(self, fullName, definition):
+        package = fullName.split('/')[0]
+        fields = []
+        constants = {}
+        for line in definition.split('\n'):
+            line = line.split('#')[0].strip()
+            if not line:
+                continue
+            typeName, rest = line.split(None, 1)
+            if '=' in rest:
+                name, value = [part.strip() for part in rest.split('=', 1)]
+                constants[name] = value if typeName == 'string' else float(value) if typeName in FLOAT_TYPES else int(value)
+            else:
+                fields.append((rest.strip(), self.defaultFactory(typeName, package)))
+        attributes = {'__slots__': [name for name, _ in fields], '_type': fullName, '_fields': fields}
+        attributes.update(constants)
+        return type(str(fullName.split('/')[1]), (Message,), attributes)
+
+    def messageClass(self, fullName):
+        if fullName not in self.classes:
+            self.classes[fullName] = self.makeClass(fullName, self.definitions[fullName])
+        return self.classes[fullName]
+
+    def addServices(self, package, directory):
+        """Defines the <name>, <name>Request and <name>Response classes of the srv files of a directory."""
+        services = {}
+        for fileName in sorted(os.listdir(directory)):
+            if not fileName.endswith('.srv'):
+                continue
+            name = fileName[:-4]
+            with open(os.path.join(directory, fileName)) as f:
+                lines = f.read().split('\n')
+            separator = [line.strip() for line in lines].index('---')
+            request, response = '\n'.join(lines[:separator]), '\n'.join(lines[separator + 1:])
+            requestClass = self.makeClass(package + '/' + name + 'Request', request)
+            responseClass = self.makeClass(package + '/' + name + 'Response', response)
+            self.classes[package + '/' + name + 'Request'] = requestClass
+            self.classes[package + '/' + name + 'Response'] = responseClass
+            services[name] = type(str(name), (object,), {'_request_class': requestClass,
+                                                         '_response_class': responseClass,
+                                                         '_type': package + '/' + name})
+            services[name + 'Request'] = requestClass
+            services[name + 'Response'] = responseClass
+        return services
+
+    def addMessages(self, package, directory):
+        for fileName in sorted(os.listdir(directory)):
+            if fileName.endswith('.msg'):
+                with open(os.path.join(directory, fileName)) as f:
+                    self.definitions[package + '/' + fileName[:-4]] = f.read()
+
+# ---------------------------------------------------------------------- RUNTIME
+class ROSException(Exception):
+    pass
+
+class ServiceException(Exception):
+    pass
+
+class ROSInterruptException(ROSException):
+    pass
+
+class State:
+    """Topics, services and parameters shared by the stand-ins."""
+    def __init__(self):
+        self.clock = Clock()
+        self.params = {}
+        self.nodeName = None
+        self.subscribers = {}
+        self.services = {}
+        self.shutdown = False
+        self.publishedCounts = {}
+        self.lock = threading.RLock()
+
+_state = State()
+
+def resolveName(name):
+    if name.startswith('~'):
+        return '/' + (_state.nodeName or 'node') + '/' + name[1:]
+    return name if name.startswith('/') else '/' + name
+
+def ns_join(namespace, name):
+    if not namespace or name.startswith('/') or name.startswith('~'):
+        return name
+    return namespace.rstrip('/') + '/' + name
+
+class Publisher:
+    def __init__(self, name, data_class, *args, **kwargs):
+        self.name = resolveName(name)
+        self.resolved_name = self.name
+        self.data_class = data_class
+        self.latch = kwargs.get('latch', False)
+        self.lastMessage = None
+
+    def publish(self, *args, **kwargs):
+        message = args[0] if len(args) == 1 and not kwargs and isinstance(args[0], Message) else self.data_class(*args, **kwargs)
+        self.lastMessage = message
+        with _state.lock:
+            _state.publishedCounts[self.name] = _state.publishedCounts.get(self.name, 0) + 1
+            subscribers = list(_state.subscribers.get(self.name, []))
+        for subscriber in subscribers:
+            subscriber.deliver(message)
+
+    def get_num_connections(self):
+        return len(_state.subscribers.get(self.name, []))
+
+    def unregister(self):
+        pass
+
+class Subscriber:
+    def __init__(self, name, data_class, callback=None, callback_args=None, *args, **kwargs):
+        self.name = resolveName(name)
+        self.resolved_name = self.name
+        self.data_class = data_class
+        self.callback = callback
+        self.callback_args = callback_args
+        with _state.lock:
+            _state.subscribers.setdefault(self.name, []).append(self)
+
+    def deliver(self, message):
+        if self.callback is None:
+            return
+        if self.callback_args is None:
+            self.callback(message)
+        else:
+            self.callback(message, self.callback_args)
+
+    def unregister(self):
+        with _state.lock:
+            if self in _state.subscribers.get(self.name, []):
+                _state.subscribers[self.name].remove(self)
+
+class Service:
+    def __init__(self, name, service_class, handler, *args, **kwargs):
+        self.name = resolveName(name)
+        self.service_class = service_class
+        self.handler = handler
+        _state.services[self.name] = self
+
+    def shutdown(self):
+        _state.services.pop(self.name, None)
+
+class ServiceProxy:
+    def __init__(self, name, service_class, persistent=False, *args, **kwargs):
+        self.name = resolveName(name)
+        self.service_class = service_class
+
+    def __call__(self, *args, **kwargs):
+        return self.call(*args, **kwargs)
+
+    def call(self, *args, **kwargs):
+        if self.name not in _state.services:
+            raise ServiceException('service [%s] unavailable' % self.name)
+        requestClass = self.service_class._request_class
+        if len(args) == 1 and not kwargs and isinstance(args[0], requestClass):
+            request = args[0]
+        else:
+            request = requestClass(*args, **kwargs)
+        response = _state.services[self.name].handler(request)
+        if response is None:
+            raise ServiceException('service [%s] returned no response' % self.name)
+        return response
+
+    def wait_for_service(self, timeout=None):
+        wait_for_service(self.name, timeout)
+
+    def close(self):
+        pass
+
+def wait_for_service(name, timeout=None):
+    if resolveName(name) not in _state.services:
+        raise ROSException('timeout exceeded while waiting for service %s' % resolveName(name))
+
+def init_node(name, *args, **kwargs):
+    _state.nodeName = name.strip('/')
+
+def get_name():
+    return '/' + (_state.nodeName or 'node')
+
+def get_param(name, default=KeyError):
+    name = resolveName(name)
+    if name in _state.params:
+        return _state.params[name]
+    if default is KeyError:
+        raise KeyError(name)
+    return default
+
+def set_param(name, value):
+    _state.params[resolveName(name)] = value
+
+def has_param(name):
+    return resolveName(name) in _state.params
+
+def sleep(duration):
+    if isinstance(duration, Duration):
+        duration = duration.to_sec()
+    _state.clock.sleep(duration)
+
+def get_time():
+    return _state.clock.now()
+
+class Rate:
+    def __init__(self, hz):
+        self.period = 1.0/hz
+
+    def sleep(self):
+        sleep(self.period)
+
+def is_shutdown():
+    return _state.shutdown
+
+def signal_shutdown(reason):
+    _state.shutdown = True
+
+def on_shutdown(handler):
+    pass
+
+def spin():
+    pass
+
+def myargv(argv=None):
+    argv = sys.argv if argv is None else argv
+    return [arg for arg in argv if ':=' not in arg]
+
+_logger = logging.getLogger('rospy')
+def loginfo(message, *args): _logger.info(message, *args)
+def logdebug(message, *args): _logger.debug(message, *args)
+def logwarn(message, *args): _logger.warning(message, *args)
+def logerr(message, *args): _logger.error(message, *args)
+def logfatal(message, *args): _logger.critical(message, *args)
+
+# ---------------------------------------------------------------- INSTALLATION
+ROSPY_NAMES = ['Time', 'Duration', 'Publisher', 'Subscriber', 'Service', 'ServiceProxy',
+               'ROSException', 'ServiceException', 'ROSInterruptException', 'wait_for_service',
+               'init_node', 'get_name', 'get_param', 'set_param', 'has_param', 'sleep', 'get_time',
+               'Rate', 'is_shutdown', 'signal_shutdown', 'on_shutdown', 'spin', 'myargv',
+               'loginfo', 'logdebug', 'logwarn', 'logerr', 'logfatal']
+
+def _module(name, attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+def install(clock=None, params=None):
+    """Installs the stand-ins in sys.modules (replacing any real rospy and
+    messages), resetting their state.
+
+    :param clock: the Clock to use (by default, wall-clock time)
+    :param params: dict of parameters (resolved names, e.g. '/node/param')
+    :returns: the State of the stand-ins (topics, services, parameters, clock)
+    """
+    global _state
+    _state = State()
+    if clock is not None:
+        _state.clock = clock
+    if params is not None:
+        _state.params.update(params)
+
+    rospy = _module('rospy', dict((name, globals()[name]) for name in ROSPY_NAMES))
+    rospy.names = _module('rospy.names', {'ns_join': ns_join})
+    rospy.exceptions = _module('rospy.exceptions', {'ROSException': ROSException,
+                                                    'ROSInterruptException': ROSInterruptException})
+
+    registry = MessageRegistry()
+    registry.definitions.update(STANDARD_MESSAGES)
+    registry.addMessages(PACKAGE, os.path.join(PACKAGE_DIRECTORY, 'msg'))
+
+    packages = {}
+    for fullName in registry.definitions:
+        package, name = fullName.split('/')
+        packages.setdefault(package, {})[name] = registry.messageClass(fullName)
+    for package, classes in packages.items():
+        if package == PACKAGE:
+            try:
+                parent = __import__(PACKAGE)
+            except ImportError: #not built: use the sources
+                parent = _module(PACKAGE, {'__path__': [os.path.join(PACKAGE_DIRECTORY, 'include')]})
+        else:
+            parent = _module(package, {'__path__': []})
+        parent.msg = _module(package + '.msg', classes)
+    sys.modules[PACKAGE].srv = _module(PACKAGE + '.srv', registry.addServices(PACKAGE, os.path.join(PACKAGE_DIRECTORY, 'srv')))
+
+    return _state
+
+def loadNode(name):
+    """Imports a node of the package (from nodes/<name>.py) as a module,
+    without running its main.
+    """
+    path = os.path.join(PACKAGE_DIRECTORY, 'nodes', name + '.py')
+    try:
+        import imp
+    except ImportError: #no imp module (python >= 3.12)
+        imp = None
+    if imp is not None:
+        return imp.load_source(name, path) #errors of the node's own imports propagate
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -1,37 +1,162 @@
 #!/usr/bin/env python
+'''
+Show the shapes recorded in a csv file (as written by countShapes.py), one
+stroke at a time.
 
+With --output, the shapes of any number of csv files and stroke archives (see
+exportStrokeArchive.py) are instead rendered without a display, in a pool of
+processes: to contact sheets (a grid of shapes per image) or, with
+--per_shape, to one image per shape. Shapes can be selected by session (name
+of the csv file or bag), word and letter (only known for shapes exported from
+bags).
+'''
 
-import matplotlib.pyplot as plt
-import numpy as np
 import csv
+import os
+import sys
 import time
 
-import argparse
-parser = argparse.ArgumentParser(description='Show shapes in csv file');
-parser.add_argument('input', action="store",
-                help='a string containing the name of csv file to read from');
-parser.add_argument('--no_clear', action="store_true",
-                help="don't clear the display (useful for viewing shapes in proportion to each other");
-args = parser.parse_args();
-
-if args.no_clear:
-    no_clear = True;
-else:
-    no_clear = False;
-plt.ion();
-with open(args.input, 'rb') as csvfile:
-    csvreader = csv.reader(csvfile, delimiter=',', quotechar='|')
-    for row in csvreader:
-        stroke = row[2:];
-        
-        #import pdb; pdb.set_trace()
-        stroke = map(float, stroke)
-        x_shape = stroke[0::2];
-        y_shape = stroke[1::2];
-
-        if(not no_clear):
-            plt.clf()
-        plt.plot(np.asarray(x_shape), np.asarray(y_shape), linewidth=10);
-        plt.draw()
-        time.sleep(1.0);
+import numpy as np
+
+def loadStrokeArchiveModule():
+    try:
+        from letter_learning_interaction import stroke_archive
+    except ImportError: #not built with catkin: use the sources
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'include'))
+        import stroke_archive
+    return stroke_archive
+
+def loadShapes(inputs, sessions=None, words=None, letters=None):
+    """Shapes of the csv files and stroke archives matching the filters.
+
+    :returns: a list of (label, strokes) for each shape
+    """
+    stroke_archive = loadStrokeArchiveModule()
+    shapes = []
+    for path in inputs:
+        if os.path.isdir(path): #stroke archive
+            archive = stroke_archive.StrokeArchive(path)
+            for index in archive.select(sessions, words, letters):
+                session, word, letter, _, _ = archive.metadata(index)
+                label = ' '.join(l for l in [session, word, letter] if l) + ' #%d' % index
+                shapes.append((label, [np.array(stroke) for stroke in archive.strokes(index)]))
+        else:
+            session = os.path.splitext(os.path.basename(path))[0]
+            if (sessions is not None and session not in sessions) or words is not None or letters is not None:
+                continue #csv files don't know the word nor the letter of shapes
+            for index, strokes in enumerate(stroke_archive.readStrokesCsv(path)):
+                shapes.append((session + ' #%d' % index, strokes))
+    return shapes
+
+def plotShape(axes, label, strokes, linewidth):
+    for stroke in strokes:
+        axes.plot(stroke[:, 0], stroke[:, 1], linewidth=linewidth)
+    axes.set_aspect('equal', 'datalim')
+    axes.set_title(label, fontsize=8)
+    axes.axis('off')
+
+def headlessPyplot():
+    import matplotlib
+    matplotlib.use('Agg') #no display needed
+    import matplotlib.pyplot as plt
+    return plt
+
+def renderSheet(task):
+    """Renders shapes to a grid of rows x columns in one image."""
+    plt = headlessPyplot()
+    path, shapes, columns, rows = task
+    figure, axes = plt.subplots(rows, columns, figsize=(2*columns, 2*rows), squeeze=False)
+    for i, ax in enumerate(axes.flat):
+        if i < len(shapes):
+            plotShape(ax, shapes[i][0], shapes[i][1], 2)
+        else:
+            ax.axis('off')
+    figure.tight_layout()
+    figure.savefig(path)
+    plt.close(figure)
+    return path
+
+def renderShapes(task):
+    """Renders each shape to its own image."""
+    plt = headlessPyplot()
+    paths = []
+    for path, (label, strokes) in task:
+        figure, ax = plt.subplots(figsize=(3, 3))
+        plotShape(ax, label, strokes, 4)
+        figure.savefig(path)
+        plt.close(figure)
+        paths.append(path)
+    return paths
+
+def renderBatch(args):
+    shapes = loadShapes(args.input, args.session, args.word, args.letter)
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+
+    if args.per_shape:
+        jobs = [(os.path.join(args.output, 'shape_%05d.png' % i), shape) for i, shape in enumerate(shapes)]
+        chunkSize = 50
+        tasks = [jobs[i:i + chunkSize] for i in range(0, len(jobs), chunkSize)]
+        render = renderShapes
+    else:
+        perSheet = args.columns*args.rows
+        tasks = [(os.path.join(args.output, 'sheet_%04d.png' % (i//perSheet)), shapes[i:i + perSheet], args.columns, args.rows)
+                 for i in range(0, len(shapes), perSheet)]
+        render = renderSheet
+
+    import multiprocessing
+    pool = multiprocessing.Pool(args.processes)
+    try:
+        pool.map(render, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    print('Rendered %d shapes to %d images in %s' % (len(shapes), len(shapes) if args.per_shape else len(tasks), args.output))
+
+def showInteractive(args):
+    import matplotlib.pyplot as plt
+    plt.ion();
+    with open(args.input[0], 'rb') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',', quotechar='|')
+        for row in csvreader:
+            stroke = row[2:];
+
+            stroke = map(float, stroke)
+            x_shape = stroke[0::2];
+            y_shape = stroke[1::2];
+
+            if(not args.no_clear):
+                plt.clf()
+            plt.plot(np.asarray(x_shape), np.asarray(y_shape), linewidth=10);
+            plt.draw()
+            time.sleep(1.0);
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Show shapes in csv file');
+    parser.add_argument('input', action="store", nargs='+',
+                    help='a string containing the name of csv file to read from (with --output: csv files and/or stroke archive directories)');
+    parser.add_argument('--no_clear', action="store_true",
+                    help="don't clear the display (useful for viewing shapes in proportion to each other");
+    parser.add_argument('--output', action="store", type=str, default=None,
+                    help='render the shapes to images in this directory instead of showing them');
+    parser.add_argument('--per_shape', action="store_true",
+                    help='render one image per shape instead of contact sheets');
+    parser.add_argument('--columns', action="store", type=int, default=8,
+                    help='number of shapes per row of a contact sheet');
+    parser.add_argument('--rows', action="store", type=int, default=6,
+                    help='number of rows of a contact sheet');
+    parser.add_argument('--session', action="store", nargs='+', default=None,
+                    help='only render the shapes of these sessions');
+    parser.add_argument('--word', action="store", nargs='+', default=None,
+                    help='only render the shapes drawn for these words');
+    parser.add_argument('--letter', action="store", nargs='+', default=None,
+                    help='only render the shapes of these letters');
+    parser.add_argument('--processes', action="store", type=int, default=None,
+                    help='number of processes rendering in parallel (default: one per CPU)');
+    args = parser.parse_args();
 
+    if args.output is not None:
+        renderBatch(args)
+    else:
+        showInteractive(args)
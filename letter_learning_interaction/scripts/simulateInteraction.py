@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+'''
+Headless simulation of the interaction of learning_words_nao.py: its state
+machine is run in-process, without a ROS master, tablet, display manager or
+robot (rospy and the messages are replaced by the stand-ins of
+ros_stand_ins.py), against:
+- a fake tablet, which acknowledges the trajectories it is sent (on
+  shape_finished) once they would have been drawn, and draws synthetic
+  demonstrations in the reference bounding boxes of the word
+- a scripted child, who shows the words of a session one after the other and
+  gives a number of demonstrations for each, reacting whenever the robot
+  waits for an input
+- fake NAOqi proxies, whose calls only take time (speech duration depends on
+  the number of words said)
+- optionally (--speech_cache), a speech cache of the robot's phrases, rendered
+  by the stand-in backend of speech_cache.py before the session
+- a fake display manager, serving the display manager services
+
+Time is virtual: every sleep (of the node or of the fakes) returns at once,
+the fakes' actions being scheduled on the virtual clock, so a session of
+hundreds of words runs in seconds while seeing the time it would have taken.
+The shape learners (shape_learning) are the real ones.
+
+Reports the throughput (robot writing turns per minute of interaction time),
+the latency from the child's inputs (word cards, demonstrations) to the robot
+writing and to it waiting for the next input, and the time spent in each state
+(interaction time, and wall-clock processing time).
+'''
+
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy
+
+import ros_stand_ins
+
+NODE_NAME = 'learning_words_nao'
+DEFAULT_WORDS = ['cow', 'tree', 'hello', 'nao', 'dog', 'cat', 'sun', 'house',
+                 'boat', 'fish', 'bird', 'apple', 'moon', 'star', 'car', 'book']
+
+DISPLAY_MANAGER_SERVICES = [('clear_all_shapes', 'clearAllShapes'),
+                            ('display_new_shape', 'displayNewShape'),
+                            ('possible_to_display_shape', 'isPossibleToDisplayNewShape'),
+                            ('index_of_location', 'indexOfLocation'),
+                            ('shape_at_location', 'shapeAtLocation'),
+                            ('closest_shapes_to_location', 'closestShapesToLocation'),
+                            ('display_shape_at_location', 'displayShapeAtLocation'),
+                            ('indexes_of_locations', 'indexesOfLocations'),
+                            ('shapes_at_locations', 'shapesAtLocations'),
+                            ('closest_shapes_to_locations', 'closestShapesToLocations'),
+                            ('display_shapes_at_locations', 'displayShapesAtLocations')]
+
+# ----------------------------------------------------------------------- FAKES
+class FakeProxy:
+    """Stands for a NAOqi proxy (ALProxy): calling any of its methods only
+    takes the method's latency (in seconds, or a function of the call's
+    arguments), and returns the method's canned result (None by default).
+    """
+    def __init__(self, clock, latencies, results=None):
+        self.clock = clock
+        self.latencies = latencies
+        self.results = results or {}
+        self.calls = {}
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        def call(*args):
+            self.calls[method] = self.calls.get(method, 0) + 1
+            latency = self.latencies.get(method, 0.0)
+            if callable(latency):
+                latency = latency(*args)
+            self.clock.sleep(latency)
+            return self.results.get(method)
+        return call
+
+def makeFakeNaoqi(clock, speechRate, speechLatency, motionLatency):
+    """:returns: fake ALMotion, ALRobotPosture and ALTextToSpeech proxies
+    (setAngles doesn't block, as on the robot)
+    """
+    motion = FakeProxy(clock, {'angleInterpolationWithSpeed': motionLatency, 'rest': motionLatency},
+                       {'getAngles': [0.0]*6})
+    posture = FakeProxy(clock, {'goToPosture': motionLatency})
+    textToSpeech = FakeProxy(clock, {'say': lambda toSay: speechLatency + len(toSay.split())/speechRate})
+    return motion, posture, textToSpeech
+
+class FakeDisplayManager:
+    """Serves the services of display_manager_server.py, answering each
+    request after a latency with a default response.
+    """
+    def __init__(self, clock, latency):
+        import rospy
+        from letter_learning_interaction import srv
+        self.clock = clock
+        self.latency = latency
+        self.calls = {}
+        self.services = [rospy.Service(name, getattr(srv, serviceClass), self.handler(name, getattr(srv, serviceClass)))
+                         for name, serviceClass in DISPLAY_MANAGER_SERVICES]
+
+    def handler(self, name, serviceClass):
+        def handle(request):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.clock.sleep(self.latency)
+            response = serviceClass._response_class()
+            if name == 'clear_all_shapes':
+                response.success.data = True
+            return response
+        return handle
+
+class ConnectedWatchdog:
+    """Stands for the tablet's Watchdog: the fake tablet never disconnects."""
+    def isResponsive(self):
+        return True
+
+    def stop(self):
+        pass
+
+class FakeTablet:
+    """Stands for the tablet: acknowledges each trajectory it receives (on the
+    shape finished topic) once it would have been drawn, keeps the reference
+    bounding boxes it is sent, and draws demonstrations in them.
+    """
+    def __init__(self, clock, node, latency, pointsPerLetter, noise, rng):
+        import rospy
+        from std_msgs.msg import String, Empty, Float64MultiArray
+        from nav_msgs.msg import Path
+        from letter_learning_interaction.msg import Shape as ShapeMsg
+        self.clock = clock
+        self.latency = latency
+        self.pointsPerLetter = pointsPerLetter
+        self.noise = noise
+        self.rng = rng
+        self.ShapeMsg = ShapeMsg
+
+        self.boundingBoxes = []
+        self.trajectoriesDrawn = 0
+        self.demonstrationsDrawn = 0
+
+        self.pub_shape_finished = rospy.Publisher(node.SHAPE_FINISHED_TOPIC, String, queue_size=10)
+        self.pub_user_shapes = rospy.Publisher(node.PROCESSED_USER_SHAPE_TOPIC, ShapeMsg, queue_size=10)
+        self.subscribers = [rospy.Subscriber(node.SHAPE_TOPIC, Path, self.onTrajectory),
+                            rospy.Subscriber(node.BOUNDING_BOXES_TOPIC, Float64MultiArray, self.onBoundingBox),
+                            rospy.Subscriber(node.CLEAR_SURFACE_TOPIC, Empty, self.onClear)]
+
+    def onTrajectory(self, traj):
+        #the trajectory starts at its header's stamp, its points are timed relative to it
+        drawingTime = traj.poses[-1].header.stamp.to_sec() if traj.poses else 0.0
+        delay = traj.header.stamp.to_sec() - self.clock.now() + drawingTime + self.latency
+        self.clock.schedule(delay, self.onTrajectoryDrawn)
+
+    def onTrajectoryDrawn(self):
+        from std_msgs.msg import String
+        self.trajectoriesDrawn += 1
+        self.pub_shape_finished.publish(String(data='shape_finished'))
+
+    def onBoundingBox(self, bb):
+        self.boundingBoxes.append(list(bb.data))
+
+    def onClear(self, message):
+        self.boundingBoxes = []
+
+    def drawDemonstration(self):
+        """Publishes a demonstration of the whole word, one glyph per
+        reference bounding box (left to right, within the boxes).
+
+        :returns: False if there is no bounding box to draw in
+        """
+        if not self.boundingBoxes:
+            return False
+        t = numpy.linspace(0, 1, self.pointsPerLetter)
+        x, y = [], []
+        for x_min, y_min, x_max, y_max in sorted(self.boundingBoxes):
+            margin = 0.1*(x_max - x_min)
+            x.extend(x_min + margin + (x_max - x_min - 2*margin)*t)
+            wobble = self.rng.uniform(1, 3)
+            y.extend(y_min + (y_max - y_min)*(0.5 + 0.3*numpy.sin(2*numpy.pi*wobble*t))
+                     + self.noise*(y_max - y_min)*numpy.array([self.rng.gauss(0, 1) for _ in t]))
+        #y axis of the processed user shapes points down
+        self.pub_user_shapes.publish(self.ShapeMsg(path=[float(v) for v in x] + [-float(v) for v in y]))
+        self.demonstrationsDrawn += 1
+        return True
+
+class ScriptedChild:
+    """Plays a session: whenever the robot waits for an input (i.e. turns its
+    camera on), reacts after some time by giving a demonstration of the
+    current word on the tablet, or, when all the demonstrations of the word
+    have been given, by showing the next word card, or the stop card at the
+    end of the session.
+    """
+    def __init__(self, clock, node, tablet, words, demosPerWord, reactionTime, drawingTime, rng):
+        import rospy
+        from std_msgs.msg import String, Empty, Bool
+        self.clock = clock
+        self.tablet = tablet
+        self.words = list(words)
+        self.demosPerWord = demosPerWord
+        self.reactionTime = reactionTime
+        self.drawingTime = drawingTime
+        self.rng = rng
+
+        self.wordsShown = 0
+        self.demosLeft = 0
+        self.actionPending = False
+        self.stopped = False
+        self.timedOut = False
+        self.onInput = None #called with the kind of each input given
+
+        self.pub_words = rospy.Publisher(node.WORDS_TOPIC, String, queue_size=10)
+        self.pub_stop = rospy.Publisher(node.STOP_TOPIC, Empty, queue_size=10)
+        self.subscriber = rospy.Subscriber(node.PUBLISH_STATUS_TOPIC, Bool, self.onCameraStatus)
+
+    def reactionDelay(self):
+        return self.reactionTime*self.rng.uniform(0.5, 1.5)
+
+    def onCameraStatus(self, status):
+        if not status.data or self.actionPending or self.stopped:
+            return
+        self.actionPending = True
+        if self.demosLeft > 0:
+            self.clock.schedule(self.reactionDelay() + self.drawingTime, self.demonstrate)
+        elif self.wordsShown < len(self.words):
+            self.clock.schedule(self.reactionDelay(), self.showWord)
+        else:
+            self.clock.schedule(self.reactionDelay(), self.stop)
+
+    def showWord(self):
+        from std_msgs.msg import String
+        self.actionPending = False
+        word = self.words[self.wordsShown]
+        self.wordsShown += 1
+        self.demosLeft = self.demosPerWord
+        self.onInput('word')
+        self.pub_words.publish(String(data=word))
+
+    def demonstrate(self):
+        self.actionPending = False
+        self.demosLeft -= 1
+        self.onInput('demonstration')
+        if not self.tablet.drawDemonstration():
+            self.demosLeft = 0 #nothing to draw in: move on to the next word
+
+    def stop(self, timedOut=False):
+        from std_msgs.msg import Empty
+        self.actionPending = False
+        self.stopped = True
+        self.timedOut = timedOut
+        self.pub_stop.publish(Empty())
+
+# ---------------------------------------------------------------- MEASUREMENTS
+class Recorder:
+    """Records the robot's turns: the latency from each input of the child to
+    the robot publishing its trajectory (response) and to the robot waiting
+    for the next input (turn), and the time spent in each state.
+    """
+    def __init__(self, clock, node):
+        import rospy
+        from std_msgs.msg import Bool
+        from nav_msgs.msg import Path
+        self.clock = clock
+        self.turns = 0
+        self.pendingInput = None #(kind, interaction time, wall-clock time) of the last input not yet responded to
+        self.pendingTurn = None
+        self.responses = {} #kind -> list of (interaction latency, wall-clock latency)
+        self.turnDurations = {} #kind -> list of interaction times
+        self.states = {} #state -> list of (interaction time, wall-clock time) per visit
+
+        self.subscribers = [rospy.Subscriber(node.SHAPE_TOPIC, Path, self.onTrajectory),
+                            rospy.Subscriber(node.PUBLISH_STATUS_TOPIC, Bool, self.onCameraStatus)]
+
+    def onInput(self, kind):
+        self.pendingInput = self.pendingTurn = (kind, self.clock.now(), time.time())
+
+    def onTrajectory(self, traj):
+        self.turns += 1
+        if self.pendingInput is not None:
+            kind, inputTime, inputWallTime = self.pendingInput
+            self.responses.setdefault(kind, []).append((self.clock.now() - inputTime, time.time() - inputWallTime))
+            self.pendingInput = None
+
+    def onCameraStatus(self, status):
+        if status.data and self.pendingTurn is not None:
+            kind, inputTime, _ = self.pendingTurn
+            self.turnDurations.setdefault(kind, []).append(self.clock.now() - inputTime)
+            self.pendingTurn = None
+
+    def timedHandler(self, state, handler):
+        def run(infoFromPrevState):
+            start, wallStart = self.clock.now(), time.time()
+            result = handler(infoFromPrevState)
+            self.states.setdefault(state, []).append((self.clock.now() - start, time.time() - wallStart))
+            return result
+        return run
+
+def percentiles(values):
+    values = numpy.asarray(values, dtype=float)
+    if len(values) == 0:
+        return {'count': 0}
+    return {'count': len(values), 'mean': float(values.mean()), 'p50': float(numpy.percentile(values, 50)),
+            'p95': float(numpy.percentile(values, 95)), 'max': float(values.max())}
+
+# ------------------------------------------------------------------ SIMULATION
+def startNode(clock, params, args):
+    """Loads and sets up learning_words_nao.py as its main does, with the
+    fakes in place of the display manager, the watchdog and the robot (see the
+    arguments of the parser of this script), up to its state machine running.
+
+    :param params: the node's parameters (without the ~)
+    :returns: the node (module), the info for the start state of its state
+    machine, the fake display manager, and the directory of the speech cache
+    (None if not used)
+    """
+    speechCacheDirectory = None
+    if args.speech_cache:
+        speechCacheDirectory = tempfile.mkdtemp(prefix='speech_cache')
+        params = dict(params, speech_cache_directory=speechCacheDirectory,
+                      speech_cache_index=speechCacheDirectory + '/index.json',
+                      speech_cache_rendering='startup')
+    ros_stand_ins.install(clock, dict(('/%s/%s' % (NODE_NAME, name), value) for name, value in params.items()))
+    node = ros_stand_ins.loadNode(NODE_NAME)
+    ros_stand_ins.init_node(NODE_NAME)
+    node.configure()
+
+    from letter_learning_interaction.display_manager_client import DisplayManagerClient
+    displayManager = FakeDisplayManager(clock, args.display_manager_latency)
+    node.displayManager = DisplayManagerClient()
+    node.displayManager.waitForServices()
+    node.tabletWatchdog = ConnectedWatchdog()
+    node.motionProxy, node.postureProxy, node.textToSpeech = makeFakeNaoqi(clock, args.speech_rate, args.speech_latency, args.motion_latency)
+    node.speech = node.textToSpeech
+    if args.speech_cache:
+        from letter_learning_interaction.speech_cache import LocalSpeechBackend
+        node.speech = node.createSpeechCache(LocalSpeechBackend(args.speech_rate, args.speech_latency, clock.sleep, node.LANGUAGE))
+    if node.naoWriting:
+        node.armJoints_standInit = node.motionProxy.getAngles(node.effector, True)
+
+    node.InteractionSettings.setDatasetDirectory(node.getDatasetDirectory())
+    from letter_learning_interaction.text_shaper import TextShaper, ScreenManager
+    node.wordManager = node.createWordManager()
+    node.textShaper = TextShaper()
+    node.screenManager = ScreenManager(0.2, 0.1395)
+
+    node.stateMachine, infoForStartState = node.createStateMachine()
+    node.subscribeToInteractionInputs()
+    return node, infoForStartState, displayManager, speechCacheDirectory
+
+def stopNode(node, args, speechCacheDirectory):
+    """Writes the node's trace (if args.trace), closes its input journal and
+    its pool of shape learners, once its state machine has stopped."""
+    if args.trace is not None:
+        node.tracer.dump(args.trace)
+    if node.inputJournal is not None:
+        node.inputJournal.close()
+    if node.LEARNER_WORKERS > 0:
+        node.wordManager.pool.close()
+    if speechCacheDirectory is not None:
+        shutil.rmtree(speechCacheDirectory)
+
+def simulate(args):
+    """Runs a scripted session of the interaction.
+
+    :returns: the report (a dict)
+    """
+    clock = ros_stand_ins.VirtualClock()
+    params = {'nao_writing': not args.no_writing,
+              'nao_speaking': not args.no_speaking,
+              'language': args.language,
+              'dataset_directory': args.dataset_directory,
+              'learner_workers': args.learner_workers,
+              'tracing': args.trace is not None}
+    if args.journal is not None:
+        params['input_journal'] = args.journal
+    node, infoForStartState, displayManager, speechCacheDirectory = startNode(clock, params, args)
+
+    rng = random.Random(args.seed)
+    if args.words:
+        words = [args.words[i % len(args.words)] for i in range(args.num_words)]
+    else:
+        words = [rng.choice(DEFAULT_WORDS) for i in range(args.num_words)]
+
+    recorder = Recorder(clock, node)
+    tablet = FakeTablet(clock, node, args.tablet_latency, args.points_per_letter, args.demo_noise, rng)
+    child = ScriptedChild(clock, node, tablet, words, args.demos_per_word, args.reaction_time, args.drawing_time, rng)
+    child.onInput = recorder.onInput
+
+    maxDuration = args.max_duration if args.max_duration is not None else 600.0*len(words)
+    for state, handler in list(node.stateMachine.handlers.items()):
+        if handler is None:
+            continue
+        timedHandler = recorder.timedHandler(state, handler)
+        def run(infoFromPrevState, timedHandler=timedHandler):
+            if maxDuration is not None and clock.now() > maxDuration and not child.stopped:
+                child.stop(timedOut=True) #stuck: show the stop card
+            return timedHandler(infoFromPrevState)
+        node.stateMachine.handlers[state] = run
+
+    wallStart = time.time()
+    node.stateMachine.run(infoForStartState)
+    wallDuration = time.time() - wallStart
+    duration = clock.now()
+    stopNode(node, args, speechCacheDirectory)
+
+    return {
+        'words': len(words),
+        'words_shown': child.wordsShown,
+        'demonstrations': tablet.demonstrationsDrawn,
+        'turns': recorder.turns,
+        'timed_out': child.timedOut,
+        'interaction_time': duration,
+        'wall_clock_time': wallDuration,
+        'turns_per_minute': recorder.turns/(duration/60.0) if duration > 0 else 0.0,
+        'response_latency': dict((kind, {'interaction': percentiles([l for l, _ in latencies]),
+                                         'wall_clock': percentiles([w for _, w in latencies])})
+                                 for kind, latencies in recorder.responses.items()),
+        'turn_duration': dict((kind, percentiles(durations)) for kind, durations in recorder.turnDurations.items()),
+        'states': dict((state, {'interaction_time': sum(i for i, _ in visits),
+                                'wall_clock': percentiles([w for _, w in visits])})
+                       for state, visits in recorder.states.items()),
+        'naoqi_calls': dict((name, proxy.calls) for name, proxy in [('motion', node.motionProxy),
+                                                                     ('posture', node.postureProxy),
+                                                                     ('text_to_speech', node.textToSpeech)]),
+        'display_manager_calls': displayManager.calls,
+        'trajectory_cache': {'hits': node.trajectoryCache.hits, 'misses': node.trajectoryCache.misses},
+        'speech_cache': {'hits': node.speech.hits, 'misses': node.speech.misses} if args.speech_cache else None,
+    }
+
+def printReport(report):
+    print('Simulated %d words (%d shown, %d demonstrations, %d turns)%s'
+          % (report['words'], report['words_shown'], report['demonstrations'], report['turns'],
+             ' - TIMED OUT' if report['timed_out'] else ''))
+    print('%.1f s of interaction in %.2f s of wall-clock time (x%.0f)'
+          % (report['interaction_time'], report['wall_clock_time'], report['interaction_time']/max(report['wall_clock_time'], 1e-9)))
+    print('Throughput: %.2f turns per minute' % report['turns_per_minute'])
+    print('Trajectory cache: %d words reused, %d shaped' % (report['trajectory_cache']['hits'], report['trajectory_cache']['misses']))
+    if report['speech_cache'] is not None:
+        print('Speech cache: %d phrases played, %d synthesized live' % (report['speech_cache']['hits'], report['speech_cache']['misses']))
+    printTimings(report)
+
+def printTimings(report):
+    print('\nLatency after input (interaction time, s)    count    mean     p50     p95     max')
+    for kind in sorted(report['response_latency']):
+        for name, stats in [('to trajectory', report['response_latency'][kind]['interaction']),
+                            ('to next input', report['turn_duration'].get(kind, {'count': 0}))]:
+            if stats['count']:
+                print('  %-42s %6d %7.2f %7.2f %7.2f %7.2f' % (kind + ' ' + name, stats['count'], stats['mean'], stats['p50'], stats['p95'], stats['max']))
+
+    print('\nState                                   visits  interaction s  wall ms: mean     p50     p95     max')
+    for state in sorted(report['states'], key=lambda s: -report['states'][s]['interaction_time']):
+        stats = report['states'][state]['wall_clock']
+        print('  %-38s %6d %14.1f %14.3f %7.3f %7.3f %7.3f' % (state, stats['count'], report['states'][state]['interaction_time'],
+                                                               1000*stats['mean'], 1000*stats['p50'], 1000*stats['p95'], 1000*stats['max']))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulate the interaction of learning_words_nao.py without ROS, tablet or robot')
+    parser.add_argument('--num_words', action="store", type=int, default=200,
+                    help='number of words of the session')
+    parser.add_argument('--words', action="store", nargs='+', default=None,
+                    help='words to show, in turn (default: drawn at random from a few simple words)')
+    parser.add_argument('--demos_per_word', action="store", type=int, default=2,
+                    help='number of demonstrations given for each word')
+    parser.add_argument('--dataset_directory', action="store", type=str, default='default',
+                    help='letter model dataset directory (as the dataset_directory parameter of the node)')
+    parser.add_argument('--learner_workers', action="store", type=int, default=0,
+                    help='number of shape learners built at once for a new word, in threads (as the learner_workers parameter of the node; 0: one after the other)')
+    parser.add_argument('--language', action="store", type=str, default='english',
+                    help='language of the robot')
+    parser.add_argument('--no_writing', action="store_true",
+                    help='the robot doesn\'t move its arm (as with nao_writing:=false)')
+    parser.add_argument('--no_speaking', action="store_true",
+                    help='the robot doesn\'t speak (as with nao_speaking:=false)')
+    parser.add_argument('--speech_rate', action="store", type=float, default=2.5,
+                    help='words said per second by the robot')
+    parser.add_argument('--speech_latency', action="store", type=float, default=0.3,
+                    help='seconds before the robot starts to say something')
+    parser.add_argument('--speech_cache', action="store_true",
+                    help='say the robot\'s phrases from a speech cache (without the speech latency when cached)')
+    parser.add_argument('--motion_latency', action="store", type=float, default=1.5,
+                    help='seconds taken by the robot\'s blocking motions (posture, arm down, rest)')
+    parser.add_argument('--tablet_latency', action="store", type=float, default=0.05,
+                    help='seconds between the end of a trajectory and the tablet acknowledging it')
+    parser.add_argument('--display_manager_latency', action="store", type=float, default=0.002,
+                    help='seconds taken by each display manager service call')
+    parser.add_argument('--reaction_time', action="store", type=float, default=2.0,
+                    help='mean seconds before the child reacts when the robot waits for an input')
+    parser.add_argument('--drawing_time', action="store", type=float, default=5.0,
+                    help='seconds taken by the child to draw a demonstration')
+    parser.add_argument('--points_per_letter', action="store", type=int, default=20,
+                    help='number of points per letter of the demonstrations')
+    parser.add_argument('--demo_noise', action="store", type=float, default=0.02,
+                    help='noise of the demonstrations (relative to the letters\' height)')
+    parser.add_argument('--max_duration', action="store", type=float, default=None,
+                    help='stop the session after this many seconds of interaction time (default: 10 minutes per word)')
+    parser.add_argument('--seed', action="store", type=int, default=0,
+                    help='seed of the child\'s behaviour')
+    parser.add_argument('--output', action="store", type=str, default=None,
+                    help='write the report to this JSON file')
+    parser.add_argument('--trace', action="store", type=str, default=None,
+                    help='trace the interaction (in interaction time) to this Chrome trace file')
+    parser.add_argument('--journal', action="store", type=str, default=None,
+                    help='record the inputs of the session to this journal (see replayJournal.py)')
+    parser.add_argument('--verbose', action="store_true",
+                    help='log the node\'s messages')
+    args = parser.parse_args()
+
+    import logging
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    report = simulate(args)
+    printReport(report)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    sys.exit(1 if report['timed_out'] else 0)
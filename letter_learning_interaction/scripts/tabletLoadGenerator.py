@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+'''
+Load generator for the tablet input pipeline: stands for any number of
+tablets, publishing user-drawn shapes (strokes as Path messages on
+user_drawn_shapes, each shape ended by an empty Path) and gestures (points on
+gesture_info) at configurable rates, in each tablet's namespace (as listened
+to by tablet_input_interpreter.py with its ~tablet_namespaces parameter).
+
+Shapes are synthetic (random letter-sized curves of the given number of strokes
+and points) or replayed from recordings (csv files written by countShapes.py
+or stroke archives written by exportStrokeArchive.py), each one moved by a
+small random offset so that it can be told apart from the others.
+
+Measures:
+- the latency from the end of each shape to its processed shape on
+  user_shapes_processed (matched by tablet, number of points and first point,
+  so tablet_input_interpreter.py must merge strokes, its default), and the
+  shapes never processed (dropped) before the end of the run
+- the latency from a processed shape to the interaction responding with a new
+  trajectory (the learners having been updated), from the first shape
+  processed since its previous trajectory, and the processed shapes it never
+  responded to (ignored)
+
+With --word, the word is first sent to the interaction (on words_to_write),
+and with --ack_trajectories the generator also acknowledges the trajectories
+of the interaction (on shape_finished), as the tablet would, so that it keeps
+accepting demonstrations.
+
+Only runs against a ROS master on this machine.
+'''
+
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+import numpy
+
+LOCAL_HOSTS = ['localhost', '127.0.0.1', '::1']
+DISPLAY_SIZE = (0.2, 0.1395) #as used by learning_words_nao.py's ScreenManager
+LETTER_SIZE = 0.02
+MATCH_TOLERANCE = 1e-6 #processed shapes are float32
+
+def loadStrokeArchiveModule():
+    try:
+        from letter_learning_interaction import stroke_archive
+    except ImportError: #not built with catkin: use the sources
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'include'))
+        import stroke_archive
+    return stroke_archive
+
+def isLocalMaster(masterUri):
+    try:
+        from urlparse import urlparse
+    except ImportError: #python 3
+        from urllib.parse import urlparse
+    host = urlparse(masterUri).hostname
+    return host in LOCAL_HOSTS or host == socket.gethostname() or host == socket.getfqdn()
+
+# -------------------------------------------------------------------- SHAPES
+def syntheticShape(rng, numStrokes, pointsPerStroke):
+    """:returns: the strokes (Nx2 arrays) of a random letter-sized shape"""
+    strokes = []
+    t = numpy.linspace(0, 1, pointsPerStroke)
+    for i in range(numStrokes):
+        a, b = rng.uniform(1, 3), rng.uniform(1, 3)
+        phase = rng.uniform(0, 2*numpy.pi)
+        strokes.append(numpy.column_stack([LETTER_SIZE*(i + t)/numStrokes,
+                                           LETTER_SIZE*(0.5 + 0.4*numpy.sin(2*numpy.pi*a*t + phase)*numpy.cos(numpy.pi*b*t))]))
+    return strokes
+
+def recordedShapes(inputs):
+    """:returns: the strokes of the shapes of csv files and stroke archives,
+    each moved to the origin"""
+    stroke_archive = loadStrokeArchiveModule()
+    shapes = []
+    for path in inputs:
+        if os.path.isdir(path):
+            archive = stroke_archive.StrokeArchive(path)
+            shapes.extend([numpy.array(stroke) for stroke in archive.strokes(i)] for i in range(len(archive)))
+        else:
+            shapes.extend(stroke_archive.readStrokesCsv(path))
+    moved = []
+    for strokes in shapes:
+        strokes = [stroke for stroke in strokes if len(stroke) > 0]
+        if strokes:
+            origin = numpy.concatenate(strokes).min(axis=0)
+            moved.append([numpy.asarray(stroke, dtype=float) - origin for stroke in strokes])
+    return moved
+
+# -------------------------------------------------------------------- TABLETS
+class SentShape:
+    __slots__ = ['device', 'numPoints', 'first', 'endTime', 'processedTime']
+
+    def __init__(self, device, strokes):
+        self.device = device
+        self.numPoints = sum(len(stroke) for stroke in strokes)
+        #as in the processed shape: x of the first point, and its y upside down
+        self.first = (strokes[0][0][0], -strokes[0][0][1])
+        self.endTime = None
+        self.processedTime = None
+
+class SyntheticTablet:
+    """Publishes the shapes and gestures of one tablet."""
+    def __init__(self, namespace, args, shapes, rng):
+        import rospy
+        from nav_msgs.msg import Path
+        from geometry_msgs.msg import PointStamped
+        self.device = namespace.strip('/')
+        self.args = args
+        self.shapes = shapes
+        self.rng = rng
+        self.frame = args.frame
+        self.pub_strokes = rospy.Publisher(rospy.names.ns_join(namespace, args.user_drawn_shapes_topic), Path, queue_size=args.queue_size)
+        self.pub_gestures = rospy.Publisher(rospy.names.ns_join(namespace, args.gesture_info_topic), PointStamped, queue_size=args.queue_size)
+        self.numShapes = 0
+        self.numStrokes = 0
+        self.numGestures = 0
+
+    def nextShape(self):
+        if self.shapes:
+            strokes = self.shapes[self.numShapes % len(self.shapes)]
+        else:
+            strokes = syntheticShape(self.rng, self.args.strokes_per_shape, self.args.points_per_stroke)
+        offset = numpy.array([self.rng.uniform(0, DISPLAY_SIZE[0] - LETTER_SIZE), self.rng.uniform(0, DISPLAY_SIZE[1] - LETTER_SIZE)])
+        return [stroke + offset for stroke in strokes]
+
+    def makePath(self, points):
+        import rospy
+        from nav_msgs.msg import Path
+        from geometry_msgs.msg import PoseStamped
+        path = Path()
+        path.header.frame_id = self.frame
+        path.header.stamp = rospy.Time.now()
+        for x, y in points:
+            pose = PoseStamped()
+            pose.header = path.header
+            pose.pose.position.x = x
+            pose.pose.position.y = y
+            path.poses.append(pose)
+        return path
+
+    def publishStroke(self, stroke):
+        self.pub_strokes.publish(self.makePath(stroke))
+        self.numStrokes += 1
+
+    def publishEndOfShape(self):
+        self.pub_strokes.publish(self.makePath([]))
+        self.numShapes += 1
+
+    def publishGesture(self):
+        import rospy
+        from geometry_msgs.msg import PointStamped
+        gesture = PointStamped()
+        gesture.header.frame_id = self.frame
+        gesture.header.stamp = rospy.Time.now()
+        gesture.point.x = self.rng.uniform(0, DISPLAY_SIZE[0])
+        gesture.point.y = self.rng.uniform(0, DISPLAY_SIZE[1])
+        self.pub_gestures.publish(gesture)
+        self.numGestures += 1
+
+# ---------------------------------------------------------------- MEASUREMENTS
+class PipelineMonitor:
+    """Matches processed shapes to the shapes sent, and responses of the
+    interaction to processed shapes.
+    """
+    def __init__(self, args):
+        import rospy
+        from std_msgs.msg import String
+        from nav_msgs.msg import Path
+        from letter_learning_interaction.msg import Shape as ShapeMsg
+        self.lock = threading.Lock()
+        self.outstanding = {} #device -> shapes sent but not processed yet, in order
+        self.processed = [] #matched SentShapes
+        self.unmatched = 0
+        self.pendingSince = None #processing time of the first shape not responded to yet
+        self.numPending = 0
+        self.responseLatencies = []
+        self.shapesPerResponse = []
+        self.trajectories = 0
+
+        self.ackDelay = args.ack_delay if args.ack_trajectories else None
+        self.pub_shape_finished = rospy.Publisher(args.shape_finished_topic, String, queue_size=10)
+        self.subscribers = [rospy.Subscriber(args.processed_user_shape_topic, ShapeMsg, self.onProcessedShape),
+                            rospy.Subscriber(args.trajectory_topic, Path, self.onTrajectory)]
+
+    def onShapeSent(self, shape):
+        with self.lock:
+            shape.endTime = time.time()
+            self.outstanding.setdefault(shape.device, []).append(shape)
+
+    def onProcessedShape(self, message):
+        now = time.time()
+        numPoints = len(message.path)//2
+        with self.lock:
+            outstanding = self.outstanding.get(message.device, [])
+            for i, shape in enumerate(outstanding):
+                if (shape.numPoints == numPoints and abs(shape.first[0] - message.path[0]) < MATCH_TOLERANCE
+                        and abs(shape.first[1] - message.path[numPoints]) < MATCH_TOLERANCE):
+                    shape.processedTime = now
+                    self.processed.append(shape)
+                    del outstanding[i]
+                    break
+            else:
+                self.unmatched += 1
+                return
+            if self.pendingSince is None:
+                self.pendingSince = now
+            self.numPending += 1
+
+    def onTrajectory(self, traj):
+        now = time.time()
+        with self.lock:
+            self.trajectories += 1
+            if self.pendingSince is not None:
+                self.responseLatencies.append(now - self.pendingSince)
+                self.shapesPerResponse.append(self.numPending)
+                self.pendingSince = None
+                self.numPending = 0
+        if self.ackDelay is not None:
+            #acknowledge once the trajectory would have been drawn
+            from std_msgs.msg import String
+            drawingTime = traj.poses[-1].header.stamp.to_sec() if traj.poses else 0.0
+            delay = max(traj.header.stamp.to_sec() - time.time(), 0) + drawingTime + self.ackDelay
+            timer = threading.Timer(delay, self.pub_shape_finished.publish, [String(data='shape_finished')])
+            timer.daemon = True
+            timer.start()
+
+def percentiles(values):
+    values = numpy.asarray(values, dtype=float)
+    if len(values) == 0:
+        return {'count': 0}
+    return {'count': len(values), 'mean': float(values.mean()), 'p50': float(numpy.percentile(values, 50)),
+            'p95': float(numpy.percentile(values, 95)), 'p99': float(numpy.percentile(values, 99)), 'max': float(values.max())}
+
+# --------------------------------------------------------------------- RUNNING
+def generateLoad(tablets, monitor, args, rng):
+    """Publishes the shapes and gestures of all the tablets for args.duration
+    seconds, from a schedule of timed events.
+    """
+    import heapq
+    import rospy
+    events = [] #(time, sequence, callable)
+    sequence = [0]
+    def schedule(when, action):
+        sequence[0] += 1
+        heapq.heappush(events, (when, sequence[0], action))
+
+    def startShape(tablet):
+        def run(now):
+            strokes = tablet.nextShape()
+            sent = SentShape(tablet.device, strokes)
+            for i, stroke in enumerate(strokes):
+                schedule(now + i*args.stroke_interval, lambda now, stroke=stroke: tablet.publishStroke(stroke))
+            def end(now):
+                monitor.onShapeSent(sent) #before publishing, in case it is processed straight away
+                tablet.publishEndOfShape()
+            endTime = now + len(strokes)*args.stroke_interval
+            schedule(endTime, end)
+            #a tablet draws one shape at a time
+            schedule(max(now + interval(args.shape_rate), endTime), startShape(tablet))
+        return run
+
+    def gesture(tablet):
+        def run(now):
+            tablet.publishGesture()
+            schedule(now + interval(args.gesture_rate), gesture(tablet))
+        return run
+
+    def interval(rate):
+        return rng.expovariate(rate) if args.poisson else 1.0/rate
+
+    start = time.time()
+    for tablet in tablets:
+        if args.shape_rate > 0:
+            schedule(start + rng.uniform(0, 1.0/args.shape_rate), startShape(tablet))
+        if args.gesture_rate > 0:
+            schedule(start + rng.uniform(0, 1.0/args.gesture_rate), gesture(tablet))
+
+    end = start + args.duration
+    while events and not rospy.is_shutdown():
+        when, _, action = heapq.heappop(events)
+        if when > end:
+            break
+        delay = when - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        action(when)
+    return time.time() - start
+
+def report(tablets, monitor, duration):
+    with monitor.lock:
+        devices = {}
+        for tablet in tablets:
+            latencies = [s.processedTime - s.endTime for s in monitor.processed if s.device == tablet.device]
+            devices[tablet.device or '/'] = {'shapes_sent': tablet.numShapes, 'strokes_sent': tablet.numStrokes,
+                                             'gestures_sent': tablet.numGestures,
+                                             'dropped': len(monitor.outstanding.get(tablet.device, [])),
+                                             'processing_latency': percentiles(latencies)}
+        sent = sum(tablet.numShapes for tablet in tablets)
+        return {
+            'duration': duration,
+            'shapes_sent': sent,
+            'strokes_sent': sum(tablet.numStrokes for tablet in tablets),
+            'gestures_sent': sum(tablet.numGestures for tablet in tablets),
+            'shapes_processed': len(monitor.processed),
+            'shapes_dropped': sum(len(shapes) for shapes in monitor.outstanding.values()),
+            'unmatched_processed_shapes': monitor.unmatched,
+            'processing_latency': percentiles([s.processedTime - s.endTime for s in monitor.processed]),
+            'trajectories': monitor.trajectories,
+            'learner_responses': len(monitor.responseLatencies),
+            'shapes_per_response': float(numpy.mean(monitor.shapesPerResponse)) if monitor.shapesPerResponse else 0.0,
+            'ignored_by_interaction': monitor.numPending,
+            'response_latency': percentiles(monitor.responseLatencies),
+            'tablets': devices,
+        }
+
+def printLatency(name, stats):
+    if stats['count']:
+        print('%-36s %6d %8.1f %8.1f %8.1f %8.1f %8.1f' % (name, stats['count'], 1000*stats['mean'], 1000*stats['p50'],
+                                                           1000*stats['p95'], 1000*stats['p99'], 1000*stats['max']))
+    else:
+        print('%-36s %6d' % (name, 0))
+
+def printReport(results):
+    print('%d shapes (%d strokes) and %d gestures sent in %.1f s'
+          % (results['shapes_sent'], results['strokes_sent'], results['gestures_sent'], results['duration']))
+    print('%d shapes processed, %d dropped, %d unmatched processed shapes'
+          % (results['shapes_processed'], results['shapes_dropped'], results['unmatched_processed_shapes']))
+    print('%d learner responses (%d trajectories, %.1f processed shapes per response), %d processed shapes ignored by the interaction'
+          % (results['learner_responses'], results['trajectories'], results['shapes_per_response'], results['ignored_by_interaction']))
+    print('\nLatency (ms)                          count     mean      p50      p95      p99      max')
+    printLatency('end of shape -> processed shape', results['processing_latency'])
+    printLatency('processed shape -> learner response', results['response_latency'])
+    if len(results['tablets']) > 1:
+        for device in sorted(results['tablets']):
+            tablet = results['tablets'][device]
+            printLatency('  ' + device + ' (%d dropped)' % tablet['dropped'], tablet['processing_latency'])
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate tablet input load and measure the latency of its processing');
+    parser.add_argument('--tablets', action="store", nargs='+', default=[''],
+                    help='namespaces of the tablets to stand for (as ~tablet_namespaces of tablet_input_interpreter.py)');
+    parser.add_argument('--num_tablets', action="store", type=int, default=None,
+                    help='stand for this many tablets, in namespaces tablet0, tablet1, ... (instead of --tablets)');
+    parser.add_argument('--input', action="store", nargs='+', default=None,
+                    help='csv files and/or stroke archives to replay the shapes of (default: synthetic shapes)');
+    parser.add_argument('--shape_rate', action="store", type=float, default=1.0,
+                    help='shapes per second per tablet');
+    parser.add_argument('--strokes_per_shape', action="store", type=int, default=2,
+                    help='strokes per synthetic shape');
+    parser.add_argument('--points_per_stroke', action="store", type=int, default=70,
+                    help='points per stroke of synthetic shapes');
+    parser.add_argument('--stroke_interval', action="store", type=float, default=0.0,
+                    help='seconds between the strokes of a shape (and the end of the shape)');
+    parser.add_argument('--gesture_rate', action="store", type=float, default=0.0,
+                    help='gestures per second per tablet');
+    parser.add_argument('--poisson', action="store_true",
+                    help='random (Poisson) arrivals instead of fixed intervals');
+    parser.add_argument('--duration', action="store", type=float, default=30.0,
+                    help='seconds to generate load for');
+    parser.add_argument('--timeout', action="store", type=float, default=5.0,
+                    help='seconds to wait for the last shapes to be processed');
+    parser.add_argument('--queue_size', action="store", type=int, default=10,
+                    help='queue size of the publishers');
+    parser.add_argument('--word', action="store", type=str, default=None,
+                    help='first send this word to the interaction');
+    parser.add_argument('--ack_trajectories', action="store_true",
+                    help='acknowledge the trajectories of the interaction, as the tablet would');
+    parser.add_argument('--ack_delay', action="store", type=float, default=0.1,
+                    help='seconds after the end of a trajectory to acknowledge it');
+    parser.add_argument('--seed', action="store", type=int, default=0,
+                    help='seed of the synthetic shapes and gestures');
+    parser.add_argument('--output', action="store", type=str, default=None,
+                    help='write the results to this JSON file');
+    parser.add_argument('--frame', action="store", type=str, default='writing_surface',
+                    help='frame of the messages');
+    parser.add_argument('--user_drawn_shapes_topic', action="store", type=str, default='user_drawn_shapes');
+    parser.add_argument('--gesture_info_topic', action="store", type=str, default='gesture_info');
+    parser.add_argument('--processed_user_shape_topic', action="store", type=str, default='user_shapes_processed');
+    parser.add_argument('--trajectory_topic', action="store", type=str, default='/write_traj');
+    parser.add_argument('--shape_finished_topic', action="store", type=str, default='shape_finished');
+    parser.add_argument('--words_topic', action="store", type=str, default='words_to_write');
+
+    import rospy
+    args = parser.parse_args(rospy.myargv()[1:]);
+
+    masterUri = os.environ.get('ROS_MASTER_URI', 'http://localhost:11311');
+    if not isLocalMaster(masterUri):
+        sys.exit('Refusing to generate load on a remote ROS master (' + masterUri + '): only run against a local roscore');
+
+    rospy.init_node('tablet_load_generator', anonymous=True);
+    from std_msgs.msg import String
+
+    rng = random.Random(args.seed);
+    shapes = recordedShapes(args.input) if args.input else None;
+    if args.input and not shapes:
+        sys.exit('No shapes in ' + ', '.join(args.input));
+    namespaces = ['tablet%d' % i for i in range(args.num_tablets)] if args.num_tablets else args.tablets;
+    tablets = [SyntheticTablet(namespace, args, shapes, random.Random(rng.random())) for namespace in namespaces];
+    monitor = PipelineMonitor(args);
+    rospy.sleep(1.0); #let the subscribers connect
+
+    if args.word is not None:
+        rospy.Publisher(args.words_topic, String, queue_size=1, latch=True).publish(String(data=args.word));
+        rospy.sleep(1.0);
+
+    duration = generateLoad(tablets, monitor, args, rng);
+    deadline = time.time() + args.timeout;
+    while time.time() < deadline and any(monitor.outstanding.values()) and not rospy.is_shutdown():
+        time.sleep(0.05);
+
+    results = report(tablets, monitor, duration);
+    printReport(results);
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True);